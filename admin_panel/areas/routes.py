@@ -17,6 +17,7 @@ from admin_panel.areas import bp
 from admin_panel.areas.forms import AreaForm, GroupForm
 from admin_panel.areas.models import AdminArea, AdminGroup
 from admin_panel.employees.models import Employee
+from dbretry import retry_on_busy
 from models import Role as UserRole, SessionLocal
 
 
@@ -42,6 +43,7 @@ def list_areas():
 
 
 @bp.route("/create", methods=["POST"])
+@retry_on_busy
 def create_area():
     form = AreaForm()
     if not form.validate_on_submit():
@@ -68,6 +70,7 @@ def create_area():
 
 
 @bp.route("/<int:area_id>/edit", methods=["GET", "POST"])
+@retry_on_busy
 def edit_area(area_id: int):
     db = SessionLocal()
     try:
@@ -98,6 +101,7 @@ def edit_area(area_id: int):
 
 
 @bp.route("/<int:area_id>/delete", methods=["POST"])
+@retry_on_busy
 def delete_area(area_id: int):
     db = SessionLocal()
     try:
@@ -154,6 +158,7 @@ def _build_group_form(db, group=None, area_hint=None):
 
 
 @bp.route("/groups/create", methods=["GET", "POST"])
+@retry_on_busy
 def create_group():
     db = SessionLocal()
     try:
@@ -186,6 +191,7 @@ def create_group():
 
 
 @bp.route("/groups/<int:group_id>/edit", methods=["GET", "POST"])
+@retry_on_busy
 def edit_group(group_id: int):
     db = SessionLocal()
     try:
@@ -225,6 +231,7 @@ def edit_group(group_id: int):
 
 
 @bp.route("/groups/<int:group_id>/delete", methods=["POST"])
+@retry_on_busy
 def delete_group(group_id: int):
     db = SessionLocal()
     try:
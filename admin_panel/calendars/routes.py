@@ -18,6 +18,7 @@ from sqlalchemy.exc import IntegrityError
 from admin_panel.calendars import bp
 from admin_panel.calendars.forms import CalendarForm, HolidayForm
 from admin_panel.calendars.models import WorkCalendar, WorkCalendarHoliday
+from dbretry import retry_on_busy
 from models import Role as UserRole, SessionLocal
 
 
@@ -107,6 +108,7 @@ def list_calendars():
 
 
 @bp.route("/create", methods=["GET", "POST"])
+@retry_on_busy
 @login_required
 def create_calendar():
     form = CalendarForm()
@@ -150,6 +152,7 @@ def create_calendar():
 
 
 @bp.route("/<int:calendar_id>/edit", methods=["GET", "POST"])
+@retry_on_busy
 @login_required
 def edit_calendar(calendar_id: int):
     db = SessionLocal()
@@ -211,6 +214,7 @@ def edit_calendar(calendar_id: int):
 
 
 @bp.route("/<int:calendar_id>/holidays", methods=["POST"])
+@retry_on_busy
 @login_required
 def add_holiday(calendar_id: int):
     db = SessionLocal()
@@ -266,6 +270,7 @@ def add_holiday(calendar_id: int):
 
 
 @bp.route("/<int:calendar_id>/holidays/<int:holiday_id>/delete", methods=["POST"])
+@retry_on_busy
 @login_required
 def delete_holiday(calendar_id: int, holiday_id: int):
     db = SessionLocal()
@@ -286,6 +291,7 @@ def delete_holiday(calendar_id: int, holiday_id: int):
 
 
 @bp.route("/<int:calendar_id>/delete", methods=["POST"])
+@retry_on_busy
 @login_required
 def delete_calendar(calendar_id: int):
     db = SessionLocal()
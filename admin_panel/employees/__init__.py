@@ -7,6 +7,7 @@ bp = Blueprint(
     __name__,
     url_prefix="/admin-panel/employees",
     template_folder="templates",
+    cli_group="employees",
 )
 
 from . import routes  # noqa: E402,F401
@@ -1,6 +1,7 @@
 """Forms for the employees admin module."""
 
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileAllowed, FileField, FileRequired
 from wtforms import BooleanField, SelectField, StringField
 from wtforms.fields import EmailField
 from wtforms.validators import DataRequired, Length, Optional, ValidationError
@@ -52,6 +53,18 @@ class EmployeeForm(FlaskForm):
 
 
 class EmployeeFilterForm(FlaskForm):
+    q = StringField("Buscar", validators=[Optional(), Length(max=120)])
     role_id = SelectField("Rol", coerce=int, validators=[Optional()])
     area_id = SelectField("Area", coerce=int, validators=[Optional()])
     group_id = SelectField("Grupo", coerce=int, validators=[Optional()])
+
+
+class EmployeeImportForm(FlaskForm):
+    file = FileField(
+        "Fichero CSV",
+        validators=[
+            FileRequired(message="Selecciona un fichero CSV."),
+            FileAllowed(["csv"], message="Solo se admiten ficheros .csv."),
+        ],
+    )
+    dry_run = BooleanField("Solo validar (no guardar)")
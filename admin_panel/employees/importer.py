@@ -0,0 +1,343 @@
+"""Streaming CSV import of employees.
+
+The file is read row by row and processed in chunks: every chunk is
+validated against maps preloaded once (existing emails, roles, areas and
+groups by name), initial passwords are hashed in a thread pool while the
+next chunk is validated, and valid rows are written with executemany
+batches. Core users are created through :func:`sync_employees`, so the
+import leaves both directories consistent. Errors are reported per CSV
+line and never abort the rest of the file; a chunk that hits a unique
+conflict at write time (an email created by someone else mid-import) is
+retried row by row so only the conflicting lines are rejected. A core user
+created meanwhile with the same email is linked to the employee but never
+gets the CSV password.
+
+Rows whose role maps to a privileged core role (admin, rrhh) are rejected
+unless the caller passes ``allow_privileged``: with a password column they
+would otherwise hand the uploader a working admin login.
+"""
+
+import csv
+import os
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from admin_panel.areas.models import AdminArea, AdminGroup
+from admin_panel.employees.models import Employee
+from admin_panel.employees.sync import PRIVILEGED_ROLES, map_role_name, sync_employees
+from admin_panel.roles.models import Role
+from models import User
+from passwords import hash_password
+
+CHUNK_SIZE = 500
+
+REQUIRED_COLUMNS = ("name", "email", "role")
+OPTIONAL_COLUMNS = ("area", "group", "password", "active")
+
+_TRUE_VALUES = {"1", "true", "si", "sí", "yes", "y", "activo"}
+_FALSE_VALUES = {"0", "false", "no", "n", "inactivo"}
+
+
+@dataclass(frozen=True)
+class RowError:
+    line: int
+    email: str
+    message: str
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    valid: int = 0
+    created: int = 0
+    passwords_set: int = 0
+    errors: List[RowError] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def summary(self) -> str:
+        return (
+            f"{self.rows} filas leidas, {self.created} empleados creados, "
+            f"{self.passwords_set} contrasenas asignadas, {len(self.errors)} filas con errores"
+        )
+
+
+def _normalize(value: Optional[str]) -> str:
+    return " ".join((value or "").strip().lower().split())
+
+
+def _valid_email(value: str) -> bool:
+    # Same rules as the employee form validator.
+    if not value or " " in value or value.count("@") != 1:
+        return False
+    local_part, domain_part = value.split("@", 1)
+    return bool(
+        local_part
+        and "." in domain_part
+        and ".." not in domain_part
+        and not domain_part.startswith(".")
+        and not domain_part.endswith(".")
+    )
+
+
+class _Lookups:
+    """Reference data loaded once per import."""
+
+    def __init__(self, db: Session):
+        self.emails: Set[str] = set(
+            db.execute(select(func.lower(Employee.email))).scalars()
+        ) | set(db.execute(select(func.lower(User.email))).scalars())
+        self.roles: Dict[str, int] = {}
+        self.privileged_roles: Set[int] = set()
+        for rid, name in db.execute(select(Role.id, Role.name)):
+            self.roles[_normalize(name)] = rid
+            if map_role_name(name) in PRIVILEGED_ROLES:
+                self.privileged_roles.add(rid)
+        self.areas: Dict[str, int] = {
+            _normalize(name): aid for aid, name in db.execute(select(AdminArea.id, AdminArea.name))
+        }
+        self.groups: Dict[Tuple[int, str], int] = {}
+        # Group name -> (group id, area id), or None when the name is ambiguous.
+        self.groups_by_name: Dict[str, Optional[Tuple[int, int]]] = {}
+        for gid, name, area_id in db.execute(
+            select(AdminGroup.id, AdminGroup.name, AdminGroup.area_id)
+        ):
+            key = _normalize(name)
+            self.groups[(area_id, key)] = gid
+            self.groups_by_name[key] = None if key in self.groups_by_name else (gid, area_id)
+
+
+def _validate_row(
+    line: int, row: Dict[str, Optional[str]], lookups: _Lookups, allow_privileged: bool = False
+):
+    """Return ``(values, password, None)`` for a valid row or ``(None, None, error)``."""
+    email = (row.get("email") or "").strip().lower()
+    name = (row.get("name") or "").strip()
+
+    def _error(message: str):
+        return None, None, RowError(line, email, message)
+
+    if not name:
+        return _error("El nombre es obligatorio.")
+    if len(name) > 120:
+        return _error("El nombre supera 120 caracteres.")
+    if not _valid_email(email) or len(email) > 255:
+        return _error("Email no valido.")
+    if email in lookups.emails:
+        return _error("Ya existe un empleado o usuario con este email.")
+
+    role_id = lookups.roles.get(_normalize(row.get("role")))
+    if role_id is None:
+        return _error(f"Rol desconocido: {(row.get('role') or '').strip() or '-'}.")
+    if role_id in lookups.privileged_roles and not allow_privileged:
+        return _error("Solo un administrador puede importar empleados con rol admin o rrhh.")
+
+    area_id = None
+    area_name = _normalize(row.get("area"))
+    if area_name:
+        area_id = lookups.areas.get(area_name)
+        if area_id is None:
+            return _error(f"Area desconocida: {row['area'].strip()}.")
+
+    group_id = None
+    group_name = _normalize(row.get("group"))
+    if group_name:
+        if area_id is not None:
+            group_id = lookups.groups.get((area_id, group_name))
+            if group_id is None:
+                return _error("El grupo no existe en el area indicada.")
+        else:
+            if group_name not in lookups.groups_by_name:
+                return _error(f"Grupo desconocido: {row['group'].strip()}.")
+            match = lookups.groups_by_name[group_name]
+            if match is None:
+                return _error("Nombre de grupo ambiguo: indica tambien el area.")
+            group_id, area_id = match
+
+    active_raw = _normalize(row.get("active"))
+    if not active_raw or active_raw in _TRUE_VALUES:
+        is_active = True
+    elif active_raw in _FALSE_VALUES:
+        is_active = False
+    else:
+        return _error("Valor de 'active' no valido.")
+
+    password = (row.get("password") or "").strip() or None
+    values = {
+        "name": name,
+        "email": email,
+        "role_id": role_id,
+        "area_id": area_id,
+        "group_id": group_id,
+        "is_active": is_active,
+    }
+    return values, password, None
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _write_rows(
+    db: Session,
+    values: List[dict],
+    hashes: List[Tuple[str, "Future[str]"]],
+    allow_privileged: bool,
+) -> List[str]:
+    """Write the rows and commit; return the emails whose password was not set.
+
+    Passwords only go to core users this import created: a user with the same
+    email created meanwhile in the core app is linked but keeps its password.
+    """
+    db.execute(insert(Employee), values)
+    sync = sync_employees(db, [v["email"] for v in values], allow_privileged=allow_privileged)
+    created = set(sync.created)
+    skipped = [email for email, _ in hashes if email not in created]
+    hashes = [(email, fut) for email, fut in hashes if email in created]
+    if hashes:
+        ids = dict(
+            db.execute(
+                select(User.email, User.id).where(User.email.in_([email for email, _ in hashes]))
+            ).all()
+        )
+        db.execute(
+            update(User),
+            [{"id": ids[email], "password_hash": fut.result()} for email, fut in hashes],
+        )
+    db.commit()
+    return skipped
+
+
+def _report_skipped(report: ImportReport, lines: Dict[str, int], skipped: List[str]) -> None:
+    for email in skipped:
+        report.errors.append(
+            RowError(
+                lines[email],
+                email,
+                "Empleado creado, pero ya existia un usuario con este email: "
+                "se conserva su contrasena.",
+            )
+        )
+
+
+def _write_chunk(
+    db: Session,
+    lines: List[int],
+    values: List[dict],
+    hashes: List[Tuple[str, "Future[str]"]],
+    report: ImportReport,
+    allow_privileged: bool,
+) -> None:
+    line_of = {row["email"]: line for line, row in zip(lines, values)}
+    try:
+        skipped = _write_rows(db, values, hashes, allow_privileged)
+    except IntegrityError:
+        db.rollback()
+    else:
+        report.created += len(values)
+        report.passwords_set += len(hashes) - len(skipped)
+        _report_skipped(report, line_of, skipped)
+        return
+    # Something changed since the lookups were loaded: find the offending rows.
+    by_email = dict(hashes)
+    for line, row in zip(lines, values):
+        row_hashes = [(row["email"], by_email[row["email"]])] if row["email"] in by_email else []
+        try:
+            skipped = _write_rows(db, [row], row_hashes, allow_privileged)
+        except IntegrityError:
+            db.rollback()
+            report.errors.append(
+                RowError(line, row["email"], "Ya existe un empleado o usuario con este email.")
+            )
+            continue
+        report.created += 1
+        report.passwords_set += len(row_hashes) - len(skipped)
+        _report_skipped(report, line_of, skipped)
+
+
+def import_employees(
+    db: Session,
+    stream: TextIO,
+    *,
+    chunk_size: int = CHUNK_SIZE,
+    hash_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    dry_run: bool = False,
+    allow_privileged: bool = False,
+) -> ImportReport:
+    """Import employees from a CSV text stream; commits once per chunk.
+
+    The header must contain ``name``, ``email`` and ``role``; ``area``,
+    ``group``, ``password`` and ``active`` are optional. Rows without a
+    password get a core user that cannot log in until a password is set.
+    With ``dry_run`` the file is only validated. Roles mapped to admin or
+    rrhh are only accepted with ``allow_privileged`` (admin callers).
+    """
+    report = ImportReport()
+    reader = csv.DictReader(stream)
+    header = {(h or "").strip().lower() for h in reader.fieldnames or ()}
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        report.errors.append(RowError(1, "", f"Faltan columnas: {', '.join(missing)}."))
+        return report
+    reader.fieldnames = [(h or "").strip().lower() for h in reader.fieldnames]
+
+    lookups = _Lookups(db)
+    own_executor = executor is None and not dry_run
+    if own_executor:
+        executor = ThreadPoolExecutor(
+            max_workers=hash_workers or min(4, os.cpu_count() or 1),
+            thread_name_prefix="employee-import",
+        )
+    pending = None
+    try:
+        for chunk in _chunks(enumerate(reader, start=2), chunk_size):
+            lines: List[int] = []
+            values: List[dict] = []
+            hashes: List[Tuple[str, Future]] = []
+            for line, row in chunk:
+                report.rows += 1
+                row_values, password, error = _validate_row(line, row, lookups, allow_privileged)
+                if error is not None:
+                    report.errors.append(error)
+                    continue
+                lookups.emails.add(row_values["email"])
+                lines.append(line)
+                values.append(row_values)
+                report.valid += 1
+                if password and not dry_run:
+                    # hashlib releases the GIL, so the pool hashes in parallel.
+                    hashes.append(
+                        (row_values["email"], executor.submit(hash_password, password))
+                    )
+            if dry_run:
+                continue
+            # Write the previous chunk while this one's passwords are hashed.
+            if pending is not None:
+                _write_chunk(db, *pending, report, allow_privileged)
+            pending = (lines, values, hashes) if values else None
+        if pending is not None:
+            _write_chunk(db, *pending, report, allow_privileged)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+    return report
+
+
+__all__ = ["CHUNK_SIZE", "ImportReport", "RowError", "import_employees"]
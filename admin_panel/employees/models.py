@@ -2,7 +2,7 @@
 
 from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from models import Base
@@ -10,7 +10,10 @@ from models import Base
 
 class Employee(Base):
     __tablename__ = "admin_employees"
-    __table_args__ = (UniqueConstraint("email", name="uq_admin_employees_email"),)
+    __table_args__ = (
+        UniqueConstraint("email", name="uq_admin_employees_email"),
+        Index("ix_admin_employees_name", "name"),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String(120), nullable=False)
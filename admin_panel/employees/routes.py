@@ -1,8 +1,11 @@
 """Routes for the employees admin module."""
 
+import csv
+import io
 import json
 from typing import Dict, List, Optional
 
+import click
 from flask import (
     abort,
     current_app,
@@ -13,14 +16,20 @@ from flask import (
     url_for,
 )
 from flask_login import current_user
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, joinedload
 
 from admin_panel.employees import bp
-from admin_panel.employees.forms import EmployeeFilterForm, EmployeeForm
+from admin_panel.employees.forms import EmployeeFilterForm, EmployeeForm, EmployeeImportForm
+from admin_panel.employees.importer import import_employees
 from admin_panel.employees.models import Employee
+from admin_panel.employees.search import search_clause
+from admin_panel.employees.sync import resolve_role, sync_employees
 from admin_panel.roles.models import Role
 from admin_panel.areas.models import AdminArea, AdminGroup
+from dbretry import retry_on_busy
+from hierarchy import is_subordinate, set_supervisor
 from models import Role as UserRole, SessionLocal, User
 
 
@@ -57,8 +66,24 @@ def _can_manage_responsibles() -> bool:
     return current_user.role in (UserRole.admin, UserRole.rrhh)
 
 
+def _can_grant_privileged_roles() -> bool:
+    """Only admins may give or take away admin/rrhh through the employee sync."""
+    return current_user.role == UserRole.admin
+
+
+def _sync(db, emails=None):
+    report = sync_employees(db, emails, allow_privileged=_can_grant_privileged_roles())
+    if report.roles_blocked:
+        flash(
+            "El rol privilegiado (admin/rrhh) no se ha aplicado a "
+            f"{', '.join(report.roles_blocked)}: solo un administrador puede cambiarlo.",
+            "error",
+        )
+    return report
+
+
 def _validate_responsible_assignment(
-    target_user: Optional[User], responsible_user: Optional[User]
+    target_user: Optional[User], responsible_user: Optional[User], db=None
 ) -> Optional[str]:
     if not target_user:
         if responsible_user is not None:
@@ -94,6 +119,9 @@ def _validate_responsible_assignment(
         ):
             return "El responsable debe pertenecer al mismo área que el empleado."
 
+    if db is not None and target_user.id and is_subordinate(db, target_user.id, responsible_user.id):
+        return "El responsable seleccionado depende de este usuario en la jerarquía."
+
     return None
 
 
@@ -152,6 +180,26 @@ def _set_filter_choices(form: EmployeeFilterForm, roles, areas, groups):
     form.group_id.choices = [(0, "Todos los grupos")] + [(g.id, g.name) for g in groups]
 
 
+EMPLOYEES_PER_PAGE = 50
+MAX_EMPLOYEES_PER_PAGE = 200
+
+# Allowed ?sort= keys for the directory; anything else falls back to name.
+_SORT_COLUMNS = {
+    "name": Employee.name,
+    "email": Employee.email,
+    "created": Employee.created_at,
+    "status": Employee.is_active,
+}
+
+
+def _int_arg(name: str, default: int, minimum: int, maximum: int) -> int:
+    try:
+        value = int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(minimum, min(value, maximum))
+
+
 @bp.route("/", methods=["GET"])
 def list_employees():
     db = SessionLocal()
@@ -161,30 +209,71 @@ def list_employees():
         filter_form.process(request.args)
         _set_filter_choices(filter_form, roles, areas, groups)
 
-        query = select(Employee).order_by(Employee.name.asc())
+        conditions = []
         if filter_form.role_id.data:
-            query = query.where(Employee.role_id == filter_form.role_id.data)
+            conditions.append(Employee.role_id == filter_form.role_id.data)
         if filter_form.area_id.data:
-            query = query.where(Employee.area_id == filter_form.area_id.data)
+            conditions.append(Employee.area_id == filter_form.area_id.data)
         if filter_form.group_id.data:
-            query = query.where(Employee.group_id == filter_form.group_id.data)
-
-        employees = db.execute(query).scalars().all()
-
-        responsible_map: Dict[int, Optional[str]] = {}
-        if employees:
-            emails = [e.email for e in employees if e.email]
-            if emails:
-                users = (
-                    db.execute(select(User).where(User.email.in_(emails))).scalars().all()
-                )
-                users_by_email = {u.email: u for u in users}
-                for employee in employees:
-                    user = users_by_email.get(employee.email)
-                    if user and user.responsible:
-                        responsible_map[employee.id] = user.responsible.name
-                    else:
-                        responsible_map[employee.id] = None
+            conditions.append(Employee.group_id == filter_form.group_id.data)
+        search = (filter_form.q.data or "").strip()[:120]
+        if search:
+            clause = search_clause(db.get_bind(), search)
+            if clause is not None:
+                conditions.append(clause)
+
+        sort_key = request.args.get("sort", "name")
+        if sort_key not in _SORT_COLUMNS:
+            sort_key = "name"
+        sort_dir = "desc" if request.args.get("dir") == "desc" else "asc"
+        sort_column = _SORT_COLUMNS[sort_key]
+        order = sort_column.desc() if sort_dir == "desc" else sort_column.asc()
+
+        per_page = _int_arg("per_page", EMPLOYEES_PER_PAGE, 1, MAX_EMPLOYEES_PER_PAGE)
+        total = db.execute(
+            select(func.count()).select_from(Employee).where(*conditions)
+        ).scalar_one()
+        pages = max(1, (total + per_page - 1) // per_page)
+        page = _int_arg("page", 1, 1, pages)
+
+        # One query per page: employee, its reference rows and the responsible
+        # name resolved through the core user matched by email.
+        core_user = aliased(User)
+        responsible = aliased(User)
+        rows = db.execute(
+            select(Employee, responsible.name)
+            .options(
+                joinedload(Employee.role),
+                joinedload(Employee.area),
+                joinedload(Employee.group),
+            )
+            .outerjoin(core_user, core_user.email == Employee.email)
+            .outerjoin(responsible, responsible.id == core_user.supervisor_id)
+            .where(*conditions)
+            .order_by(order, Employee.id.asc())
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        ).all()
+        employees = [employee for employee, _ in rows]
+        responsible_map: Dict[int, Optional[str]] = {
+            employee.id: responsible_name for employee, responsible_name in rows
+        }
+
+        # Base query args so sort/pagination links keep the active filters.
+        base_args = {
+            key: value
+            for key, value in request.args.items()
+            if key not in ("page", "sort", "dir") and value not in ("", "0")
+        }
+        pagination = {
+            "page": page,
+            "pages": pages,
+            "per_page": per_page,
+            "total": total,
+            "sort": sort_key,
+            "dir": sort_dir,
+            "base_args": base_args,
+        }
 
         grouped = _group_options_by_area(groups)
         return render_template(
@@ -197,12 +286,14 @@ def list_employees():
             group_map_json=json.dumps(grouped, ensure_ascii=False),
             responsible_map=responsible_map,
             can_manage_responsibles=_can_manage_responsibles(),
+            pagination=pagination,
         )
     finally:
         db.close()
 
 
 @bp.route("/create", methods=["GET", "POST"])
+@retry_on_busy
 def create_employee():
     db = SessionLocal()
     try:
@@ -268,7 +359,19 @@ def create_employee():
                         db.execute(select(User).where(User.email == email)).scalar_one_or_none()
                     )
                     if can_assign_responsible:
-                        error = _validate_responsible_assignment(target_user, responsible_user)
+                        # The sync below creates the core user; validate the
+                        # assignment against the role it will receive.
+                        candidate = target_user
+                        if candidate is None and responsible_user is not None:
+                            candidate = User(
+                                email=email,
+                                role=resolve_role(
+                                    role.name,
+                                    None,
+                                    allow_privileged=_can_grant_privileged_roles(),
+                                )[0],
+                            )
+                        error = _validate_responsible_assignment(candidate, responsible_user, db)
                         if error:
                             form.responsible_id.errors.append(error)
                     if not form.errors:
@@ -281,9 +384,14 @@ def create_employee():
                             is_active=form.is_active.data,
                         )
                         db.add(employee)
+                        _sync(db, [email])
+                        if can_assign_responsible:
+                            target_user = db.execute(
+                                select(User).where(User.email == email)
+                            ).scalar_one_or_none()
                         if can_assign_responsible and target_user:
-                            target_user.responsible_id = (
-                                responsible_user.id if responsible_user else None
+                            set_supervisor(
+                                db, target_user, responsible_user.id if responsible_user else None
                             )
                         db.commit()
                         flash("Empleado creado correctamente.", "ok")
@@ -305,6 +413,7 @@ def create_employee():
 
 
 @bp.route("/<int:employee_id>/edit", methods=["GET", "POST"])
+@retry_on_busy
 def edit_employee(employee_id: int):
     db = SessionLocal()
     try:
@@ -382,11 +491,17 @@ def edit_employee(employee_id: int):
                 target_user = (
                     db.execute(select(User).where(User.email == email)).scalar_one_or_none()
                 )
+                renamed_user = None
+                if target_user is None and existing_user and existing_user.email != email:
+                    # Email changed: the linked core user follows the employee.
+                    target_user = renamed_user = existing_user
                 if can_assign_responsible:
-                    error = _validate_responsible_assignment(target_user, responsible_user)
+                    error = _validate_responsible_assignment(target_user, responsible_user, db)
                     if error:
                         form.responsible_id.errors.append(error)
                 if not form.errors:
+                    if renamed_user is not None:
+                        renamed_user.email = email
                     employee.name = form.name.data.strip()
                     employee.email = email
                     employee.role_id = role.id
@@ -394,10 +509,11 @@ def edit_employee(employee_id: int):
                     employee.group_id = group_id
                     employee.is_active = form.is_active.data
                     if can_assign_responsible and target_user:
-                        target_user.responsible_id = (
-                            responsible_user.id if responsible_user else None
+                        set_supervisor(
+                            db, target_user, responsible_user.id if responsible_user else None
                         )
                     try:
+                        _sync(db, [email])
                         db.commit()
                         flash("Empleado actualizado correctamente.", "ok")
                         return redirect(url_for("admin_employees.list_employees"))
@@ -422,6 +538,7 @@ def edit_employee(employee_id: int):
 
 
 @bp.route("/<int:employee_id>/toggle", methods=["POST"])
+@retry_on_busy
 def toggle_employee_status(employee_id: int):
     db = SessionLocal()
     try:
@@ -430,6 +547,7 @@ def toggle_employee_status(employee_id: int):
             flash("Empleado no encontrado.", "error")
         else:
             employee.is_active = not employee.is_active
+            _sync(db, [employee.email])
             db.commit()
             flash(
                 "Empleado activado." if employee.is_active else "Empleado desactivado.",
@@ -442,3 +560,87 @@ def toggle_employee_status(employee_id: int):
 
 
 
+
+
+@bp.route("/sync", methods=["POST"])
+@retry_on_busy
+def sync_all_employees():
+    db = SessionLocal()
+    try:
+        report = _sync(db)
+        db.commit()
+        flash(f"Sincronizacion completada: {report.summary()}.", "ok")
+        return redirect(url_for("admin_employees.list_employees"))
+    except IntegrityError:
+        db.rollback()
+        flash("No se pudo sincronizar: conflicto de datos, vuelve a intentarlo.", "error")
+        return redirect(url_for("admin_employees.list_employees"))
+    finally:
+        db.close()
+
+
+@bp.cli.command("sync")
+def sync_employees_command():
+    """Reconcile every admin employee into the core users table."""
+    db = SessionLocal()
+    try:
+        # Run from the server shell: trusted like an admin
+        report = sync_employees(db, allow_privileged=True)
+        db.commit()
+        print(f"✓ {report.summary()}")
+        for email in report.created:
+            print(f"  + {email}")
+        for email in report.updated:
+            print(f"  ~ {email}")
+    finally:
+        db.close()
+
+
+@bp.route("/import", methods=["GET", "POST"])
+@retry_on_busy
+def import_employees_view():
+    form = EmployeeImportForm()
+    report = None
+    if form.validate_on_submit():
+        upload = form.file.data.stream
+        # A busy retry runs the view again: read the upload from the start
+        upload.seek(0)
+        stream = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        db = SessionLocal()
+        try:
+            report = import_employees(
+                db,
+                stream,
+                dry_run=form.dry_run.data,
+                allow_privileged=_can_grant_privileged_roles(),
+            )
+        except (UnicodeDecodeError, csv.Error):
+            form.file.errors.append("No se pudo leer el fichero: debe ser un CSV en UTF-8.")
+        finally:
+            stream.detach()  # closing the wrapper would close the upload
+            db.close()
+        if report is not None:
+            flash(
+                f"Importacion {'validada' if form.dry_run.data else 'completada'}: {report.summary()}.",
+                "ok" if report.ok else "error",
+            )
+    return render_template("employees/import.html", form=form, report=report)
+
+
+@bp.cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--dry-run", is_flag=True, help="Only validate the file.")
+@click.option("--workers", type=int, default=None, help="Password hashing threads.")
+def import_employees_command(path: str, dry_run: bool, workers: Optional[int]):
+    """Import employees from a CSV file (name,email,role[,area,group,password,active])."""
+    db = SessionLocal()
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as fh:
+            report = import_employees(
+                db, fh, dry_run=dry_run, hash_workers=workers, allow_privileged=True
+            )
+    finally:
+        db.close()
+    print(f"{'✓' if report.ok else '✗'} {report.summary()}")
+    for error in report.errors:
+        print(f"  linea {error.line} {error.email or '-'}: {error.message}")
@@ -0,0 +1,79 @@
+"""Name/email search index for the employees directory.
+
+SQLite uses an external-content FTS5 table kept in sync with triggers.
+PostgreSQL uses ``pg_trgm`` GIN indexes so ``ILIKE '%term%'`` is indexed.
+Other backends fall back to a plain ``LIKE`` scan.
+
+The index itself is created by migration 0003 (build scratch databases
+with ``dbmigrate.upgrade_database``); :func:`search_clause` only checks
+(read-only, once per engine) whether the FTS table is there and falls back
+to ``LIKE`` when it is not.
+"""
+
+import re
+import weakref
+from typing import Optional
+
+from sqlalchemy import func, literal_column, or_, select, table
+from sqlalchemy.engine import Engine
+
+from admin_panel.employees.models import Employee
+
+FTS_TABLE = "admin_employees_fts"
+
+_fts_ready: "weakref.WeakKeyDictionary[Engine, bool]" = weakref.WeakKeyDictionary()
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _has_fts_table(bind: Engine) -> bool:
+    """Whether migration 0003 created the FTS table; cached per engine."""
+    ready = _fts_ready.get(bind)
+    if ready is None:
+        try:
+            with bind.connect() as con:
+                ready = con.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,)
+                ).first() is not None
+        except Exception:
+            ready = False
+        _fts_ready[bind] = ready
+    return ready
+
+
+def _like_escape(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_match_expression(term: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every token as a quoted prefix."""
+    tokens = _TOKEN_RE.findall(term)
+    if not tokens:
+        return None
+    return " ".join(f'"{tok}"*' for tok in tokens[:8])
+
+
+def search_clause(bind: Engine, term: str):
+    """Return a WHERE clause matching employees by name or email."""
+    term = (term or "").strip()
+    if not term:
+        return None
+    if bind.dialect.name == "sqlite" and _has_fts_table(bind):
+        match = _fts_match_expression(term)
+        if match is None:
+            return None
+        fts = table(FTS_TABLE)
+        rowids = (
+            select(literal_column("rowid"))
+            .select_from(fts)
+            .where(literal_column(FTS_TABLE).op("MATCH")(match))
+        )
+        return Employee.id.in_(rowids)
+    # On PostgreSQL the pg_trgm indexes on lower(name)/lower(email) serve this.
+    pattern = f"%{_like_escape(term.lower())}%"
+    return or_(
+        func.lower(Employee.name).like(pattern, escape="\\"),
+        func.lower(Employee.email).like(pattern, escape="\\"),
+    )
+
+
+__all__ = ["FTS_TABLE", "search_clause"]
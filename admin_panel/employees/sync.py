@@ -0,0 +1,286 @@
+"""Bulk reconciliation of admin ``Employee`` rows into core ``User`` accounts.
+
+The admin panel is the source of truth: every employee gets a core user
+with the same email, and name, role, area, group and active flag follow the
+employee. Core users without an employee row are reported but never
+touched, so accounts managed only through ``/admin/users`` keep working.
+
+Diffs are computed in memory with set operations over plain tuples and the
+changes are applied with executemany batches inside the caller's
+transaction.
+
+Privileged core roles (admin, rrhh) are only granted or revoked when the
+caller passes ``allow_privileged=True``: the admin panel is open to rrhh,
+and without this guard editing an employee's role would bypass the
+admin-only ``/admin/users/<id>/set_role``.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from admin_panel.areas.models import AdminArea, AdminGroup
+from admin_panel.employees.models import Employee
+from admin_panel.roles.models import Role
+from models import (
+    ORG_CACHE_VERSION,
+    Area,
+    Group,
+    Role as UserRole,
+    User,
+    bump_cache_versions,
+    dialect_insert,
+    fold_name,
+)
+
+# Users created by the sync cannot log in until an admin sets a password;
+# ``check_password_hash`` rejects this value.
+UNUSABLE_PASSWORD = "!sync"
+
+BATCH_SIZE = 1000
+
+# Admin role names (normalized) that map onto the core RBAC roles.
+_ROLE_ALIASES: Dict[str, UserRole] = {
+    "employee": UserRole.employee,
+    "empleado": UserRole.employee,
+    "responsable": UserRole.responsable,
+    "responsable de grupo": UserRole.responsable,
+    "cap_area": UserRole.cap_area,
+    "cap area": UserRole.cap_area,
+    "cap d'area": UserRole.cap_area,
+    "jefe de area": UserRole.cap_area,
+    "rrhh": UserRole.rrhh,
+    "recursos humanos": UserRole.rrhh,
+    "admin": UserRole.admin,
+    "administrador": UserRole.admin,
+    "invitado": UserRole.invitado,
+    "guest": UserRole.invitado,
+}
+
+# Core roles the sync only grants or revokes for an admin caller.
+PRIVILEGED_ROLES = frozenset({UserRole.admin, UserRole.rrhh})
+
+
+def map_role_name(name: Optional[str]) -> Optional[UserRole]:
+    """Return the core role for an admin role name, or None if unmapped."""
+    key = " ".join((name or "").strip().lower().replace("á", "a").split())
+    return _ROLE_ALIASES.get(key)
+
+
+def resolve_role(
+    name: Optional[str], current: Optional[UserRole], *, allow_privileged: bool
+) -> Tuple[UserRole, bool]:
+    """Return ``(role, blocked)``: the core role the sync will set.
+
+    ``current`` is the user's role, or None for a user the sync creates.
+    Without ``allow_privileged`` a change that grants or revokes a
+    privileged role is not applied and ``blocked`` is True.
+    """
+    wanted = map_role_name(name) or current or UserRole.employee
+    if allow_privileged or wanted == current:
+        return wanted, False
+    if wanted in PRIVILEGED_ROLES or current in PRIVILEGED_ROLES:
+        return current or UserRole.employee, True
+    return wanted, False
+
+
+@dataclass
+class SyncReport:
+    created: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    orphans: List[str] = field(default_factory=list)
+    areas_created: List[str] = field(default_factory=list)
+    groups_created: List[str] = field(default_factory=list)
+    # Emails whose privileged role change was not applied
+    roles_blocked: List[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.created or self.updated or self.areas_created or self.groups_created)
+
+    def summary(self) -> str:
+        text = (
+            f"{len(self.created)} creados, {len(self.updated)} actualizados, "
+            f"{self.unchanged} sin cambios, {len(self.orphans)} usuarios sin empleado, "
+            f"{len(self.areas_created)} areas y {len(self.groups_created)} grupos nuevos"
+        )
+        if self.roles_blocked:
+            text += (
+                f"; {len(self.roles_blocked)} cambios de rol privilegiado sin aplicar "
+                "(solo un administrador puede hacerlos)"
+            )
+        return text
+
+
+def _batched(items: List[dict], size: int = BATCH_SIZE) -> Iterable[List[dict]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _ensure_core_areas(db: Session, names: Set[str], report: SyncReport) -> Dict[str, int]:
+    existing = dict(db.execute(select(Area.name, Area.id)).all())
+    missing = sorted(names - set(existing))
+    if missing:
+        created = db.execute(
+            dialect_insert(db, Area)
+            .on_conflict_do_nothing(index_elements=["name"])
+            .returning(Area.name),
+            [{"name": n} for n in missing],
+        ).scalars().all()
+        existing = dict(db.execute(select(Area.name, Area.id)).all())
+        report.areas_created.extend(sorted(created))
+    return existing
+
+
+def _ensure_core_groups(
+    db: Session, pairs: Set[Tuple[str, int]], report: SyncReport
+) -> Dict[Tuple[str, int], int]:
+    def _load() -> Dict[Tuple[str, int], int]:
+        rows = db.execute(
+            select(Group.name, Group.area_id, func.min(Group.id)).group_by(Group.name, Group.area_id)
+        ).all()
+        return {(name, area_id): gid for name, area_id, gid in rows}
+
+    existing = _load()
+    missing = sorted(pairs - set(existing))
+    if missing:
+        db.execute(insert(Group), [{"name": n, "area_id": a} for n, a in missing])
+        existing = _load()
+        report.groups_created.extend(f"{n} (area {a})" for n, a in missing)
+    return existing
+
+
+def sync_employees(
+    db: Session, emails: Optional[Iterable[str]] = None, *, allow_privileged: bool = False
+) -> SyncReport:
+    """Reconcile employees into core users; does not commit.
+
+    With ``emails`` only those employees are synced (incremental mode used
+    after each admin save); without it the full directory is reconciled.
+    ``allow_privileged`` lets the sync grant and revoke admin/rrhh; pass it
+    only when the acting user is an admin.
+    """
+    report = SyncReport()
+    scope = None if emails is None else {e.strip().lower() for e in emails if e}
+    if scope is not None and not scope:
+        return report
+
+    emp_query = (
+        select(
+            Employee.email,
+            Employee.name,
+            Employee.is_active,
+            Role.name,
+            AdminArea.name,
+            AdminGroup.name,
+            AdminGroup.area_id,
+        )
+        .join(Role, Role.id == Employee.role_id)
+        .outerjoin(AdminGroup, AdminGroup.id == Employee.group_id)
+        .outerjoin(AdminArea, AdminArea.id == func.coalesce(AdminGroup.area_id, Employee.area_id))
+    )
+    user_query = select(
+        User.id, User.email, User.name, User.role, User.is_active, User.area_id, User.group_id
+    )
+    if scope is not None:
+        emp_query = emp_query.where(func.lower(Employee.email).in_(scope))
+        user_query = user_query.where(func.lower(User.email).in_(scope))
+
+    employees = {row[0].strip().lower(): row for row in db.execute(emp_query).all()}
+    users = {row[1].strip().lower(): row for row in db.execute(user_query).all()}
+
+    emp_emails = set(employees)
+    user_emails = set(users)
+    report.orphans = sorted(user_emails - emp_emails) if scope is None else []
+
+    area_ids = _ensure_core_areas(
+        db, {row[4] for row in employees.values() if row[4]}, report
+    )
+    group_ids = _ensure_core_groups(
+        db,
+        {(row[5], area_ids[row[4]]) for row in employees.values() if row[5] and row[4]},
+        report,
+    )
+
+    def _desired(row, current_role: Optional[UserRole]):
+        email, name, is_active, role_name, area_name, group_name, _ = row
+        area_id = area_ids.get(area_name) if area_name else None
+        group_id = group_ids.get((group_name, area_id)) if group_name and area_id else None
+        role, blocked = resolve_role(role_name, current_role, allow_privileged=allow_privileged)
+        if blocked:
+            report.roles_blocked.append(email)
+        return (name.strip(), role, bool(is_active), area_id, group_id)
+
+    to_insert: List[dict] = []
+    for email in sorted(emp_emails - user_emails):
+        name, role, is_active, area_id, group_id = _desired(employees[email], None)
+        to_insert.append(
+            {
+                "email": email,
+                "name": name,
+                "role": role,
+                "is_active": is_active,
+                "area_id": area_id,
+                "group_id": group_id,
+                "password_hash": UNUSABLE_PASSWORD,
+            }
+        )
+
+    to_update: List[dict] = []
+    for email in emp_emails & user_emails:
+        uid, _, u_name, u_role, u_active, u_area, u_group = users[email]
+        desired = _desired(employees[email], u_role)
+        if desired == (u_name, u_role, bool(u_active), u_area, u_group):
+            report.unchanged += 1
+            continue
+        name, role, is_active, area_id, group_id = desired
+        to_update.append(
+            {
+                "id": uid,
+                "name": name,
+                # Bulk UPDATE skips the model's validator: keep the search key in step
+                "name_folded": fold_name(name),
+                "role": role,
+                "is_active": is_active,
+                "area_id": area_id,
+                "group_id": group_id,
+            }
+        )
+        report.updated.append(email)
+
+    created: List[str] = []
+    for batch in _batched(to_insert):
+        # Another worker may have synced the same employee meanwhile.
+        created.extend(
+            db.execute(
+                dialect_insert(db, User)
+                .on_conflict_do_nothing(index_elements=["email"])
+                .returning(User.email),
+                batch,
+            ).scalars()
+        )
+    for batch in _batched(to_update):
+        # ORM bulk UPDATE by primary key -> executemany
+        db.execute(update(User), batch)
+
+    if to_insert or to_update:
+        # Bulk writes bypass the ORM flush hooks: invalidate visibility scopes.
+        bump_cache_versions(db.connection(), [ORG_CACHE_VERSION])
+
+    report.created = sorted(created)
+    report.updated.sort()
+    report.roles_blocked.sort()
+    return report
+
+
+__all__ = [
+    "PRIVILEGED_ROLES",
+    "SyncReport",
+    "UNUSABLE_PASSWORD",
+    "map_role_name",
+    "resolve_role",
+    "sync_employees",
+]
@@ -8,6 +8,7 @@ from sqlalchemy.exc import IntegrityError
 from admin_panel.roles import bp
 from admin_panel.roles.forms import RoleForm
 from admin_panel.roles.models import Role
+from dbretry import retry_on_busy
 from models import Role as UserRole, SessionLocal
 
 
@@ -32,6 +33,7 @@ def list_roles():
 
 
 @bp.route("/create", methods=["GET", "POST"])
+@retry_on_busy
 def create_role():
     form = RoleForm()
     if form.validate_on_submit():
@@ -52,6 +54,7 @@ def create_role():
 
 
 @bp.route("/<int:role_id>/edit", methods=["GET", "POST"])
+@retry_on_busy
 def edit_role(role_id: int):
     db = SessionLocal()
     try:
@@ -83,6 +86,7 @@ def edit_role(role_id: int):
 
 
 @bp.route("/<int:role_id>/delete", methods=["POST"])
+@retry_on_busy
 def delete_role(role_id: int):
     db = SessionLocal()
     role = db.get(Role, role_id)
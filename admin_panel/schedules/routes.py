@@ -18,6 +18,7 @@ from sqlalchemy.exc import IntegrityError
 from admin_panel.schedules import bp
 from admin_panel.schedules.forms import SchedulePolicyForm
 from admin_panel.schedules.models import WorkSchedulePolicy
+from dbretry import retry_on_busy
 from models import Role as UserRole, SessionLocal
 
 
@@ -107,6 +108,7 @@ def list_schedules():
 
 
 @bp.route("/create", methods=["GET", "POST"])
+@retry_on_busy
 @login_required
 def create_schedule():
     form = SchedulePolicyForm()
@@ -154,6 +156,7 @@ def create_schedule():
 
 
 @bp.route("/<int:policy_id>/edit", methods=["GET", "POST"])
+@retry_on_busy
 @login_required
 def edit_schedule(policy_id: int):
     db = SessionLocal()
@@ -217,6 +220,7 @@ def edit_schedule(policy_id: int):
 
 
 @bp.route("/<int:policy_id>/delete", methods=["POST"])
+@retry_on_busy
 @login_required
 def delete_schedule(policy_id: int):
     db = SessionLocal()
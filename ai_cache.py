@@ -0,0 +1,289 @@
+"""Caché persistente de resultados del análisis IA de PDFs.
+
+La clave es un SHA-256 del texto normalizado (NFC, espacios colapsados),
+el modelo, un hash del prompt y los ajustes que cambian la respuesta, así
+que cambiar cualquiera de ellos invalida sin tocar nada más. Se guarda la
+lista ``sensitive`` en un SQLite propio (``PDF_AI_CACHE_PATH``) en modo WAL,
+compartido por todos los workers de gunicorn:
+
+* TTL ``PDF_AI_CACHE_TTL`` segundos (por defecto 7 días; 0 desactiva).
+* Tamaño máximo ``PDF_AI_CACHE_MAX_MB``; al superarlo se expulsan las
+  entradas usadas hace más tiempo (LRU) hasta bajar al 90 %.
+* Aciertos, fallos y expulsiones se cuentan en la propia BD, así que
+  :func:`stats` refleja a todos los workers.
+
+Una consulta es solo un ``SELECT`` por clave primaria, sin transacción de
+escritura: en WAL las lecturas de todos los workers no se bloquean entre
+sí. Los aciertos, fallos y ``last_used`` se acumulan en memoria y se
+vuelcan en una sola escritura cada ``FLUSH_EVERY`` consultas o
+``FLUSH_SECONDS`` segundos, y siempre con el siguiente ``put``, antes de
+expulsar por LRU.
+
+La caché es un atajo, no un requisito: cualquier error de SQLite (ruta sin
+permisos, bloqueo que dura más que el ``timeout``) se registra y se trata
+como un fallo, y el análisis sigue contra el modelo.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Mapping, Optional
+
+CACHE_PATH = os.getenv("PDF_AI_CACHE_PATH", "pdf_ai_cache.db")
+CACHE_TTL = int(os.getenv("PDF_AI_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(float(os.getenv("PDF_AI_CACHE_MAX_MB", "64")) * 1024 * 1024)
+# Cada cuántas consultas (o segundos) se vuelcan contadores y last_used
+FLUSH_EVERY = 100
+FLUSH_SECONDS = 10.0
+
+log = logging.getLogger(__name__)
+
+_WS = re.compile(r"\s+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_entries_last_used ON entries (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize_text(text: str) -> str:
+    return _WS.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def cache_key(text: str, *, model: str, prompt: str, settings: Optional[Mapping] = None) -> str:
+    """Clave de contenido: cambia si cambia el texto, el modelo, el prompt o los ajustes."""
+    material = json.dumps(
+        {
+            "text": normalize_text(text),
+            "model": model,
+            "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "settings": dict(settings or {}),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Caché LRU+TTL sobre SQLite; una conexión por hilo y proceso."""
+
+    def __init__(self, path: str, *, ttl: int = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max(0, max_bytes)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready_pid = None
+        # Pendiente de volcar: aciertos/fallos y last_used por clave
+        self._pending_lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0}
+        self._touched: dict[str, float] = {}
+        self._last_flush = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def _conn(self) -> sqlite3.Connection:
+        # Las conexiones no sobreviven a un fork: se abren por hilo y pid
+        pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == pid:
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if self._ready_pid != pid:
+            with self._init_lock:
+                conn.executescript(_SCHEMA)
+                self._ready_pid = pid
+        self._local.conn, self._local.pid = conn, pid
+        return conn
+
+    def _bump(self, conn: sqlite3.Connection, name: str, by: int = 1) -> None:
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, by),
+        )
+
+    def _take_pending(self) -> tuple[dict, dict]:
+        with self._pending_lock:
+            counts, touched = self._counts, self._touched
+            self._counts, self._touched = {"hits": 0, "misses": 0}, {}
+            self._last_flush = time.monotonic()
+        return counts, touched
+
+    def _restore_pending(self, counts: dict, touched: dict) -> None:
+        # La escritura falló: se reintenta en el siguiente volcado
+        with self._pending_lock:
+            for name, value in counts.items():
+                self._counts[name] += value
+            for key, used in touched.items():
+                self._touched[key] = max(used, self._touched.get(key, 0))
+
+    def _write_pending(self, conn: sqlite3.Connection, counts: dict, touched: dict) -> None:
+        if touched:
+            conn.executemany(
+                "UPDATE entries SET last_used = MAX(last_used, ?) WHERE key = ?",
+                [(used, key) for key, used in touched.items()],
+            )
+        for name, value in counts.items():
+            if value:
+                self._bump(conn, name, value)
+
+    def flush(self) -> None:
+        """Vuelca a la BD los contadores y ``last_used`` pendientes de este proceso."""
+        counts, touched = self._take_pending()
+        if not touched and not any(counts.values()):
+            return
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._write_pending(conn, counts, touched)
+        except sqlite3.Error as exc:
+            self._restore_pending(counts, touched)
+            log.warning("ai_cache flush failed: %s", exc)
+
+    def get(self, key: str) -> Optional[list]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            row = self._conn().execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            value = json.loads(row[0]) if row is not None and now - row[1] <= self.ttl else None
+        except (sqlite3.Error, ValueError) as exc:
+            log.warning("ai_cache lookup failed, using the model: %s", exc)
+            return None
+        with self._pending_lock:
+            self._counts["misses" if value is None else "hits"] += 1
+            if value is not None:
+                self._touched[key] = now
+            due = (
+                sum(self._counts.values()) >= FLUSH_EVERY
+                or time.monotonic() - self._last_flush >= FLUSH_SECONDS
+            )
+        if due:
+            self.flush()
+        return value
+
+    def put(self, key: str, value: list, *, model: str) -> None:
+        if not self.enabled:
+            return
+        blob = json.dumps(value, ensure_ascii=False)
+        size = len(blob.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        counts, touched = self._take_pending()
+        now = time.time()
+        try:
+            self._store(key, model, blob, size, now, counts, touched)
+        except sqlite3.Error as exc:
+            self._restore_pending(counts, touched)
+            log.warning("ai_cache store failed: %s", exc)
+
+    def _store(self, key, model, blob, size, now, counts, touched) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Antes de expulsar: el LRU tiene que ver los usos recientes
+            self._write_pending(conn, counts, touched)
+            conn.execute(
+                "INSERT INTO entries (key, model, value, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "value = excluded.value, size = excluded.size, "
+                "created_at = excluded.created_at, last_used = excluded.last_used",
+                (key, model, blob, size, now, now),
+            )
+            expired = conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,)).rowcount
+            if expired:
+                self._bump(conn, "expired", expired)
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._bump(conn, "evictions", evicted)
+
+    def purge(self, *, model: Optional[str] = None) -> int:
+        """Borra todas las entradas (o las de ``model``); devuelve cuántas."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if model:
+                return conn.execute("DELETE FROM entries WHERE model = ?", (model,)).rowcount
+            return conn.execute("DELETE FROM entries").rowcount
+
+    def stats(self) -> dict:
+        # Los pendientes de otros workers aparecen en su siguiente volcado
+        self.flush()
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+            "evictions": counters.get("evictions", 0),
+            "expired": counters.get("expired", 0),
+        }
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(CACHE_PATH)
+    return _cache
+
+
+def configure(path: str, *, ttl: int = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES) -> ResultCache:
+    """Sustituye la caché global (tests y ajustes en caliente)."""
+    global _cache
+    with _cache_lock:
+        _cache = ResultCache(path, ttl=ttl, max_bytes=max_bytes)
+    return _cache
+
+
+__all__ = ["ResultCache", "cache_key", "configure", "get_cache", "normalize_text"]
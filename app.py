@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, abort, jsonify
+from flask import Flask, current_app, render_template, request, redirect, url_for, flash, abort, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from models import (
     SessionLocal,
@@ -12,20 +12,38 @@ from models import (
     EntryStatus,
     Group,
     Area,
+    fold_name,
 )
 from rbac import can_view_user, can_edit_entries, require_view_user, require_edit_entry
-from sqlalchemy import select, desc, func
-from functools import wraps
-from datetime import datetime, timezone
+from attendance import (
+    DEFAULT_MAX_SESSION_HOURS,
+    SessionKind,
+    WorkSession,
+    pair_sessions,
+    pause_seconds_between,
+    worked_by_day,
+)
+from tzbatch import format_local_many, local_days_many
+from hierarchy import HierarchyCycleError, rebuild_closure, set_supervisor
+from guest_acl import set_targets as set_guest_targets, targets_for
+from visibility import viewer_scope
+from passwords import VerifyBusy, verify_and_update
+from dbretry import retry_on_busy
+import ai_cache
+import pii_rules
+import token_budget
+import pdf_jobs
+import pdf_words
+from sqlalchemy import select, desc, func, insert, literal
+from functools import lru_cache, wraps
+from datetime import datetime, timedelta, timezone
 import json
+import time
 import re
-from collections import deque
-from dotenv import load_dotenv
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 import random
 from admin_panel import register_admin_panel
-import jsonschema
-from jsonschema import validate
-import openai
+import click
 
 PII_SCHEMA = {
     "type": "object",
@@ -50,6 +68,10 @@ PII_SCHEMA = {
 
 def validate_and_repair_json(json_str, schema, retry_count=1):
     """Intenta parsear y validar JSON. Si falla, intenta repararlo con LLM (1 intento)."""
+    # Dependencias pesadas: se cargan al primer uso, no al importar la app
+    import jsonschema
+    from jsonschema import validate
+
     try:
         # Limpieza basica de markdown si el modelo se pone creativo
         if "```json" in json_str:
@@ -64,6 +86,8 @@ def validate_and_repair_json(json_str, schema, retry_count=1):
         if retry_count > 0:
             print(f"JSON Error: {e}. Intentando reparar...")
             try:
+                import openai
+
                 # Usamos client global si existe, o creamos uno efimero
                 client = openai.Client() 
                 repair_prompt = f"Fix this JSON to match schema. Respond ONLY with valid JSON.\nError: {str(e)}\nJSON:\n{json_str}"
@@ -117,12 +141,17 @@ def to_utc_epoch(ts) -> float:
 def local_day_bounds_utc(ref_utc: datetime):
     """Devuelve (inicio_dia_utc, fin_dia_utc) para el día local Europe/Madrid.
     ref_utc debe ser aware en UTC."""
-    ref_local = ref_utc.astimezone(TZ)
-    start_local = ref_local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return _local_day_bounds_for(ref_utc.astimezone(TZ).date())
+
+@lru_cache(maxsize=512)
+def _local_day_bounds_for(day):
+    """Límites UTC de un día local; se cachean porque no cambian."""
+    start_local = datetime(day.year, day.month, day.day, tzinfo=TZ)
     end_local = start_local.replace(hour=23, minute=59, second=59, microsecond=999999)
     start_utc = start_local.astimezone(timezone.utc)
     end_utc = end_local.astimezone(timezone.utc)
     return start_utc, end_utc
+
 def to_local_hms(ts):
     """Hora local HH:MM:SS del servidor."""
     if ts.tzinfo is None:
@@ -149,25 +178,101 @@ def parse_local_date(d: str):
 
 import os
 
-load_dotenv()
-
-app = Flask(__name__)
-# Lee SECRET_KEY del entorno, usa valor por defecto en desarrollo
-app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-change-me")
-
 from flask_wtf import CSRFProtect
-csrf = CSRFProtect(app)
 
-login_manager = LoginManager(app)
+csrf = CSRFProtect()
+login_manager = LoginManager()
 login_manager.login_view = "login"
 
-# Inicializa BD y usuario demo al arrancar
-with app.app_context():
+
+class _DeferredRoutes:
+    """Registro de las rutas de este módulo hasta que :func:`create_app` las monte.
+
+    Se usa igual que ``app.route`` y conserva los nombres de endpoint
+    (``url_for("login")``), cosa que un Blueprint no permitiría.
+    """
+
+    def __init__(self):
+        self._rules = []
+
+    def route(self, rule, **options):
+        def decorator(view):
+            endpoint = options.pop("endpoint", None) or view.__name__
+            self._rules.append((rule, endpoint, view, options))
+            return view
+        return decorator
+
+    def init_app(self, flask_app):
+        for rule, endpoint, view, options in self._rules:
+            flask_app.add_url_rule(rule, endpoint, view, **options)
+
+
+routes = _DeferredRoutes()
+
+
+@click.command("init-db")
+def init_db_command():
+    """Crea/migra las tablas y carga los datos de demostración si faltan."""
     init_db_with_demo()
-    register_admin_panel(app)
 
 
-@app.context_processor
+@click.command("rebuild-hierarchy")
+def rebuild_hierarchy_command():
+    """Regenera la tabla de cierre de supervisores desde users.supervisor_id."""
+    db = SessionLocal()
+    try:
+        rows = rebuild_closure(db)
+        db.commit()
+        print(f"✓ Jerarquía regenerada: {rows} relaciones superior-subordinado")
+    finally:
+        db.close()
+
+
+def create_app(config=None):
+    """Construye la aplicación Flask.
+
+    No toca la base de datos: inicializarla es un paso explícito
+    (``flask --app app.py init-db``), igual que en el arranque del contenedor.
+    """
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ModuleNotFoundError:
+        pass
+
+    flask_app = Flask(__name__)
+    # Lee SECRET_KEY del entorno, usa valor por defecto en desarrollo
+    flask_app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-change-me")
+    if config:
+        flask_app.config.update(config)
+
+    csrf.init_app(flask_app)
+    login_manager.init_app(flask_app)
+    routes.init_app(flask_app)
+    flask_app.context_processor(inject_template_globals)
+    register_admin_panel(flask_app)
+    pdf_jobs.init_app(flask_app, analyze=_ai_extract_sensitive)
+
+    # Sondas /healthz y /readyz: sin login ni CSRF
+    from health import bp as health_bp
+    flask_app.register_blueprint(health_bp)
+    csrf.exempt(health_bp)
+
+    flask_app.cli.add_command(init_db_command)
+    flask_app.cli.add_command(rebuild_hierarchy_command)
+    return flask_app
+
+
+def __getattr__(name):
+    # ``app:app`` (gunicorn, flask --app, tests) crea la app al pedirla;
+    # importar solo utilidades del módulo no la construye.
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def inject_template_globals():
     return {
         "current_year": datetime.now(TZ).year,
@@ -181,7 +286,11 @@ def inject_template_globals():
 def load_user(user_id):
     db = SessionLocal()
     try:
-        return db.get(User, int(user_id))
+        user = db.get(User, int(user_id))
+        if user is not None and user.role == Role.invitado:
+            # Accesos del invitado cacheados junto a la identidad
+            user.guest_targets = targets_for(db, user.id)
+        return user
     finally:
         db.close()
 
@@ -205,55 +314,110 @@ def admin_or_rrhh_required(view):
 
 # ---------- RUTAS ----------
 
-@app.route("/login", methods=["GET", "POST"])
+@routes.route("/login", methods=["GET", "POST"])
 def login():
+    status = 200
     if request.method == "POST":
         email = request.form.get("email", "").strip().lower()
         password = request.form.get("password", "")
         db = SessionLocal()
         try:
             user = db.execute(select(User).where(User.email == email)).scalar_one_or_none()
-            if user and user.check_password(password):
+            try:
+                ok = user is not None and verify_and_update(user, password)
+            except VerifyBusy:
+                ok = None
+                status = 503
+                flash("Demasiados inicios de sesión en este momento, inténtalo de nuevo en unos segundos", "error")
+            if ok:
+                if db.is_modified(user):
+                    # Hash regenerado con los parámetros actuales
+                    db.commit()
                 login_user(user)
                 return redirect(url_for("index"))
-            flash("Credenciales inválidas", "error")
-        finally:
-            db.close()
-    # Mostrar select de usuarios solo en modo debug o con ALLOW_LOGIN_AS=1
-    import os
-    show_dev_login = app.debug or os.getenv("ALLOW_LOGIN_AS") == "1"
-    test_users = []
-    if show_dev_login:
-        db = SessionLocal()
-        try:
-            test_users = db.execute(select(User).order_by(User.role, User.id)).scalars().all()
+            if ok is False:
+                flash("Credenciales inválidas", "error")
         finally:
             db.close()
-    # Cargar lista de usuarios para el select principal de login
+    # El GET no toca la BD: los usuarios se buscan con /login/users al teclear
+    return render_template("login.html", show_dev_login=_dev_login_enabled()), status
+
+
+def _dev_login_enabled() -> bool:
+    # Acceso rápido solo en modo debug o con ALLOW_LOGIN_AS=1
+    return current_app.debug or os.getenv("ALLOW_LOGIN_AS") == "1"
+
+
+LOGIN_SEARCH_LIMIT = 10
+
+
+def _prefix_bounds(prefix: str):
+    """Rango [prefix, siguiente) para que el índice de la columna sirva al prefijo."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def search_users_by_prefix(db, q: str, limit: int = LOGIN_SEARCH_LIMIT):
+    """Usuarios activos cuyo nombre o email empiezan por ``q``.
+
+    El nombre se compara plegado (sin mayúsculas ni acentos, ver
+    ``models.fold_name``) y el email en minúsculas.
+    """
+    q = (q or "").strip()
+    if not q:
+        return []
+    found = {}
+    for column, prefix in ((User.name_folded, fold_name(q)), (func.lower(User.email), q.lower())):
+        if not prefix:
+            continue
+        low, high = _prefix_bounds(prefix)
+        rows = db.execute(
+            select(User.id, User.name, User.email, User.role)
+            .where(column >= low, column < high, User.is_active.is_(True))
+            .order_by(column)
+            .limit(limit)
+        ).all()
+        for row in rows:
+            found.setdefault(row.id, row)
+    return sorted(found.values(), key=lambda r: (fold_name(r.name), r.email))[:limit]
+
+
+@routes.route("/login/users")
+def login_user_search():
+    """Typeahead del login: como mucho 10 coincidencias por nombre o email."""
+    q = request.args.get("q", "")
+    if len(q.strip()) < 2:
+        return jsonify([])
     db = SessionLocal()
     try:
-        users_for_login = db.execute(select(User).order_by(User.name, User.email)).scalars().all()
+        rows = search_users_by_prefix(db, q)
     finally:
         db.close()
-    return render_template("login.html", users_for_login=users_for_login, test_users=test_users, show_dev_login=show_dev_login)
+    show_role = _dev_login_enabled()
+    return jsonify([
+        {"name": r.name, "email": r.email, **({"role": r.role.value} if show_role else {})}
+        for r in rows
+    ])
 
-@app.route("/logout", methods=["POST"])
+@routes.route("/logout", methods=["POST"])
 @login_required
 def logout():
     logout_user()
     return redirect(url_for("login"))
 
-@app.route("/dev/login_as", methods=["POST"])
+@routes.route("/dev/login_as", methods=["POST"])
 def dev_login_as():
-    import os
-    if not (app.debug or os.getenv("ALLOW_LOGIN_AS") == "1"):
+    if not _dev_login_enabled():
         abort(404)
     user_id = request.form.get("user_id")
-    if not user_id:
+    email = request.form.get("email", "").strip().lower()
+    if not user_id and not email:
         abort(400)
     db = SessionLocal()
     try:
-        u = db.get(User, int(user_id))
+        if user_id:
+            u = db.get(User, int(user_id))
+        else:
+            u = db.execute(select(User).where(User.email == email)).scalar_one_or_none()
         if not u:
             abort(404)
         login_user(u)
@@ -261,7 +425,7 @@ def dev_login_as():
     finally:
         db.close()
 
-@app.route("/")
+@routes.route("/")
 @login_required
 def index():
     db = SessionLocal()
@@ -303,25 +467,15 @@ def index():
         # Total de pausas de hoy (en la zona local) EXCLUYENDO pausas activas
         day_start_utc, day_end_utc = local_day_bounds_utc(now_utc)
         pauses = db.execute(
-            select(Pause)
+            select(Pause.start_ts, Pause.end_ts)
             .where(
                 Pause.user_id == current_user.id,
                 Pause.start_ts <= day_end_utc,
                 Pause.end_ts.is_not(None),
                 Pause.end_ts >= day_start_utc,
             )
-        ).scalars().all()
-
-        total_secs = 0
-        for p in pauses:
-            if not p.end_ts:
-                continue  # ignorar pausas activas
-            p_start = ensure_aware_utc(p.start_ts)
-            p_end = ensure_aware_utc(p.end_ts)
-            start = max(p_start, day_start_utc)
-            end = min(p_end, day_end_utc)
-            if end > start:
-                total_secs += int((end - start).total_seconds())
+        ).all()
+        total_secs = pause_seconds_between(pauses, day_start_utc, day_end_utc)
 
         pause_total_today_fmt = _fmt_hms(total_secs)
 
@@ -337,7 +491,49 @@ def index():
     finally:
         db.close()
 
-@app.route("/clock", methods=["POST"])
+# Segundos en los que repetir la misma acción de fichaje se trata como reenvío
+CLOCK_DEDUP_SECONDS = int(os.getenv("CLOCK_DEDUP_SECONDS", "10"))
+
+
+def _clock_insert_if_new(db, user_id, action, now, ip) -> bool:
+    """Inserta el fichaje salvo que el último del usuario sea la misma acción
+    dentro de ``CLOCK_DEDUP_SECONDS``; True si lo ha insertado.
+
+    Comprobación e inserción son una sola sentencia ``INSERT ... SELECT ...
+    WHERE NOT EXISTS``: dos envíos simultáneos no pueden insertar ambos. En
+    SQLite la sentencia es atómica (un escritor a la vez; el perdedor ve la BD
+    bloqueada y ``retry_on_busy`` lo repite); en PostgreSQL además se bloquea
+    la fila del usuario para serializar sus fichajes.
+    """
+    db.execute(select(User.id).where(User.id == user_id).with_for_update())
+    latest = (
+        select(Attendance.action, Attendance.ts)
+        .where(Attendance.user_id == user_id)
+        .order_by(desc(Attendance.ts))
+        .limit(1)
+        .subquery()
+    )
+    duplicate = select(latest.c.action).where(
+        latest.c.action == action,
+        latest.c.ts > now - timedelta(seconds=CLOCK_DEDUP_SECONDS),
+    )
+    columns = Attendance.__table__.c
+    row = select(
+        literal(user_id, columns.user_id.type),
+        literal(action, columns.action.type),
+        literal(now, columns.ts.type),
+        literal(ip, columns.ip.type),
+        literal(now, columns.created_at.type),
+    ).where(~duplicate.exists())
+    inserted = db.execute(
+        insert(Attendance).from_select(["user_id", "action", "ts", "ip", "created_at"], row)
+    ).rowcount
+    db.commit()
+    return bool(inserted)
+
+
+@routes.route("/clock", methods=["POST"])
+@retry_on_busy
 @login_required
 def clock():
     db = SessionLocal()
@@ -348,16 +544,17 @@ def clock():
             abort(400, description="Acción inválida")
 
         action = AttendanceAction._in if action_str == "in" else AttendanceAction._out
+        now = datetime.now(timezone.utc)
 
-        # Guardar fichaje
-        rec = Attendance(
-            user_id=current_user.id,
-            action=action,
-            ts=datetime.now(timezone.utc),
-            ip=request.headers.get("X-Forwarded-For", request.remote_addr),
+        # Idempotente: la misma acción repetida dentro de la ventana (doble
+        # clic, reintento del navegador tras un 503) no crea otro fichaje.
+        _clock_insert_if_new(
+            db,
+            current_user.id,
+            action,
+            now,
+            request.headers.get("X-Forwarded-For", request.remote_addr),
         )
-        db.add(rec)
-        db.commit()
 
         # Recalcular historial
         last5 = db.execute(
@@ -384,7 +581,7 @@ def clock():
 
 # ---------- ADMIN ----------
 
-@app.route("/admin", methods=["GET"])
+@routes.route("/admin", methods=["GET"])
 @login_required
 @admin_required
 def admin_home():
@@ -403,7 +600,7 @@ def admin_home():
         db.close()
 
 
-@app.route("/admin/users", methods=["GET"])
+@routes.route("/admin/users", methods=["GET"])
 @login_required
 @admin_required
 def admin_users():
@@ -432,7 +629,7 @@ def admin_users():
         db.close()
 
 
-@app.route("/admin/areas", methods=["GET"])
+@routes.route("/admin/areas", methods=["GET"])
 @login_required
 @admin_or_rrhh_required
 def admin_areas_page():
@@ -457,7 +654,7 @@ def admin_areas_page():
         db.close()
 
 
-@app.route("/admin/groups", methods=["GET"])
+@routes.route("/admin/groups", methods=["GET"])
 @login_required
 @admin_required
 def admin_groups_page():
@@ -469,7 +666,8 @@ def admin_groups_page():
     finally:
         db.close()
 
-@app.route("/admin/users/create", methods=["POST"])
+@routes.route("/admin/users/create", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_required
 def admin_users_create():
@@ -515,22 +713,31 @@ def admin_users_create():
                     u.area_id = area.id
             except Exception:
                 pass
+        supervisor = None
         if supervisor_id:
             try:
-                sid = int(supervisor_id)
-                supervisor = db.get(User, sid)
-                if supervisor and supervisor.id != u.id:
-                    u.supervisor_id = supervisor.id
-            except Exception:
+                supervisor = db.get(User, int(supervisor_id))
+            except ValueError:
                 pass
+            if supervisor is None:
+                flash("Supervisor no encontrado: el usuario no se ha creado.", "error")
+                return redirect(url_for("admin_users"))
         u.set_password(password)
         db.add(u)
+        if supervisor is not None:
+            try:
+                set_supervisor(db, u, supervisor.id)
+            except HierarchyCycleError as exc:
+                db.rollback()
+                flash(f"No se pudo asignar el supervisor: {exc}", "error")
+                return redirect(url_for("admin_users"))
         db.commit()
         flash("Usuario creado correctamente.", "ok")
         return redirect(url_for("admin_users"))
     finally:
         db.close()
-@app.route("/admin/users/<int:user_id>/reset_password", methods=["POST"])
+@routes.route("/admin/users/<int:user_id>/reset_password", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_required
 def admin_users_reset_password(user_id):
@@ -557,7 +764,8 @@ def admin_users_reset_password(user_id):
         db.close()
 
 
-@app.route("/admin/users/<int:user_id>/set_role", methods=["POST"])
+@routes.route("/admin/users/<int:user_id>/set_role", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_required
 def admin_users_set_role(user_id):
@@ -582,7 +790,8 @@ def admin_users_set_role(user_id):
     finally:
         db.close()
 
-@app.route("/admin/users/<int:user_id>/set_group", methods=["POST"])
+@routes.route("/admin/users/<int:user_id>/set_group", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_required
 def admin_users_set_group(user_id):
@@ -614,7 +823,8 @@ def admin_users_set_group(user_id):
         db.close()
 
 
-@app.route("/admin/users/<int:user_id>/set_area", methods=["POST"])
+@routes.route("/admin/users/<int:user_id>/set_area", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_required
 def admin_users_set_area(user_id):
@@ -645,7 +855,8 @@ def admin_users_set_area(user_id):
         db.close()
 
 
-@app.route("/admin/users/<int:user_id>/set_supervisor", methods=["POST"])
+@routes.route("/admin/users/<int:user_id>/set_supervisor", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_required
 def admin_users_set_supervisor(user_id):
@@ -657,7 +868,7 @@ def admin_users_set_supervisor(user_id):
             flash("Usuario no encontrado.", "error")
             return redirect(url_for("admin_users"))
         if not supervisor_id:
-            u.supervisor_id = None
+            set_supervisor(db, u, None)
             db.commit()
             flash(f"Supervisor de {u.email} eliminado.", "ok")
             return redirect(url_for("admin_users"))
@@ -673,16 +884,58 @@ def admin_users_set_supervisor(user_id):
         if not supervisor:
             flash("Supervisor no encontrado.", "error")
             return redirect(url_for("admin_users"))
-        u.supervisor_id = supervisor.id
+        try:
+            set_supervisor(db, u, supervisor.id)
+        except HierarchyCycleError:
+            db.rollback()
+            flash(f"{supervisor.name} depende de {u.email}: no puede ser su superior.", "error")
+            return redirect(url_for("admin_users"))
         db.commit()
         flash(f"Supervisor de {u.email} actualizado a {supervisor.name}.", "ok")
         return redirect(url_for("admin_users"))
     finally:
         db.close()
 
+@routes.route("/admin/users/<int:user_id>/guest_access", methods=["GET", "POST"])
+@retry_on_busy
+@login_required
+@admin_required
+def admin_guest_access(user_id):
+    """Accesos de un invitado: alta/baja en bloque de los usuarios visibles."""
+    db = SessionLocal()
+    try:
+        guest = db.get(User, user_id)
+        if not guest or guest.role != Role.invitado:
+            flash("El usuario no es un invitado.", "error")
+            return redirect(url_for("admin_users"))
+        if request.method == "POST":
+            ids = []
+            for raw in request.form.getlist("target_ids"):
+                try:
+                    ids.append(int(raw))
+                except ValueError:
+                    continue
+            valid = set(db.execute(select(User.id).where(User.id.in_(ids))).scalars()) if ids else set()
+            added, removed = set_guest_targets(db, guest.id, valid)
+            db.commit()
+            flash(f"Accesos de {guest.email}: {added} concedidos, {removed} retirados.", "ok")
+            return redirect(url_for("admin_guest_access", user_id=guest.id))
+        users = db.execute(
+            select(User).where(User.id != guest.id, User.role != Role.invitado).order_by(User.name)
+        ).scalars().all()
+        return render_template(
+            "admin/guest_access.html",
+            guest=guest,
+            users=users,
+            granted=targets_for(db, guest.id),
+        )
+    finally:
+        db.close()
+
 # ---------- ADMIN: GROUPS CRUD ----------
 
-@app.route("/admin/groups/create", methods=["POST"])
+@routes.route("/admin/groups/create", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_required
 def admin_groups_create():
@@ -709,7 +962,8 @@ def admin_groups_create():
     return redirect(url_for("admin_groups_page"))
 
 
-@app.route("/admin/groups/<int:group_id>/update", methods=["POST"])
+@routes.route("/admin/groups/<int:group_id>/update", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_required
 def admin_groups_update(group_id):
@@ -737,7 +991,8 @@ def admin_groups_update(group_id):
     return redirect(url_for("admin_groups_page"))
 
 
-@app.route("/admin/groups/<int:group_id>/delete", methods=["POST"])
+@routes.route("/admin/groups/<int:group_id>/delete", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_required
 def admin_groups_delete(group_id):
@@ -761,7 +1016,8 @@ def admin_groups_delete(group_id):
 
 # ---------- ADMIN: AREAS CRUD ----------
 
-@app.route("/admin/areas/create", methods=["POST"])
+@routes.route("/admin/areas/create", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_or_rrhh_required
 def admin_areas_create():
@@ -785,19 +1041,20 @@ def admin_areas_create():
                 flash("Responsable de área inválido.", "error")
                 return redirect(url_for("admin_areas_page"))
         db.add(a)
-        db.commit()
+        db.flush()
         if a.manager_id:
             manager = db.get(User, a.manager_id)
             if manager and manager.area_id != a.id:
                 manager.area_id = a.id
-                db.commit()
+        db.commit()
         flash("Área creada.", "ok")
     finally:
         db.close()
     return redirect(url_for("admin_areas_page"))
 
 
-@app.route("/admin/areas/<int:area_id>/update", methods=["POST"])
+@routes.route("/admin/areas/<int:area_id>/update", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_or_rrhh_required
 def admin_areas_update(area_id):
@@ -831,7 +1088,8 @@ def admin_areas_update(area_id):
     return redirect(url_for("admin_areas_page"))
 
 
-@app.route("/admin/areas/<int:area_id>/delete", methods=["POST"])
+@routes.route("/admin/areas/<int:area_id>/delete", methods=["POST"])
+@retry_on_busy
 @login_required
 @admin_or_rrhh_required
 def admin_areas_delete(area_id):
@@ -856,63 +1114,46 @@ def admin_areas_delete(area_id):
 
 # ---------- ENTRIES (RBAC) ----------
 
-@app.route("/entries", methods=["GET"])
+@routes.route("/entries", methods=["GET"])
 @login_required
 def entries_list():
     db = SessionLocal()
     try:
         q = select(TimeEntry)
-        allowed_user_ids = None
-        if current_user.role == Role.employee:
-            allowed_user_ids = {current_user.id}
-        elif current_user.role == Role.responsable:
-            allowed_user_ids = set()
-            if current_user.group_id:
-                allowed_user_ids.update(
-                    db.execute(select(User.id).where(User.group_id == current_user.group_id)).scalars().all()
-                )
-        elif current_user.role == Role.cap_area:
-            allowed_user_ids = set()
-            if current_user.area_id:
-                allowed_user_ids.update(
-                    db.execute(select(User.id).where(User.area_id == current_user.area_id)).scalars().all()
-                )
-        elif current_user.role in (Role.rrhh, Role.admin):
-            allowed_user_ids = None
-        elif current_user.role == Role.invitado:
-            from models import GuestAccess
-            q = q.where(TimeEntry.user_id.in_(select(GuestAccess.target_user_id).where(GuestAccess.guest_user_id == current_user.id)))
-        else:
-            allowed_user_ids = {current_user.id}
-
+        # Visibilidad precalculada por usuario (bitsets cacheados por versión de la organización)
+        scope = viewer_scope(db, current_user)
+        allowed_user_ids = scope.visible_ids()
         if allowed_user_ids is not None:
-            direct_reports = db.execute(
-                select(User.id).where(User.supervisor_id == current_user.id)
-            ).scalars().all()
-            allowed_user_ids.update(direct_reports)
-            if allowed_user_ids:
-                q = q.where(TimeEntry.user_id.in_(list(allowed_user_ids)))
-            else:
-                q = q.where(TimeEntry.user_id == -1)
+            q = q.where(TimeEntry.user_id.in_(allowed_user_ids or [-1]))
 
         rows = db.execute(q.order_by(TimeEntry.id.desc())).scalars().all()
+        # Conversión horaria por lotes: una tabla de offsets en vez de ZoneInfo por fila
+        ts_in_local = format_local_many(TZ, (r.ts_in for r in rows))
+        ts_out_local = format_local_many(TZ, (r.ts_out for r in rows))
+        emails = dict(
+            db.execute(
+                select(User.id, User.email).where(User.id.in_({r.user_id for r in rows}))
+            ).all()
+        ) if rows else {}
         entries = [
             {
                 "id": r.id,
-                "user": (db.get(User, r.user_id).email if r.user_id else "-"),
+                "user": emails.get(r.user_id, "-"),
                 "type": r.type.value,
                 "status": r.status.value,
-                "ts_in": to_local(r.ts_in) if r.ts_in else "-",
-                "ts_out": to_local(r.ts_out) if r.ts_out else "-",
+                "ts_in": ts_in_local[i],
+                "ts_out": ts_out_local[i],
+                "can_edit": scope.can_edit(r.user_id),
             }
-            for r in rows
+            for i, r in enumerate(rows)
         ]
         return render_template("entries.html", entries=entries)
     finally:
         db.close()
 
 
-@app.route("/entries/<int:entry_id>/approve", methods=["POST"])
+@routes.route("/entries/<int:entry_id>/approve", methods=["POST"])
+@retry_on_busy
 @login_required
 @require_edit_entry("entry_id")
 def entries_approve(entry_id):
@@ -929,7 +1170,7 @@ def entries_approve(entry_id):
         db.close()
 
 
-@app.route("/entries/<int:entry_id>/edit", methods=["POST"])
+@routes.route("/entries/<int:entry_id>/edit", methods=["POST"])
 @login_required
 @require_edit_entry("entry_id")
 def entries_edit(entry_id):
@@ -938,22 +1179,83 @@ def entries_edit(entry_id):
 
 
 # ----- Simple pages for menu -----
-@app.route("/pdf", methods=["GET"])
+@routes.route("/pdf", methods=["GET"])
 @login_required
 def pdf_tools():
     return render_template("pdf_tool.html")
 
 
+def _candidate_value_key(value: str) -> str:
+    return ai_cache.normalize_text(value).casefold()
+
+
+def _candidate_key(label: str, value: str) -> tuple[str, str]:
+    """Clave de deduplicado: (etiqueta, valor) sin mayúsculas ni espacios extra."""
+    return ai_cache.normalize_text(label).casefold(), _candidate_value_key(value)
+
+
+def _dedupe_candidates(candidates: list[dict]) -> tuple[list[dict], dict[str, list[dict]]]:
+    """Agrupa candidatos repetidos antes de enviarlos al modelo.
+
+    Devuelve los candidatos únicos (primera aparición, en orden) y, por valor
+    normalizado, todas las apariciones originales para repartir después la
+    decisión del modelo con :func:`_fan_out_decisions`.
+    """
+    unique: list[dict] = []
+    seen: set[tuple[str, str]] = set()
+    occurrences: dict[str, list[dict]] = {}
+    for item in candidates or []:
+        key = _candidate_key(item.get("label") or "", item.get("value") or "")
+        occurrences.setdefault(key[1], []).append(item)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique, occurrences
+
+
+def _fan_out_decisions(items: list[dict], occurrences: dict[str, list[dict]]) -> list[dict]:
+    """Copia cada decisión del modelo a todas las apariciones de su valor.
+
+    Se emite una entrada por cada forma distinta del valor tal y como aparece
+    en el documento (para que la censura la encuentre), con ``occurrences``
+    igual a las veces que aparece esa forma. Los datos que el modelo extrae
+    del extracto sin ser candidatos pasan tal cual.
+    """
+    fanned: list[dict] = []
+    done: set[str] = set()
+    for item in items:
+        key = _candidate_value_key(item.get("value") or "")
+        originals = occurrences.get(key)
+        if not originals:
+            fanned.append(item)
+            continue
+        if key in done:
+            continue
+        done.add(key)
+        variants: dict[str, int] = {}
+        for original in originals:
+            variants[original["value"]] = variants.get(original["value"], 0) + original.get("occurrences", 1)
+        for value, count in variants.items():
+            fanned.append({**item, "value": value, "occurrences": count})
+    return fanned
+
+
 def _sanitize_candidate_list(candidates):
     clean = []
+    index: dict[tuple[str, str], dict] = {}
     for item in candidates or []:
         label = (item.get("label") or "").strip()
         value = (item.get("value") or "").strip()
         if not label or not value:
             continue
-        clean.append({"label": label[:50], "value": value[:400]})
+        key = _candidate_key(label[:50], value[:400])
+        if key in index:
+            index[key]["occurrences"] += 1
+            continue
         if len(clean) >= 60:
-            break
+            continue
+        index[key] = {"label": label[:50], "value": value[:400], "occurrences": 1}
+        clean.append(index[key])
     return clean
 
 
@@ -964,6 +1266,72 @@ def _excerpt_text(text: str, limit: int = 6000) -> str:
     return trimmed[:limit] + "\n[...recortado...]"
 
 
+PDF_AI_CONTEXT_CHARS = int(os.getenv("PDF_AI_CONTEXT_CHARS", "200"))
+# Apariciones de un mismo valor que aportan contexto a su trozo
+_CONTEXT_HITS_PER_VALUE = 3
+_CONTEXT_GAP = " [...] "
+
+
+def _candidate_positions(text: str, candidates: list[dict]) -> dict[str, list[tuple[int, int]]]:
+    """Índice de posiciones de los candidatos en el texto, por valor normalizado.
+
+    Una sola pasada con todos los valores en una alternativa (los más largos
+    primero); los que quedan dentro de otro más largo se buscan después uno
+    a uno. Se guardan como mucho ``_CONTEXT_HITS_PER_VALUE`` por valor.
+    """
+    patterns: dict[str, str] = {}
+    for item in candidates:
+        key = _candidate_value_key(item.get("value") or "")
+        if key and key not in patterns:
+            patterns[key] = r"\s+".join(re.escape(part) for part in key.split(" "))
+    if not text or not patterns:
+        return {}
+    ordered = sorted(patterns.values(), key=len, reverse=True)
+    positions: dict[str, list[tuple[int, int]]] = {}
+    for match in re.finditer("|".join(ordered), text, re.IGNORECASE):
+        hits = positions.setdefault(_candidate_value_key(match.group(0)), [])
+        if len(hits) < _CONTEXT_HITS_PER_VALUE:
+            hits.append(match.span())
+    for key, pattern in patterns.items():
+        if key not in positions:
+            hits = [m.span() for m in re.finditer(pattern, text, re.IGNORECASE)]
+            if hits:
+                positions[key] = hits[:_CONTEXT_HITS_PER_VALUE]
+    return positions
+
+
+def _context_windows(text: str, spans: list[tuple[int, int]], *, radius: int, limit: int) -> str:
+    """Une las ventanas de ``radius`` caracteres alrededor de cada posición.
+
+    Las ventanas se ajustan a límites de palabra, se fusionan si se solapan y
+    se cortan en ``limit`` caracteres en total.
+    """
+    windows: list[list[int]] = []
+    for start, end in sorted(spans):
+        lo, hi = max(0, start - radius), min(len(text), end + radius)
+        if lo > 0:
+            lo = text.rfind(" ", 0, lo) + 1
+        if hi < len(text):
+            cut = text.find(" ", hi)
+            hi = len(text) if cut < 0 else cut
+        if windows and lo <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], hi)
+        else:
+            windows.append([lo, hi])
+    parts: list[str] = []
+    used = 0
+    for lo, hi in windows:
+        piece = " ".join(text[lo:hi].split())
+        if used + len(piece) > limit:
+            piece = piece[: max(0, limit - used)]
+        if piece:
+            parts.append(piece)
+            used += len(piece) + len(_CONTEXT_GAP)
+        if used >= limit:
+            break
+    return _CONTEXT_GAP.join(parts)
+
+
 def _parse_model_json(content: str) -> dict:
     """Intenta interpretar JSON aunque el modelo envíe envoltorios."""
     raw = (content or "").strip()
@@ -1049,7 +1417,96 @@ def _normalize_model_output(parsed: object) -> tuple[list[dict], list[dict]]:
     return sensitive, non_sensitive
 
 
-def _ai_classify_sensitive(text: str, candidates: list[dict]):
+# Prompt relajado para mejorar recall (en el modo por candidatos su hash
+# forma parte de la clave de ai_cache: editarlo invalida la caché)
+PDF_CLASSIFY_PROMPT = (
+    "# ROL\n"
+    "Eres un Oficial de Protección de Datos (DPO) especializado en RGPD/LOPD-GDD.\n"
+    "Tu misión es identificar y clasificar TODOS los datos personales en documentos PDF para su censura/redacción.\n\n"
+    
+    "# CONTEXTO\n"
+    "El usuario subirá PDFs de distintos tipos: facturas, informes médicos, documentos legales, nóminas, certificados administrativos.\n"
+    "Cada dato identificado será censurado con un recuadro negro. Es CRÍTICO no omitir ningún dato sensible.\n\n"
+    
+    "# TAREAS\n"
+    "1. CLASIFICAR cada candidato en 'sensitive' o 'non_sensitive'\n"
+    "2. EXTRAER datos sensibles adicionales del 'document_excerpt' que no estén en los candidatos\n"
+    "El 'document_excerpt' son los fragmentos del documento que rodean a los candidatos, separados por '[...]'\n\n"
+    
+    "# TAXONOMÍA DE DATOS SENSIBLES (por categoría RGPD)\n\n"
+    
+    "## CATEGORÍA ESPECIAL (Art. 9 RGPD) - Máxima protección - CRÍTICO\n"
+    "- Salud: Diagnósticos, medicamentos, nº historia clínica, informes médicos, discapacidad, baja médica, minusvalía, incapacidad\n"
+    "- Biométricos: Huellas, patrones faciales, ADN\n"
+    "- Orientación sexual: Cualquier referencia directa o indirecta\n"
+    "- Ideología/Religión: Afiliación política, sindicatos (cuota sindical), creencias, partido\n"
+    "- Origen étnico: Nacionalidad en contexto discriminatorio, etnia\n\n"
+    
+    "## DATOS FINANCIEROS - Alta protección - ALTO\n"
+    "- Cuentas bancarias: IBAN, CCC, nº cuenta (ES12 3456...), CUALQUIER secuencia que parezca cuenta, nombres de bancos (ING, BBVA, Santander...)\n"
+    "- Tarjetas: Números de tarjeta (aunque parciales), CVV, fecha expiración\n"
+    "- Ingresos: Salario bruto/neto, nóminas, declaraciones IRPF, pensiones\n"
+    "- Deudas: Embargos, apremios, ejecuciones fiscales, impagos, juzgado\n"
+    "- Situación económica: Bono social, tarifa social, vulnerable, renta mínima\n\n"
+    
+    "## IDENTIFICADORES PERSONALES - Protección estándar\n"
+    "- DNI/NIE/Pasaporte: 12345678A, X1234567B, números de pasaporte - ALTO\n"
+    "- Seguridad Social: Nº afiliación SS, NAF - ALTO\n"
+    "- Nombres completos: Nombre + apellidos de personas físicas (pacientes, doctores, clientes) - MEDIO\n"
+    "- Fechas personales: Fecha nacimiento, fecha defunción, DOB - MEDIO\n"
+    "- Direcciones: Calle, nº, piso, CP + localidad - CENSURAR TODAS LAS OCURRENCIAS - MEDIO\n"
+    "- Códigos Postales: Asociados a domicilio son SENSIBLES - MEDIO\n"
+    "- Teléfonos: Fijos/móviles, prefijos internacionales - MEDIO\n"
+    "- Email: Direcciones de correo electrónico personal - MEDIO\n\n"
+    
+    "## DATOS LEGALES/JUDICIALES - ALTO\n"
+    "- Expedientes judiciales: Nº procedimiento, juzgado, sentencias\n"
+    "- Antecedentes: Referencias a condenas, delitos - CRÍTICO\n"
+    "- Matrículas vehículos: 1234 ABC, M-1234-AB\n"
+    "- Referencias catastrales: Identificadores de propiedades\n\n"
+    
+    "## DATOS ADMINISTRATIVOS/CENSO - MEDIO\n"
+    "- Composición familiar: 'X personas empadronadas', 'familia numerosa', habitantes\n"
+    "- Nº expediente: Referencias administrativas con datos asociables\n"
+    "- Códigos de barras/QR: Si codifican datos personales\n"
+    "- Firmas/Sellos: Firmas manuscritas digitalizadas\n\n"
+    
+    "# REGLAS DE CLASIFICACIÓN\n"
+    "1. PRINCIPIO DE PRECAUCIÓN: Ante la MÍNIMA duda → 'sensitive' con confidence 'high'\n"
+    "2. DUPLICADOS: Si un dato aparece múltiples veces, INCLUIR TODAS las ocurrencias\n"
+    "3. CONTEXTO: Un código postal solo es 'no sensible' si NO está asociado a una dirección\n"
+    "4. EMPRESAS: Nombres de empresas/organismos públicos NO son datos personales (excepto autónomos)\n"
+    "5. FECHAS: 'Enero 2024' genérico no es sensible; '12/05/1985 (fecha nacimiento)' SÍ lo es\n\n"
+    
+    "# EJEMPLOS\n"
+    "- Factura con IBAN: {\"label\": \"IBAN\", \"value\": \"ES12 3456 7890 1234\", \"reason\": \"Cuenta bancaria - dato financiero protegido\", \"confidence\": \"high\"}\n"
+    "- Informe médico: {\"label\": \"Nombre paciente\", \"value\": \"María García\", \"reason\": \"Identidad en contexto sanitario - Art. 9 RGPD\", \"confidence\": \"high\"}\n"
+    "- Certificado censo: {\"label\": \"Composición familiar\", \"value\": \"5 personas empadronadas\", \"reason\": \"Estructura del hogar - dato censal\", \"confidence\": \"high\"}\n\n"
+    
+    "Responde EXCLUSIVAMENTE con un único objeto JSON que cumpla el siguiente esquema:\n"
+    "{\n"
+    '  "sensitive": [{"label": "...", "value": "...", "reason": "...", "confidence": "high|medium|low"}],\n'
+    '  "non_sensitive": []\n'
+    "}"
+)
+
+
+def _pdf_ai_max_output_tokens() -> int:
+    """``PDF_AI_MAX_OUTPUT_TOKENS`` (4000 por defecto) acotado a 300..16000."""
+    try:
+        max_tokens = int(os.environ.get("PDF_AI_MAX_OUTPUT_TOKENS", "4000"))
+    except ValueError:
+        max_tokens = 4000
+    return max(300, min(max_tokens, 16_000))
+
+
+def _ai_classify_sensitive(text: str, candidates: list[dict], progress=None):
+    """Clasifica ``candidates`` con el modelo en trozos paralelos.
+
+    ``progress``, si se indica, recibe al terminar cada trozo un dict
+    ``{"done", "total", "shard", "found", "items"}`` con sus datos sensibles,
+    igual que en :func:`_ai_extract_sensitive`.
+    """
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY no configurada en el servidor.")
@@ -1060,16 +1517,17 @@ def _ai_classify_sensitive(text: str, candidates: list[dict]):
 
     client = OpenAI(api_key=api_key)
     model = os.environ.get("PDF_AI_MODEL", "gpt-4o-mini")
-    try:
-        max_tokens = int(os.environ.get("PDF_AI_MAX_OUTPUT_TOKENS", "4000"))
-    except ValueError:
-        max_tokens = 4000
-    max_tokens = max(300, min(max_tokens, 16_000))
+    max_tokens = _pdf_ai_max_output_tokens()
     try:
         chunk_size = int(os.environ.get("PDF_AI_CANDIDATES_PER_CALL", "50"))
     except ValueError:
         chunk_size = 50
     chunk_size = max(1, min(chunk_size, 60))
+    try:
+        max_concurrency = int(os.environ.get("PDF_AI_MAX_CONCURRENCY", "6"))
+    except ValueError:
+        max_concurrency = 6
+    max_concurrency = max(1, min(max_concurrency, 16))
 
     try:
         excerpt_limit_env = int(os.environ.get("PDF_AI_EXCERPT_LIMIT", "6000"))
@@ -1092,76 +1550,7 @@ def _ai_classify_sensitive(text: str, candidates: list[dict]):
 
     excerpt_cache: dict[int, str] = {}
 
-    # Prompt relajado para mejorar recall
-    system_prompt = (
-        "# ROL\n"
-        "Eres un Oficial de Protección de Datos (DPO) especializado en RGPD/LOPD-GDD.\n"
-        "Tu misión es identificar y clasificar TODOS los datos personales en documentos PDF para su censura/redacción.\n\n"
-        
-        "# CONTEXTO\n"
-        "El usuario subirá PDFs de distintos tipos: facturas, informes médicos, documentos legales, nóminas, certificados administrativos.\n"
-        "Cada dato identificado será censurado con un recuadro negro. Es CRÍTICO no omitir ningún dato sensible.\n\n"
-        
-        "# TAREAS\n"
-        "1. CLASIFICAR cada candidato en 'sensitive' o 'non_sensitive'\n"
-        "2. EXTRAER datos sensibles adicionales del 'document_excerpt' que no estén en los candidatos\n\n"
-        
-        "# TAXONOMÍA DE DATOS SENSIBLES (por categoría RGPD)\n\n"
-        
-        "## CATEGORÍA ESPECIAL (Art. 9 RGPD) - Máxima protección - CRÍTICO\n"
-        "- Salud: Diagnósticos, medicamentos, nº historia clínica, informes médicos, discapacidad, baja médica, minusvalía, incapacidad\n"
-        "- Biométricos: Huellas, patrones faciales, ADN\n"
-        "- Orientación sexual: Cualquier referencia directa o indirecta\n"
-        "- Ideología/Religión: Afiliación política, sindicatos (cuota sindical), creencias, partido\n"
-        "- Origen étnico: Nacionalidad en contexto discriminatorio, etnia\n\n"
-        
-        "## DATOS FINANCIEROS - Alta protección - ALTO\n"
-        "- Cuentas bancarias: IBAN, CCC, nº cuenta (ES12 3456...), CUALQUIER secuencia que parezca cuenta, nombres de bancos (ING, BBVA, Santander...)\n"
-        "- Tarjetas: Números de tarjeta (aunque parciales), CVV, fecha expiración\n"
-        "- Ingresos: Salario bruto/neto, nóminas, declaraciones IRPF, pensiones\n"
-        "- Deudas: Embargos, apremios, ejecuciones fiscales, impagos, juzgado\n"
-        "- Situación económica: Bono social, tarifa social, vulnerable, renta mínima\n\n"
-        
-        "## IDENTIFICADORES PERSONALES - Protección estándar\n"
-        "- DNI/NIE/Pasaporte: 12345678A, X1234567B, números de pasaporte - ALTO\n"
-        "- Seguridad Social: Nº afiliación SS, NAF - ALTO\n"
-        "- Nombres completos: Nombre + apellidos de personas físicas (pacientes, doctores, clientes) - MEDIO\n"
-        "- Fechas personales: Fecha nacimiento, fecha defunción, DOB - MEDIO\n"
-        "- Direcciones: Calle, nº, piso, CP + localidad - CENSURAR TODAS LAS OCURRENCIAS - MEDIO\n"
-        "- Códigos Postales: Asociados a domicilio son SENSIBLES - MEDIO\n"
-        "- Teléfonos: Fijos/móviles, prefijos internacionales - MEDIO\n"
-        "- Email: Direcciones de correo electrónico personal - MEDIO\n\n"
-        
-        "## DATOS LEGALES/JUDICIALES - ALTO\n"
-        "- Expedientes judiciales: Nº procedimiento, juzgado, sentencias\n"
-        "- Antecedentes: Referencias a condenas, delitos - CRÍTICO\n"
-        "- Matrículas vehículos: 1234 ABC, M-1234-AB\n"
-        "- Referencias catastrales: Identificadores de propiedades\n\n"
-        
-        "## DATOS ADMINISTRATIVOS/CENSO - MEDIO\n"
-        "- Composición familiar: 'X personas empadronadas', 'familia numerosa', habitantes\n"
-        "- Nº expediente: Referencias administrativas con datos asociables\n"
-        "- Códigos de barras/QR: Si codifican datos personales\n"
-        "- Firmas/Sellos: Firmas manuscritas digitalizadas\n\n"
-        
-        "# REGLAS DE CLASIFICACIÓN\n"
-        "1. PRINCIPIO DE PRECAUCIÓN: Ante la MÍNIMA duda → 'sensitive' con confidence 'high'\n"
-        "2. DUPLICADOS: Si un dato aparece múltiples veces, INCLUIR TODAS las ocurrencias\n"
-        "3. CONTEXTO: Un código postal solo es 'no sensible' si NO está asociado a una dirección\n"
-        "4. EMPRESAS: Nombres de empresas/organismos públicos NO son datos personales (excepto autónomos)\n"
-        "5. FECHAS: 'Enero 2024' genérico no es sensible; '12/05/1985 (fecha nacimiento)' SÍ lo es\n\n"
-        
-        "# EJEMPLOS\n"
-        "- Factura con IBAN: {\"label\": \"IBAN\", \"value\": \"ES12 3456 7890 1234\", \"reason\": \"Cuenta bancaria - dato financiero protegido\", \"confidence\": \"high\"}\n"
-        "- Informe médico: {\"label\": \"Nombre paciente\", \"value\": \"María García\", \"reason\": \"Identidad en contexto sanitario - Art. 9 RGPD\", \"confidence\": \"high\"}\n"
-        "- Certificado censo: {\"label\": \"Composición familiar\", \"value\": \"5 personas empadronadas\", \"reason\": \"Estructura del hogar - dato censal\", \"confidence\": \"high\"}\n\n"
-        
-        "Responde EXCLUSIVAMENTE con un único objeto JSON que cumpla el siguiente esquema:\n"
-        "{\n"
-        '  "sensitive": [{"label": "...", "value": "...", "reason": "...", "confidence": "high|medium|low"}],\n'
-        '  "non_sensitive": []\n'
-        "}"
-    )
+    system_prompt = PDF_CLASSIFY_PROMPT
     response_format = {
         "type": "json_schema",
         "json_schema": {
@@ -1204,33 +1593,59 @@ def _ai_classify_sensitive(text: str, candidates: list[dict]):
         },
     }
 
-    total_chunks = (len(candidates) + chunk_size - 1) // chunk_size or 1
+    # Cada (etiqueta, valor) se clasifica una sola vez; la decisión se
+    # reparte después a todas sus apariciones
+    received = len(candidates)
+    candidates, occurrences = _dedupe_candidates(candidates)
+
     combined_sensitive: list[dict] = []
     combined_non_sensitive: list[dict] = []
     # Colección de trazas de depuración
     debug_traces: list[dict] = []
     
     supports_response_format = True
-    queue = deque()
+    # Las llamadas corren en hilos sin contexto de aplicación
+    logger = current_app.logger
+    estimator = token_budget.get_estimator()
+
+    def _item_output(item: dict) -> int:
+        return (
+            estimator.estimate(json.dumps(item, ensure_ascii=False), kind="output", model=model)
+            + token_budget.OUTPUT_ITEM_OVERHEAD
+        )
 
-    for chunk_index in range(total_chunks):
-        chunk = candidates[chunk_index * chunk_size : (chunk_index + 1) * chunk_size]
-        if not chunk:
-            continue
-        queue.append(
+    # Los trozos se dimensionan por tokens antes de llamar: la salida prevista
+    # cabe en max_tokens y la entrada (con el extracto más largo) en el contexto
+    fixed_input = (
+        estimator.estimate(system_prompt, model=model)
+        + estimator.estimate(_excerpt_text(text, limit=excerpt_candidates[0]), model=model)
+        + 2 * token_budget.MESSAGE_OVERHEAD
+    )
+    plans = token_budget.plan_calls(
+        candidates,
+        fixed_input=fixed_input,
+        item_input=lambda item: estimator.estimate(json.dumps(item, ensure_ascii=False), model=model),
+        item_output=_item_output,
+        max_items=chunk_size,
+        max_output=max_tokens,
+    )
+    # (ruta, trozo, info): la ruta (índice, mitad, mitad...) ordena la fusión
+    initial: list[tuple[tuple, list[dict], dict]] = [
+        (
+            (chunk_index,),
+            plan.items,
             {
-                "chunk": chunk,
-                "info": {
-                    "index": chunk_index + 1,
-                    "total": total_chunks,
-                    "size": len(chunk),
-                    "split_level": 0,
-                    "split_part": None,
-                },
-            }
+                "index": chunk_index + 1,
+                "total": len(plans),
+                "size": len(plan.items),
+                "split_level": 0,
+                "split_part": None,
+            },
         )
+        for chunk_index, plan in enumerate(plans)
+    ]
 
-    if not queue:
+    if not initial:
         return {"sensitive": [], "non_sensitive": [], "model": model, "debug": []}
 
     def _get_excerpt(limit: int) -> str:
@@ -1238,6 +1653,21 @@ def _ai_classify_sensitive(text: str, candidates: list[dict]):
             excerpt_cache[limit] = _excerpt_text(text, limit=limit)
         return excerpt_cache[limit]
 
+    # Posiciones de todos los candidatos, calculadas una vez: cada trozo
+    # recibe solo el texto que rodea a sus candidatos
+    positions = _candidate_positions(text, candidates)
+
+    def _chunk_context(chunk: list[dict], limit: int) -> tuple[str, str]:
+        spans = [
+            span
+            for item in chunk
+            for span in positions.get(_candidate_value_key(item["value"]), ())
+        ]
+        if not spans:
+            return "prefix", _get_excerpt(limit)
+        radius = max(40, min(PDF_AI_CONTEXT_CHARS, limit // (2 * len(spans))))
+        return "windows", _context_windows(text, spans, radius=radius, limit=limit)
+
     def _call_model(chunk: list[dict], chunk_info: dict, excerpt_text: str):
         nonlocal supports_response_format
         payload = {
@@ -1274,6 +1704,14 @@ def _ai_classify_sensitive(text: str, candidates: list[dict]):
             "error": None
         }
 
+        planned_input = (
+            estimator.estimate(system_prompt, model=model)
+            + estimator.estimate(user_prompt, model=model)
+            + 2 * token_budget.MESSAGE_OVERHEAD
+        )
+        planned_output = sum(_item_output(item) for item in chunk)
+        trace_entry["tokens"] = {"planned_input": planned_input, "planned_output": planned_output}
+
         content = None
         truncated = False
         
@@ -1306,11 +1744,19 @@ def _ai_classify_sensitive(text: str, candidates: list[dict]):
 
         trace_entry["output_raw"] = content
         trace_entry["finish_reason"] = choice.finish_reason if choice else None
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            trace_entry["tokens"]["input"] = usage.prompt_tokens
+            trace_entry["tokens"]["output"] = usage.completion_tokens
+            estimator.record("input", planned_input, usage.prompt_tokens)
+            # Una salida truncada solo dice que no cabía, no cuánto ocupaba
+            if not truncated:
+                estimator.record("output", planned_output, usage.completion_tokens)
         debug_traces.append(trace_entry)
 
         if not content:
             # Log detailed info to help diagnose empty responses
-            app.logger.error(
+            logger.error(
                 f"Empty content from model {model}. "
                 f"finish_reason={choice.finish_reason if choice else 'N/A'}, "
                 f"response={response}"
@@ -1325,82 +1771,108 @@ def _ai_classify_sensitive(text: str, candidates: list[dict]):
         sensitive_chunk, non_sensitive_chunk = _normalize_model_output(parsed)
         return sensitive_chunk, non_sensitive_chunk, truncated
 
-    while queue:
-        current = queue.popleft()
-        chunk = current["chunk"]
-        chunk_info = current["info"]
-        if not chunk:
-            continue
+    def _process(chunk: list[dict], chunk_info: dict):
+        """Clasifica un trozo reduciendo el contexto si la respuesta se trunca.
 
-        truncated = True
-        last_error = None
+        Devuelve (sensitive, non_sensitive) o ``None`` si sigue truncada con
+        el extracto más corto y hay que partir el trozo.
+        """
+        tried: set[str] = set()
         for limit in excerpt_candidates:
-            excerpt_text = _get_excerpt(limit)
-            try:
-                sensitive_chunk, non_sensitive_chunk, truncated = _call_model(chunk, {**chunk_info, "excerpt_limit": limit}, excerpt_text)
-                last_error = None
-            except RuntimeError as exc:
-                last_error = exc
-                truncated = False # Stop retrying limits if it's a runtime error not related to context length? 
-                                  # Actually, the original code treated RuntimeError as a break condition for the limit loop. 
-                                  # We keep it similar but ensuring traces are logged inside _call_model.
-                break
+            kind, context = _chunk_context(chunk, limit)
+            # Un contexto que ya cabía en un límite mayor no cambia al bajarlo
+            if context in tried:
+                continue
+            tried.add(context)
+            sensitive_chunk, non_sensitive_chunk, truncated = _call_model(
+                chunk, {**chunk_info, "excerpt_limit": limit, "context": kind}, context
+            )
             if not truncated:
-                combined_sensitive.extend(sensitive_chunk)
-                combined_non_sensitive.extend(non_sensitive_chunk)
-                break
-        else:
-            # Loop exhausted without break (still truncated for all limits)
-            truncated = True
+                return sensitive_chunk, non_sensitive_chunk
+        return None
 
-        if last_error:
-            raise last_error
+    # Trozos en paralelo; las mitades de un trozo truncado vuelven al mismo pool
+    results: dict[tuple, tuple[list[dict], list[dict]]] = {}
+    pending: dict = {}
+    pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="pdf-ai")
 
-        if truncated:
-            if len(chunk) <= 1:
-                raise RuntimeError(
-                    "La respuesta del modelo fue truncada incluso reduciendo el contexto. "
-                    "Reduce el tamaño del PDF o el número de candidatos para esta sección."
-                )
-            mid = len(chunk) // 2
-            left = chunk[:mid]
-            right = chunk[mid:]
-            split_level = chunk_info.get("split_level", 0) + 1
-            # Process left chunk first preserving order
-            if right:
-                queue.appendleft(
-                    {
-                        "chunk": right,
-                        "info": {
-                            **chunk_info,
-                            "size": len(right),
-                            "split_level": split_level,
-                            "split_part": "right",
-                        },
-                    }
-                )
-            if left:
-                queue.appendleft(
-                    {
-                        "chunk": left,
-                        "info": {
-                            **chunk_info,
-                            "size": len(left),
-                            "split_level": split_level,
-                            "split_part": "left",
-                        },
-                    }
-                )
-            continue
+    def _submit(path: tuple, chunk: list[dict], chunk_info: dict):
+        pending[pool.submit(_process, chunk, chunk_info)] = (path, chunk, chunk_info)
+
+    try:
+        for item in initial:
+            _submit(*item)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, chunk, chunk_info = pending.pop(future)
+                outcome = future.result()
+                if outcome is not None:
+                    results[path] = outcome
+                    if progress is not None:
+                        items = _fan_out_decisions(outcome[0], occurrences)
+                        progress(
+                            {
+                                "done": len(results),
+                                "total": len(results) + len(pending),
+                                "shard": chunk_info["index"] - 1,
+                                "found": len(items),
+                                "items": items,
+                            }
+                        )
+                    continue
+                if len(chunk) <= 1:
+                    raise RuntimeError(
+                        "La respuesta del modelo fue truncada incluso reduciendo el contexto. "
+                        "Reduce el tamaño del PDF o el número de candidatos para esta sección."
+                    )
+                mid = len(chunk) // 2
+                split_level = chunk_info.get("split_level", 0) + 1
+                for part, (name, half) in enumerate((("left", chunk[:mid]), ("right", chunk[mid:]))):
+                    _submit(
+                        path + (part,),
+                        half,
+                        {**chunk_info, "size": len(half), "split_level": split_level, "split_part": name},
+                    )
+    finally:
+        # Ante un error no se esperan ni lanzan los trozos pendientes
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # Orden del documento: por ruta (las mitades quedan donde estaba su trozo)
+    for path in sorted(results):
+        sensitive_chunk, non_sensitive_chunk = results[path]
+        combined_sensitive.extend(sensitive_chunk)
+        combined_non_sensitive.extend(non_sensitive_chunk)
 
     return {
-        "sensitive": combined_sensitive,
-        "non_sensitive": combined_non_sensitive,
+        "sensitive": _fan_out_decisions(combined_sensitive, occurrences),
+        "non_sensitive": _fan_out_decisions(combined_non_sensitive, occurrences),
         "model": model,
         "debug": debug_traces,
+        "dedup": {"candidates": received, "unique": len(candidates)},
     }
 
-@app.route("/api/pdf/redact", methods=["POST"])
+@routes.route("/api/pdf/extract", methods=["POST"])
+@login_required
+def api_pdf_extract():
+    """Texto y cajas de palabras del PDF subido (ver ``pdf_words``)."""
+    try:
+        import fitz  # noqa: F401  (PyMuPDF)
+    except ImportError:
+        return jsonify({"ok": False, "error": "PyMuPDF no está instalado en el servidor."}), 501
+
+    file = request.files.get("file")
+    if not file or file.filename == "":
+        return jsonify({"ok": False, "error": "No se recibió archivo PDF."}), 400
+    try:
+        extraction = pdf_words.extract(file.read())
+    except Exception as exc:
+        current_app.logger.warning("PDF extraction failed: %s", exc)
+        return jsonify({"ok": False, "error": f"No se pudo leer el PDF: {exc}"}), 400
+    return jsonify({"ok": True, **extraction})
+
+
+@routes.route("/api/pdf/redact", methods=["POST"])
 @login_required
 def api_pdf_redact():
     try:
@@ -1418,12 +1890,33 @@ def api_pdf_redact():
     except:
         redactions = []
 
+    # Términos a censurar: sus cajas salen de pdf_words, ya en coordenadas
+    # de PyMuPDF
+    try:
+        terms = json.loads(request.form.get('terms', '[]'))
+    except ValueError:
+        terms = None
+    if not isinstance(terms, list) or not all(isinstance(t, str) for t in terms):
+        return jsonify({"ok": False, "error": "'terms' debe ser una lista JSON de textos."}), 400
+
     if not file or file.filename == '':
         return jsonify({"ok": False, "error": "Archivo vacío."}), 400
 
     try:
         # Procesar en memoria
         pdf_bytes = file.read()
+        unmatched = []
+        if terms:
+            extraction = pdf_words.extract(pdf_bytes)
+            boxes, unmatched = pdf_words.boxes_for_terms(extraction, terms)
+            if not boxes and not redactions:
+                # Devolver el PDF tal cual parecería censurado sin serlo
+                return jsonify({
+                    "ok": False,
+                    "error": "No se encontraron coincidencias para los términos seleccionados.",
+                    "unmatched": unmatched,
+                }), 422
+            redactions = list(redactions) + [{**box, "origin": "top-left"} for box in boxes]
         doc = fitz.open(stream=pdf_bytes, filetype="pdf")
         
         for r in redactions:
@@ -1432,6 +1925,10 @@ def api_pdf_redact():
                 continue
                 
             page = doc[page_num]
+            if r.get('origin') == 'top-left':
+                # Cajas de /api/pdf/extract: mismas coordenadas que fitz
+                page.add_redact_annot(fitz.Rect(r['x0'], r['y0'], r['x1'], r['y1']), fill=(0, 0, 0))
+                continue
             # Coordenadas: [x, y, width, height] -> rect [x, y, x+w, y+h]
             # Nota: fitz usa coordenadas bottom-left? No, top-left standard.
             # pdf.js da [x, y, w, h] con y invertida a veces?
@@ -1473,36 +1970,25 @@ def api_pdf_redact():
         # Devolver archivo
         from io import BytesIO
         from flask import send_file
-        return send_file(
+        response = send_file(
             BytesIO(output_bytes),
             mimetype='application/pdf',
             as_attachment=True,
             download_name='documento_censurado_seguro.pdf'
         )
+        if unmatched:
+            # Términos que no aparecen en el PDF y por tanto siguen visibles
+            response.headers['X-Redact-Unmatched'] = json.dumps(unmatched)
+        return response
 
     except Exception as e:
-        app.logger.error(f"Error redacting PDF: {e}")
+        current_app.logger.error(f"Error redacting PDF: {e}")
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
-def _ai_extract_sensitive(text: str):
-    """
-    Simplified: sends text directly to AI to find all sensitive data.
-    No regex pre-filtering, no candidate lists.
-    """
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY no configurada en el servidor.")
-    try:
-        from openai import OpenAI
-    except Exception as exc:
-        raise RuntimeError(f"Dependencia openai no disponible: {exc}") from exc
-
-    client = OpenAI(api_key=api_key)
-    model = os.environ.get("PDF_AI_MODEL", "gpt-4o-mini")
-    
-    # System prompt focused on high recall for PDF redaction
-    system_prompt = """Eres un DPO experto en RGPD/LOPDGDD. Tu objetivo es MAXIMIZAR RECALL: detectar todos los datos personales que deben censurarse en un PDF.
+# System prompt focused on high recall for PDF redaction
+# (su hash forma parte de la clave de ai_cache: editarlo invalida la caché)
+PDF_EXTRACT_PROMPT = """Eres un DPO experto en RGPD/LOPDGDD. Tu objetivo es MAXIMIZAR RECALL: detectar todos los datos personales que deben censurarse en un PDF.
 
 ENTORNO DE USO
 Este aviso se utiliza en un SAAS: el usuario sube un archivo PDF, el sistema extrae el texto del PDF y lo manda a la API de OpenAI usando este aviso. La API devuelve los datos sensibles encontrados. Al pulsar otro botón, esos datos se ofuscan/censuran y se guarda un nuevo PDF.
@@ -1551,46 +2037,269 @@ REGLAS DE CALIDAD
 - "value" debe ser literal exacto del texto, sin inventar ni normalizar.
 - No incluyas contexto largo; solo el dato.
 - Incluye TODAS las ocurrencias, incluso entradas idénticas.
+- Los marcadores entre corchetes (p. ej. [Emails], [DNI/NIE]) ya están detectados: no los devuelvas.
 - Si no hay datos, responde: {"sensitive":[]}"""
 
-    # Truncate text if too long
-    max_text_length = int(os.environ.get("PDF_AI_MAX_TEXT", "8000"))
-    truncated_text = text[:max_text_length] if len(text) > max_text_length else text
-    if len(text) > max_text_length:
-        truncated_text += "\n... [TEXTO TRUNCADO]"
-    
-    user_prompt = f"Analiza este documento:\n\n{truncated_text}"
+
+PDF_AI_SHARD_OVERLAP = int(os.getenv("PDF_AI_SHARD_OVERLAP", "200"))
+_SENTENCE_END = re.compile(r"[.;:!?]\s")
+
+
+def _split_long(text: str, start: int, stop: int, size: int) -> list[tuple[int, int]]:
+    """Parte ``text[start:stop]`` en tramos de hasta ``size``: por frases o, si no, por palabras."""
+    spans: list[tuple[int, int]] = []
+    while stop - start > size:
+        limit = start + size
+        ends = [m.end() for m in _SENTENCE_END.finditer(text, start, limit)]
+        cut = ends[-1] if ends else text.rfind(" ", start, limit) + 1
+        if cut <= start:
+            cut = limit
+        spans.append((start, cut))
+        start = cut
+    spans.append((start, stop))
+    return spans
+
+
+def _shard_text(text: str, size: int, overlap: int = PDF_AI_SHARD_OVERLAP) -> list[tuple[int, str]]:
+    """Divide ``text`` en trozos de unos ``size`` caracteres alineados a líneas.
+
+    El visor une cada página con un salto de línea, así que los cortes caen
+    entre páginas (o párrafos); una línea más larga que ``size`` se parte por
+    frases. Cada trozo repite al principio los últimos ``overlap`` caracteres
+    del anterior para no perder datos partidos por el corte. Devuelve pares
+    (posición en ``text``, trozo).
+    """
+    if len(text) <= size:
+        return [(0, text)]
+    units: list[tuple[int, int]] = []
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        units.extend(_split_long(text, pos, pos + len(line), size))
+        pos += len(line)
+
+    shards: list[tuple[int, str]] = []
+    start = end = 0
+    fresh = False  # el trozo actual tiene algo más que el solape
+    for unit_start, unit_end in units:
+        if fresh and unit_end - start > size:
+            shards.append((start, text[start:end]))
+            start = max(end - overlap, start + 1)
+            if not text[start - 1].isspace():
+                space = text.find(" ", start, end)
+                start = space + 1 if space >= 0 else start
+            fresh = False
+        end = unit_end
+        fresh = True
+    shards.append((start, text[start:end]))
+    return shards
+
+
+def _merge_shard_findings(shards: list[tuple[int, str]], found: list[list[dict]]) -> list[tuple[int, dict]]:
+    """Fusiona los hallazgos de los trozos en orden del documento.
+
+    Cada hallazgo se sitúa en su trozo (la siguiente aparición de su valor no
+    usada todavía) y se deduplica por (valor, posición absoluta): lo que cae
+    en el solapamiento de dos trozos cuenta una vez y las apariciones
+    distintas de un mismo valor se mantienen todas. Devuelve pares (posición
+    absoluta, hallazgo); los valores no literales toman el final de su trozo.
+    """
+    located: dict[tuple, tuple[int, int, dict]] = {}
+    for index, ((offset, shard), items) in enumerate(zip(shards, found)):
+        lowered = shard.casefold() if len(shard.casefold()) == len(shard) else None
+        cursors: dict[str, int] = {}
+        for order, item in enumerate(items):
+            value = str(item.get("value", ""))
+            needle = value.casefold()
+            pos = -1
+            if lowered is not None and needle:
+                pos = lowered.find(needle, cursors.get(needle, 0))
+            if pos >= 0:
+                cursors[needle] = pos + len(needle)
+                key = (needle, offset + pos)
+                sort_key = (offset + pos, 0)
+            else:
+                # Valor no literal (el modelo lo ha normalizado): por trozo
+                key = (needle, str(item.get("label", "")).casefold(), index, order)
+                sort_key = (offset + len(shard), order)
+            if key not in located:
+                located[key] = (*sort_key, item)
+    return [(pos, item) for pos, _, item in sorted(located.values(), key=lambda entry: entry[:2])]
+
+
+def _ai_extract_sensitive(text: str, progress=None):
+    """
+    Simplified: sends text directly to AI to find all sensitive data.
+    No regex pre-filtering, no candidate lists.
+
+    Los resultados se guardan en ai_cache: el mismo texto con el mismo
+    modelo, prompt y ajustes no vuelve a llamar al modelo.
+
+    Antes, pii_rules detecta en una pasada los datos de formato verificable
+    (email, DNI/NIE, IBAN, teléfono...): se devuelven directamente y se
+    enmascaran en el texto enviado, así el modelo solo decide lo ambiguo.
+
+    Los documentos largos no se recortan: se dividen en trozos de
+    ``PDF_AI_MAX_TEXT`` caracteres con ``PDF_AI_SHARD_OVERLAP`` de solape,
+    que se analizan en paralelo (``PDF_AI_MAX_CONCURRENCY``). ``progress``,
+    si se indica, recibe un dict ``{"done", "total", "shard", "found",
+    "items"}`` antes de empezar (``shard`` None, con lo detectado por reglas)
+    y al terminar cada trozo (con lo que ha encontrado ese trozo).
+
+    Con ``PDF_AI_MODE=candidates`` no se envía el texto: las coincidencias
+    ambiguas de pii_rules pasan a :func:`_ai_classify_sensitive`, que las
+    deduplica y manda cada trozo de candidatos con el texto que los rodea.
+    Es más barato en documentos largos, pero el modelo solo ve lo que las
+    reglas han encontrado (y lo que haya alrededor).
+    """
+    model = os.environ.get("PDF_AI_MODEL", "gpt-4o-mini")
+    max_text_length = max(500, int(os.environ.get("PDF_AI_MAX_TEXT", "8000")))
+    overlap = max(0, min(PDF_AI_SHARD_OVERLAP, max_text_length // 4))
+    try:
+        max_concurrency = int(os.environ.get("PDF_AI_MAX_CONCURRENCY", "6"))
+    except ValueError:
+        max_concurrency = 6
+    max_concurrency = max(1, min(max_concurrency, 16))
+    use_rules = os.environ.get("PDF_AI_RULES", "1").strip().lower() not in ("0", "false", "off", "no")
+    candidate_mode = os.environ.get("PDF_AI_MODE", "text").strip().lower() == "candidates"
+    settings = {
+        "max_text": max_text_length,
+        "overlap": overlap,
+        "rules": pii_rules.RULES_VERSION if use_rules else None,
+    }
+    if candidate_mode:
+        settings["mode"] = "candidates"
+    cache = ai_cache.get_cache()
+    key = ai_cache.cache_key(
+        text,
+        model=model,
+        prompt=PDF_CLASSIFY_PROMPT if candidate_mode else PDF_EXTRACT_PROMPT,
+        settings=settings,
+    )
+    t0 = time.perf_counter()
+    cached = cache.get(key)
+    if cached is not None:
+        if progress is not None:
+            progress({"done": 1, "total": 1, "shard": None, "found": len(cached), "items": cached})
+        return {
+            "sensitive": cached,
+            "non_sensitive": [],
+            "model": model,
+            "cached": True,
+            "debug": [{"cache": "hit", "key": key, "ms": round((time.perf_counter() - t0) * 1000, 2)}],
+        }
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY no configurada en el servidor.")
+    try:
+        from openai import OpenAI
+    except Exception as exc:
+        raise RuntimeError(f"Dependencia openai no disponible: {exc}") from exc
+
+    rule_findings: list[dict] = []
+    model_text = text
+    if use_rules:
+        sure, ambiguous = pii_rules.split(pii_rules.scan(text))
+        rule_findings = pii_rules.as_findings(sure)
+        model_text = pii_rules.mask(text, sure)
+        chars_masked = sum(m.end - m.start for m in sure)
+
+    if candidate_mode:
+        candidates = [
+            {"label": m.label, "value": m.value}
+            for m in (ambiguous if use_rules else pii_rules.scan(text))
+        ]
+        if progress is not None:
+            progress({"done": 0, "total": 1, "shard": None, "found": len(rule_findings), "items": rule_findings})
+        classified = _ai_classify_sensitive(model_text, candidates, progress=progress)
+        sensitive = rule_findings + classified["sensitive"]
+        debug_trace = {
+            "timestamp": datetime.now().isoformat(),
+            "model": model,
+            "text_length": len(text),
+            "mode": "candidates",
+            "dedup": classified.get("dedup", {"candidates": 0, "unique": 0}),
+            "ms": round((time.perf_counter() - t0) * 1000, 2),
+        }
+        if use_rules:
+            debug_trace["rules"] = {"confident": len(rule_findings), "chars_masked": chars_masked}
+        cache.put(key, sensitive, model=model)
+        return {
+            "sensitive": sensitive,
+            "non_sensitive": [],
+            "model": model,
+            "cached": False,
+            "debug": [debug_trace, *classified["debug"]],
+        }
+
+    client = OpenAI(api_key=api_key)
+    system_prompt = PDF_EXTRACT_PROMPT
+    max_tokens = _pdf_ai_max_output_tokens()
+    shards = _shard_text(model_text, max_text_length, overlap)
+    estimator = token_budget.get_estimator()
+    system_tokens = estimator.estimate(system_prompt, model=model) + 2 * token_budget.MESSAGE_OVERHEAD
     
     debug_trace = {
         "timestamp": datetime.now().isoformat(),
         "model": model,
         "text_length": len(text),
-        "input_system": system_prompt,
-        "input_user": user_prompt[:500] + "..." if len(user_prompt) > 500 else user_prompt,
-        "output_raw": None,
+        "shards": len(shards),
+        "shard_size": max_text_length,
+        "shard_overlap": overlap,
         "error": None
     }
-    
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0,
-            max_tokens=4000,
-            response_format={"type": "json_object"}
-        )
-        content = response.choices[0].message.content
-        debug_trace["output_raw"] = content
-        
-        if not content:
-            raise RuntimeError("El modelo devolvió una respuesta vacía")
-        
-        data = json.loads(content)
+    if use_rules:
+        debug_trace["rules"] = {
+            "confident": len(rule_findings),
+            "ambiguous": len(ambiguous),
+            "chars_masked": chars_masked,
+        }
+
+    def _analyze_shard(index: int, shard: str) -> tuple[list[dict], dict]:
+        header = f"Analiza este documento (parte {index + 1} de {len(shards)}):" if len(shards) > 1 else "Analiza este documento:"
+        user_prompt = f"{header}\n\n{shard}"
+        shard_trace = {
+            "shard": index + 1,
+            "input_system": system_prompt,
+            "input_user": user_prompt[:500] + "..." if len(user_prompt) > 500 else user_prompt,
+            "output_raw": None,
+            "error": None,
+        }
+        # Cada trozo es una llamada: solo se prevé la entrada (la salida depende
+        # de lo que encuentre el modelo) y se calibra con ``usage``
+        planned_input = system_tokens + estimator.estimate(user_prompt, model=model)
+        shard_trace["tokens"] = {"planned_input": planned_input}
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=0,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"}
+            )
+            content = response.choices[0].message.content
+            shard_trace["output_raw"] = content
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                shard_trace["tokens"]["input"] = usage.prompt_tokens
+                shard_trace["tokens"]["output"] = usage.completion_tokens
+                estimator.record("input", planned_input, usage.prompt_tokens)
+
+            if not content:
+                raise RuntimeError("El modelo devolvió una respuesta vacía")
+
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            shard_trace["error"] = f"JSON inválido: {e}"
+            raise RuntimeError(f"Respuesta JSON inválida del modelo: {e}") from e
+        except Exception as exc:
+            shard_trace["error"] = str(exc)
+            raise RuntimeError(f"Error al analizar con IA: {exc}") from exc
+
         sensitive = data.get("sensitive", [])
-        
         # Ensure required fields
         for item in sensitive:
             if "label" not in item:
@@ -1599,23 +2308,63 @@ REGLAS DE CALIDAD
                 item["reason"] = "Dato personal identificado"
             if "confidence" not in item:
                 item["confidence"] = "high"
-        
-        return {
-            "sensitive": sensitive,
-            "non_sensitive": [],
-            "model": model,
-            "debug": [debug_trace]
-        }
-        
-    except json.JSONDecodeError as e:
-        debug_trace["error"] = f"JSON inválido: {e}"
-        raise RuntimeError(f"Respuesta JSON inválida del modelo: {e}") from e
-    except Exception as exc:
-        debug_trace["error"] = str(exc)
-        raise RuntimeError(f"Error al analizar con IA: {exc}") from exc
+        # El modelo no repite los marcadores de lo ya detectado por reglas
+        sensitive = [
+            item for item in sensitive
+            if not re.fullmatch(r"\[[^\]]+\]", str(item.get("value", "")).strip())
+        ]
+        return sensitive, shard_trace
+
+    if progress is not None:
+        progress({"done": 0, "total": len(shards), "shard": None, "found": len(rule_findings), "items": rule_findings})
+
+    # Trozos en paralelo; un fallo cancela los pendientes
+    found: list[list[dict]] = [[] for _ in shards]
+    traces: list[dict] = [{} for _ in shards]
+    pool = ThreadPoolExecutor(max_workers=min(max_concurrency, len(shards)), thread_name_prefix="pdf-ai")
+    try:
+        futures = {pool.submit(_analyze_shard, i, shard): i for i, (_, shard) in enumerate(shards)}
+        done = 0
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                found[index], traces[index] = future.result()
+            except RuntimeError as exc:
+                debug_trace["error"] = f"parte {index + 1}: {exc}"
+                raise
+            done += 1
+            if progress is not None:
+                progress(
+                    {
+                        "done": done,
+                        "total": len(shards),
+                        "shard": index,
+                        "found": len(found[index]),
+                        "items": found[index],
+                    }
+                )
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # Reglas y modelo en orden del documento: las posiciones del modelo son
+    # del texto enmascarado
+    positioned = [(m.start, item) for m, item in zip(sure, rule_findings)] if use_rules else []
+    to_original = pii_rules.unmasker(sure) if use_rules else (lambda pos: pos)
+    positioned += [(to_original(pos), item) for pos, item in _merge_shard_findings(shards, found)]
+    sensitive = [item for _, item in sorted(positioned, key=lambda entry: entry[0])]
+    debug_trace["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+
+    cache.put(key, sensitive, model=model)
+    return {
+        "sensitive": sensitive,
+        "non_sensitive": [],
+        "model": model,
+        "cached": False,
+        "debug": [debug_trace, *traces],
+    }
 
 
-@app.route("/api/pdf/analyze", methods=["POST"])
+@routes.route("/api/pdf/analyze", methods=["POST"])
 @login_required
 def api_pdf_analyze():
     payload = request.get_json(silent=True) or {}
@@ -1627,16 +2376,110 @@ def api_pdf_analyze():
     try:
         result = _ai_extract_sensitive(text)
     except RuntimeError as exc:
-        app.logger.warning("AI extraction failed: %s", exc)
+        current_app.logger.warning("AI extraction failed: %s", exc)
         return jsonify({"ok": False, "error": str(exc)}), 503
     except Exception as exc:
-        app.logger.error("AI extraction failed (unexpected): %s", exc, exc_info=True)
+        current_app.logger.error("AI extraction failed (unexpected): %s", exc, exc_info=True)
         return jsonify({"ok": False, "error": f"Error inesperado: {type(exc).__name__}: {str(exc)}"}), 500
     
     return jsonify({"ok": True, **result})
 
 
-@app.route("/api/pdf/chat", methods=["POST"])
+@routes.route("/api/pdf/jobs", methods=["POST"])
+@login_required
+def api_pdf_job_submit():
+    """Encola el análisis IA del texto y devuelve el id del trabajo al momento."""
+    payload = request.get_json(silent=True) or {}
+    text = (payload.get("text") or "").strip()
+    if not text:
+        return jsonify({"ok": False, "error": "El texto del PDF es obligatorio."}), 400
+    try:
+        job_id = pdf_jobs.get_runner(current_app).submit(current_user.id, text)
+    except pdf_jobs.TooManyJobs as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 429
+    return (
+        jsonify({"ok": True, "job_id": job_id, "status_url": url_for("api_pdf_job_status", job_id=job_id)}),
+        202,
+    )
+
+
+@routes.route("/api/pdf/jobs/<job_id>", methods=["GET"])
+@login_required
+def api_pdf_job_status(job_id):
+    """Estado, progreso por trozos y resultados (parciales o finales) del trabajo."""
+    job = pdf_jobs.get_runner(current_app).get(job_id, current_user.id)
+    if job is None:
+        return jsonify({"ok": False, "error": "Trabajo no encontrado."}), 404
+    return jsonify({"ok": True, **job})
+
+
+@routes.route("/api/pdf/jobs/<job_id>/events", methods=["GET"])
+@login_required
+def api_pdf_job_events(job_id):
+    """Server-Sent Events del trabajo: progreso y hallazgos según llegan."""
+    runner = pdf_jobs.get_runner(current_app)
+    if runner.get(job_id, current_user.id) is None:
+        return jsonify({"ok": False, "error": "Trabajo no encontrado."}), 404
+    try:
+        cursor = int(request.headers.get("Last-Event-ID") or request.args.get("cursor") or 0)
+    except ValueError:
+        cursor = 0
+    if not runner.open_stream():
+        # Sin hueco para otro stream en este worker: el cliente consulta el estado
+        return (
+            jsonify({"ok": False, "error": "Demasiadas conexiones abiertas; consulta el estado.", "poll": True}),
+            503,
+            {"Retry-After": "2"},
+        )
+    response = current_app.response_class(
+        runner.events(job_id, current_user.id, cursor=max(0, cursor)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(runner.close_stream)
+    return response
+
+
+@routes.route("/admin/pdf-cache", methods=["GET"])
+@login_required
+@admin_required
+def admin_pdf_cache_stats():
+    """Aciertos/fallos y ocupación de la caché de análisis IA (todos los workers)."""
+    return jsonify({"ok": True, **ai_cache.get_cache().stats()})
+
+
+@routes.route("/admin/pdf-cache/purge", methods=["POST"])
+@login_required
+@admin_required
+def admin_pdf_cache_purge():
+    """Vacía la caché de análisis IA; ``model`` limita el borrado a un modelo."""
+    payload = request.get_json(silent=True) or {}
+    model = (payload.get("model") or request.form.get("model") or "").strip() or None
+    removed = ai_cache.get_cache().purge(model=model)
+    current_app.logger.info("PDF AI cache purged by %s: %d entries (model=%s)", current_user.email, removed, model)
+    return jsonify({"ok": True, "removed": removed})
+
+
+@routes.route("/admin/readyz", methods=["GET"])
+@login_required
+@admin_required
+def admin_readiness():
+    """Detalle de ``/readyz``: errores, revisiones y reintentos por BD bloqueada."""
+    from health import readiness
+
+    body, status = readiness()
+    return jsonify(body), status
+
+
+@routes.route("/admin/pdf-tokens", methods=["GET"])
+@login_required
+@admin_required
+def admin_pdf_token_stats():
+    """Tokens previstos frente a reales y factor de calibración (este worker)."""
+    return jsonify({"ok": True, **token_budget.get_estimator().stats()})
+
+
+@routes.route("/api/pdf/chat", methods=["POST"])
 @login_required
 def api_pdf_chat():
     """Chat endpoint to ask AI about its detection decisions."""
@@ -1710,11 +2553,11 @@ Sé conciso y útil. Si el usuario pregunta por un dato específico que no detec
         })
         
     except Exception as exc:
-        app.logger.error(f"Chat error: {exc}")
+        current_app.logger.error(f"Chat error: {exc}")
         return jsonify({"ok": False, "error": str(exc)}), 500
 
 
-@app.route("/requests")
+@routes.route("/requests")
 @login_required
 def requests_page():
     return render_template("requests.html")
@@ -1735,7 +2578,7 @@ def _is_approver_for(approver: User, target: User) -> bool:
     return False
 
 
-@app.route("/absences", methods=["GET"])
+@routes.route("/absences", methods=["GET"])
 @login_required
 def absences_page():
     db = SessionLocal()
@@ -1744,38 +2587,21 @@ def absences_page():
 
         pending_for_me = []
         if current_user.role in (Role.admin, Role.rrhh, Role.responsable, Role.cap_area):
-            user_ids = set()
-            if current_user.role in (Role.admin, Role.rrhh):
-                user_ids.update(db.execute(select(User.id)).scalars().all())
-            elif current_user.role == Role.responsable and current_user.group_id:
-                user_ids.update(
-                    db.execute(select(User.id).where(User.group_id == current_user.group_id)).scalars().all()
-                )
-            elif current_user.role == Role.cap_area and current_user.area_id:
-                user_ids.update(
-                    db.execute(select(User.id).where(User.area_id == current_user.area_id)).scalars().all()
-                )
-            user_ids.update(
-                db.execute(select(User.id).where(User.supervisor_id == current_user.id)).scalars().all()
-            )
-            if user_ids:
-                pending_for_me = db.execute(
-                    select(Absence)
-                    .where(Absence.user_id.in_(list(user_ids)), Absence.status == EntryStatus.pending)
-                    .order_by(Absence.date_from.desc())
-                ).scalars().all()
-                pending_for_me = [
-                    absence
-                    for absence in pending_records
-                    if absence.can_be_validated_by(current_user)
-                ]
+            # Conjunto de usuarios aprobables precalculado: pertenencia en vez de
+            # evaluar can_be_validated_by fila a fila
+            scope = viewer_scope(db, current_user)
+            q = select(Absence).where(Absence.status == EntryStatus.pending)
+            if scope.approve is not None:
+                q = q.where(Absence.user_id.in_(list(scope.approve) or [-1]))
+            pending_for_me = db.execute(q.order_by(Absence.date_from.desc())).scalars().all()
 
         return render_template("absences.html", mine=mine, pending=pending_for_me)
     finally:
         db.close()
 
 
-@app.route("/absences/create", methods=["POST"])
+@routes.route("/absences/create", methods=["POST"])
+@retry_on_busy
 @login_required
 def absences_create():
     a_type = (request.form.get("type") or "").strip().lower()
@@ -1803,7 +2629,8 @@ def absences_create():
     return redirect(url_for("absences_page"))
 
 
-@app.route("/absences/<int:abs_id>/approve", methods=["POST"])
+@routes.route("/absences/<int:abs_id>/approve", methods=["POST"])
+@retry_on_busy
 @login_required
 def absences_approve(abs_id):
     db = SessionLocal()
@@ -1821,7 +2648,8 @@ def absences_approve(abs_id):
         db.close()
 
 
-@app.route("/absences/<int:abs_id>/reject", methods=["POST"])
+@routes.route("/absences/<int:abs_id>/reject", methods=["POST"])
+@retry_on_busy
 @login_required
 def absences_reject(abs_id):
     db = SessionLocal()
@@ -1839,7 +2667,7 @@ def absences_reject(abs_id):
         db.close()
 
 
-@app.route("/requests/adelanto", methods=["GET", "POST"])
+@routes.route("/requests/adelanto", methods=["GET", "POST"])
 @login_required
 def advance_request():
     if request.method == "POST":
@@ -1868,7 +2696,7 @@ def advance_request():
     return render_template("advance.html")
 
 
-@app.route("/info")
+@routes.route("/info")
 @login_required
 def info_page():
     return render_template("info.html")
@@ -1876,7 +2704,7 @@ def info_page():
 
 
 
-@app.route("/firmas")
+@routes.route("/firmas")
 @login_required
 def firmas_page():
     defaults = {
@@ -2268,7 +3096,7 @@ def firmas_page():
     )
 
 
-@app.route("/cementerio", methods=["GET", "POST"])
+@routes.route("/cementerio", methods=["GET", "POST"])
 @login_required
 def cementerio_page():
     first_names = [
@@ -2325,14 +3153,27 @@ def cementerio_page():
     return render_template("cementerio.html", result=result, last_dni=dni)
 
 
-@app.route("/schedules")
+@routes.route("/schedules")
 @login_required
 def schedules_page():
     # Demo: cuadrante semanal vacío (Lunes a Domingo)
     return render_template('weekly.html')
 
 
-@app.route("/time-info")
+def _fmt_session_pair(session: WorkSession, start_hms: str, end_hms: str) -> str:
+    """'HH:MM → HH:MM' local a partir de las horas ya formateadas por lotes
+    ('' si falta el extremo); '?' marca el extremo que falta."""
+    start = start_hms[:5] or '?'
+    if end_hms:
+        end = end_hms[:5]
+    elif session.kind == SessionKind.open:
+        end = '…'
+    else:
+        end = '?'
+    return f"{start} → {end}"
+
+
+@routes.route("/time-info")
 @login_required
 def time_info_page():
     # Mueve el informe mensual de fichajes aquí
@@ -2342,39 +3183,60 @@ def time_info_page():
         year = now.astimezone(TZ).year
         start_year = datetime(year, 1, 1, 0, 0, 0, tzinfo=TZ).astimezone(timezone.utc)
         end_year = datetime(year, 12, 31, 23, 59, 59, tzinfo=TZ).astimezone(timezone.utc)
+        # Margen hacia atrás para emparejar turnos que empezaron el año anterior.
+        lookback = timedelta(hours=DEFAULT_MAX_SESSION_HOURS)
         rows = db.execute(
-            select(Attendance)
+            select(Attendance.ts, Attendance.action)
             .where(
                 Attendance.user_id == current_user.id,
-                Attendance.ts >= start_year,
+                Attendance.ts >= start_year - lookback,
                 Attendance.ts <= end_year,
             )
             .order_by(Attendance.ts)
-        ).scalars().all()
-
-        by_day = {}
-        for r in rows:
-            ts_local = ensure_aware_utc(r.ts).astimezone(TZ)
-            d = ts_local.date()
-            by_day.setdefault(d, []).append((ts_local, r.action))
+        ).all()
+        pause_rows = db.execute(
+            select(Pause.start_ts, Pause.end_ts)
+            .where(
+                Pause.user_id == current_user.id,
+                Pause.start_ts >= start_year - lookback,
+                Pause.start_ts <= end_year,
+            )
+            .order_by(Pause.start_ts)
+        ).all()
+
+        # No hay asignación de WorkSchedulePolicy a usuarios: sin night_shift
+        # un turno que cruza la medianoche se reparte entre los dos días.
+        sessions = list(pair_sessions(
+            rows,
+            pause_rows,
+            tz=TZ,
+            user_id=current_user.id,
+            now=now,
+        ))
+        worked_on = worked_by_day(sessions)
+        # Horas locales de todas las sesiones en un solo lote (tzbatch)
+        starts = format_local_many(TZ, (s.start for s in sessions), missing='', with_date=False)
+        ends = format_local_many(TZ, (s.end for s in sessions), missing='', with_date=False)
+        pairs_by_day = {}
+        for s, start_hms, end_hms in zip(sessions, starts, ends):
+            pairs_by_day.setdefault(s.workday, []).append(_fmt_session_pair(s, start_hms, end_hms))
 
         # Approved vacation days: expected hours should be 0
         vac_days = set()
         vacs = db.execute(
-            select(Absence)
+            select(Absence.date_from, Absence.date_to)
             .where(
                 Absence.user_id == current_user.id,
                 Absence.status == EntryStatus.approved,
                 func.lower(Absence.type) == 'vacaciones'
             )
-        ).scalars().all()
-        for a in vacs:
-            a_start_local = ensure_aware_utc(a.date_from).astimezone(TZ).date()
-            a_end_local = ensure_aware_utc(a.date_to).astimezone(TZ).date()
+        ).all()
+        vac_from = local_days_many(TZ, (a.date_from for a in vacs))
+        vac_to = local_days_many(TZ, (a.date_to for a in vacs))
+        for a_start_local, a_end_local in zip(vac_from, vac_to):
             cur = a_start_local
             while cur <= a_end_local:
                 vac_days.add(cur)
-                from datetime import timedelta
                 cur = cur + timedelta(days=1)
 
         import calendar
@@ -2389,19 +3251,8 @@ def time_info_page():
                 from datetime import date as date_cls
                 d = date_cls(year, month, day)
                 weekday = d.weekday()
-                entries = by_day.get(d, [])
-                pair_strs = []
-                worked = 0
-                last_in = None
-                for ts, act in entries:
-                    if act == AttendanceAction._in and last_in is None:
-                        last_in = ts
-                    elif act == AttendanceAction._out and last_in is not None:
-                        delta = (ts - last_in).total_seconds()
-                        if delta > 0:
-                            worked += int(delta)
-                            pair_strs.append(f"{last_in.strftime('%H:%M')} → {ts.strftime('%H:%M')}")
-                        last_in = None
+                pair_strs = pairs_by_day.get(d, [])
+                worked = worked_on.get(d, 0)
                 expected = 27000 if weekday < 5 else 0
                 if d in vac_days:
                     expected = 0
@@ -2429,7 +3280,7 @@ def time_info_page():
         db.close()
 
 
-@app.route("/documents")
+@routes.route("/documents")
 @login_required
 def documents_page():
     # Demo: categorías típicas de documentos RRHH
@@ -2442,7 +3293,8 @@ def documents_page():
     return render_template("documents.html", categories=categories)
 
 
-@app.route("/profile", methods=["GET", "POST"])
+@routes.route("/profile", methods=["GET", "POST"])
+@retry_on_busy
 @login_required
 def profile_page():
     db = SessionLocal()
@@ -2484,7 +3336,8 @@ def _fmt_hms(seconds: int) -> str:
     return f"{h:02d}:{m:02d}:{s:02d}"
 
 
-@app.route("/pause", methods=["POST"])
+@routes.route("/pause", methods=["POST"])
+@retry_on_busy
 @login_required
 def toggle_pause():
     db = SessionLocal()
@@ -2520,24 +3373,15 @@ def toggle_pause():
         # Recalcular total del día EXCLUYENDO pausas activas
         day_start_utc, day_end_utc = local_day_bounds_utc(now)
         pauses = db.execute(
-            select(Pause)
+            select(Pause.start_ts, Pause.end_ts)
             .where(
                 Pause.user_id == current_user.id,
                 Pause.start_ts <= day_end_utc,
                 Pause.end_ts.is_not(None),
                 Pause.end_ts >= day_start_utc,
             )
-        ).scalars().all()
-        total_secs_today = 0
-        for p in pauses:
-            if not p.end_ts:
-                continue
-            p_start = ensure_aware_utc(p.start_ts)
-            p_end = ensure_aware_utc(p.end_ts)
-            start = max(p_start, day_start_utc)
-            end = min(p_end, day_end_utc)
-            if end > start:
-                total_secs_today += int((end - start).total_seconds())
+        ).all()
+        total_secs_today = pause_seconds_between(pauses, day_start_utc, day_end_utc)
 
         return render_template(
             "_pause.html",
@@ -2550,7 +3394,7 @@ def toggle_pause():
     finally:
         db.close()
 
-@app.route("/time")
+@routes.route("/time")
 @login_required
 def server_time():
     # Devolver el mismo span con atributos HTMX para que siga auto-actualizándose
@@ -2574,4 +3418,6 @@ if __name__ == "__main__":
         use_reloader = forced.strip().lower() in ("1", "true", "on", "yes")
     else:
         use_reloader = (sys.gettrace() is None)
-    app.run(debug=debug, use_reloader=use_reloader)
+    # En desarrollo se inicializa la BD al arrancar; en producción es un paso aparte
+    init_db_with_demo()
+    create_app().run(debug=debug, use_reloader=use_reloader)
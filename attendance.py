@@ -0,0 +1,272 @@
+"""Motor de emparejamiento de fichajes entrada/salida.
+
+Consume un flujo ordenado de eventos (fichajes y pausas) de un usuario en una
+sola pasada y produce registros tipados de sesión. La memoria es O(1) por
+usuario: solo se guarda la sesión abierta en curso.
+"""
+
+import enum
+import heapq
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Iterator, Optional
+
+
+# Una sesión más larga que esto se considera un olvido de salida.
+DEFAULT_MAX_SESSION_HOURS = 16
+
+
+class SessionKind(str, enum.Enum):
+    closed = "closed"            # entrada y salida emparejadas
+    open = "open"                # entrada reciente sin salida todavía
+    missing_out = "missing_out"  # entrada sin salida (olvido)
+    missing_in = "missing_in"    # salida sin entrada previa
+
+
+@dataclass(frozen=True, slots=True)
+class WorkSession:
+    """Tramo de trabajo atribuido a un día local.
+
+    ``start``/``end`` son datetimes conscientes en UTC; cualquiera de los dos
+    puede ser ``None`` en sesiones incompletas. Una sesión que cruza la
+    medianoche sin turno nocturno se emite como dos tramos con ``split=True``.
+    """
+
+    user_id: Optional[int]
+    kind: SessionKind
+    workday: date
+    start: Optional[datetime]
+    end: Optional[datetime]
+    worked_seconds: int = 0
+    pause_seconds: int = 0
+    split: bool = False
+
+
+def _aware_utc(ts: datetime) -> datetime:
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def _action_value(action) -> str:
+    return getattr(action, "value", action)
+
+
+def _next_local_midnight(ts_utc: datetime, tz) -> datetime:
+    local = ts_utc.astimezone(tz)
+    nxt = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    # Normaliza el offset (DST) reconstruyendo la hora local en la zona.
+    nxt = datetime(nxt.year, nxt.month, nxt.day, tzinfo=tz)
+    return nxt.astimezone(timezone.utc)
+
+
+def _overlap(a0: datetime, a1: datetime, b0: datetime, b1: datetime) -> int:
+    start = max(a0, b0)
+    end = min(a1, b1)
+    if end <= start:
+        return 0
+    return int((end - start).total_seconds())
+
+
+class _OpenSession:
+    __slots__ = ("start", "midnight", "pause_before", "pause_after", "pending")
+
+    def __init__(self, start: datetime, midnight: datetime):
+        self.start = start
+        self.midnight = midnight
+        # Segundos de pausa antes/después de la medianoche local.
+        self.pause_before = 0
+        self.pause_after = 0
+        # Última pausa vista: es la única que puede prolongarse tras la salida,
+        # porque las pausas de un usuario no se solapan entre sí.
+        self.pending: Optional[tuple[datetime, Optional[datetime]]] = None
+
+    def absorb(self, p_start: datetime, p_end: datetime) -> None:
+        self.pause_before += _overlap(self.start, self.midnight, p_start, p_end)
+        self.pause_after += _overlap(self.midnight, p_end, p_start, p_end)
+
+    def add_pause(self, p_start: datetime, p_end: Optional[datetime]) -> None:
+        if self.pending is not None:
+            pend_start, pend_end = self.pending
+            # Una pausa activa termina como tarde al empezar la siguiente.
+            self.absorb(pend_start, pend_end if pend_end is not None else p_start)
+        self.pending = (p_start, p_end)
+
+
+def pair_sessions(
+    events: Iterable[tuple[datetime, object]],
+    pauses: Iterable[tuple[datetime, Optional[datetime]]] = (),
+    *,
+    tz=timezone.utc,
+    user_id: Optional[int] = None,
+    night_shift: bool = False,
+    max_session_hours: float = DEFAULT_MAX_SESSION_HOURS,
+    now: Optional[datetime] = None,
+) -> Iterator[WorkSession]:
+    """Empareja fichajes de un usuario y produce ``WorkSession`` en orden.
+
+    ``events`` son tuplas ``(ts, action)`` ordenadas por ``ts`` (``action`` es
+    ``AttendanceAction`` o ``"in"``/``"out"``); ``pauses`` son tuplas
+    ``(start_ts, end_ts)`` ordenadas por inicio, con ``end_ts=None`` si la
+    pausa sigue activa. Reglas:
+
+    - Entradas duplicadas dentro de la ventana máxima se ignoran (gana la
+      primera); fuera de ella la sesión previa se cierra como ``missing_out``.
+    - Una salida sin entrada abierta se emite como ``missing_in``.
+    - Con ``night_shift`` (``WorkSchedulePolicy.is_night_shift``) la sesión
+      completa cuenta para el día de entrada; sin él, se reparte entre los
+      dos días locales en la medianoche, sin perder horas.
+    - El tiempo de pausa que cae dentro de la sesión se descuenta.
+    """
+    max_span = timedelta(hours=min(max(1.0, float(max_session_hours)), 23.0))
+    now_utc = _aware_utc(now) if now is not None else None
+
+    def _localday(ts: datetime) -> date:
+        return ts.astimezone(tz).date()
+
+    # Mezcla en un único flujo: (ts, orden, tipo, payload). Las pausas van
+    # antes que un fichaje con el mismo instante para recortar bien.
+    event_stream = ((_aware_utc(ts), 1, _action_value(action), None) for ts, action in events)
+    pause_stream = (
+        (_aware_utc(p_start), 0, "pause", _aware_utc(p_end) if p_end is not None else None)
+        for p_start, p_end in pauses
+    )
+    stream = heapq.merge(pause_stream, event_stream, key=lambda item: (item[0], item[1]))
+
+    current: Optional[_OpenSession] = None
+    # Última pausa vista sin sesión abierta: puede solaparse con la siguiente entrada.
+    carry_pause: Optional[tuple[datetime, Optional[datetime]]] = None
+
+    def _unmatched(session: _OpenSession) -> WorkSession:
+        return WorkSession(
+            user_id=user_id,
+            kind=SessionKind.missing_out,
+            workday=_localday(session.start),
+            start=session.start,
+            end=None,
+        )
+
+    def _close(session: _OpenSession, end: datetime) -> Iterator[WorkSession]:
+        if session.pending is not None:
+            p_start, p_end = session.pending
+            session.absorb(p_start, min(p_end, end) if p_end is not None else end)
+            session.pending = None
+        cut = session.midnight
+        if end > cut and not night_shift:
+            parts = [
+                (session.start, cut, session.pause_before),
+                (cut, end, session.pause_after),
+            ]
+            split = True
+        else:
+            parts = [(session.start, end, session.pause_before + session.pause_after)]
+            split = False
+        for part_start, part_end, pause_secs in parts:
+            span = int((part_end - part_start).total_seconds())
+            pause_secs = min(pause_secs, span)
+            yield WorkSession(
+                user_id=user_id,
+                kind=SessionKind.closed,
+                workday=_localday(part_start),
+                start=part_start,
+                end=part_end,
+                worked_seconds=max(0, span - pause_secs),
+                pause_seconds=pause_secs,
+                split=split,
+            )
+
+    def _open(ts: datetime) -> _OpenSession:
+        nonlocal carry_pause
+        session = _OpenSession(ts, _next_local_midnight(ts, tz))
+        if carry_pause is not None:
+            p_start, p_end = carry_pause
+            if p_end is None or p_end > ts:
+                session.add_pause(max(p_start, ts), p_end)
+            carry_pause = None
+        return session
+
+    for ts, _order, kind, payload in stream:
+        if kind == "pause":
+            if current is not None:
+                current.add_pause(ts, payload)
+            else:
+                carry_pause = (ts, payload)
+            continue
+
+        if kind == "in":
+            if current is None:
+                current = _open(ts)
+            elif ts - current.start > max_span:
+                yield _unmatched(current)
+                current = _open(ts)
+            # Si no, es una entrada duplicada: se mantiene la primera.
+            continue
+
+        if kind == "out":
+            if current is None:
+                yield WorkSession(
+                    user_id=user_id,
+                    kind=SessionKind.missing_in,
+                    workday=_localday(ts),
+                    start=None,
+                    end=ts,
+                )
+            elif ts - current.start > max_span:
+                yield _unmatched(current)
+                yield WorkSession(
+                    user_id=user_id,
+                    kind=SessionKind.missing_in,
+                    workday=_localday(ts),
+                    start=None,
+                    end=ts,
+                )
+                current = None
+            else:
+                yield from _close(current, ts)
+                current = None
+
+    if current is not None:
+        if now_utc is not None and now_utc - current.start <= max_span:
+            yield WorkSession(
+                user_id=user_id,
+                kind=SessionKind.open,
+                workday=_localday(current.start),
+                start=current.start,
+                end=None,
+            )
+        else:
+            yield _unmatched(current)
+
+
+def pause_seconds_between(
+    pauses: Iterable[tuple[datetime, Optional[datetime]]], start: datetime, end: datetime
+) -> int:
+    """Segundos de pausas cerradas ``(start_ts, end_ts)`` dentro de ``[start, end)``.
+
+    Las pausas activas (``end_ts=None``) no cuentan.
+    """
+    start, end = _aware_utc(start), _aware_utc(end)
+    return sum(
+        _overlap(start, end, _aware_utc(p_start), _aware_utc(p_end))
+        for p_start, p_end in pauses
+        if p_end is not None
+    )
+
+
+def worked_by_day(sessions: Iterable[WorkSession]) -> dict[date, int]:
+    """Suma segundos trabajados por día local."""
+    totals: dict[date, int] = {}
+    for s in sessions:
+        if s.worked_seconds:
+            totals[s.workday] = totals.get(s.workday, 0) + s.worked_seconds
+    return totals
+
+
+__all__ = [
+    "DEFAULT_MAX_SESSION_HOURS",
+    "SessionKind",
+    "WorkSession",
+    "pair_sessions",
+    "pause_seconds_between",
+    "worked_by_day",
+]
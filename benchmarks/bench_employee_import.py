@@ -0,0 +1,79 @@
+"""Benchmark: importación CSV de empleados en streaming.
+
+Uso: python benchmarks/bench_employee_import.py [n_filas] [n_con_contrasena]
+
+El hash de contraseñas (scrypt por defecto en Werkzeug, ~0,1 s por hash y
+núcleo) domina el tiempo cuando muchas filas traen contraseña; por eso se
+mide aparte con un número configurable de filas.
+"""
+
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from models import Base  # noqa: E402
+from admin_panel.areas.models import AdminArea, AdminGroup  # noqa: E402
+from admin_panel.employees.importer import import_employees  # noqa: E402
+from admin_panel.roles.models import Role  # noqa: E402
+
+
+def _csv(n: int, with_password: int) -> io.StringIO:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["name", "email", "role", "area", "group", "password", "active"])
+    for i in range(n):
+        writer.writerow(
+            [
+                f"Empleado {i}",
+                f"e{i}@bench.local",
+                "Responsable" if i % 10 == 0 else "Empleado",
+                f"Area {i % 20}",
+                f"Grupo {i % 100}",
+                f"clave-{i}" if i < with_password else "",
+                "si",
+            ]
+        )
+    buf.seek(0)
+    return buf
+
+
+def main(n: int, with_password: int) -> None:
+    path = Path(tempfile.mkdtemp()) / "bench_import.db"
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    with Session() as db:
+        db.execute(insert(Role), [{"name": "Empleado"}, {"name": "Responsable"}])
+        db.execute(insert(AdminArea), [{"name": f"Area {i}"} for i in range(20)])
+        db.execute(
+            insert(AdminGroup),
+            [{"name": f"Grupo {i}", "area_id": 1 + i % 20} for i in range(100)],
+        )
+        db.commit()
+
+    data = _csv(n, with_password)
+    with Session() as db:
+        t0 = time.perf_counter()
+        report = import_employees(db, data)
+        elapsed = time.perf_counter() - t0
+    print(f"{n} filas ({with_password} con contraseña, {os.cpu_count()} CPU)")
+    print(f"importación            {elapsed:6.2f} s  {n / elapsed:8.0f} filas/s")
+    print(f"  {report.summary()}")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+    )
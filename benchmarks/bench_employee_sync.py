@@ -0,0 +1,71 @@
+"""Benchmark: sincronización completa Employee -> User.
+
+Uso: python benchmarks/bench_employee_sync.py [n_empleados]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, insert, update  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from models import Base  # noqa: E402
+from admin_panel.areas.models import AdminArea, AdminGroup  # noqa: E402
+from admin_panel.employees.models import Employee  # noqa: E402
+from admin_panel.employees.sync import sync_employees  # noqa: E402
+from admin_panel.roles.models import Role  # noqa: E402
+
+
+def main(n: int) -> None:
+    path = Path(tempfile.mkdtemp()) / "bench_sync.db"
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    with Session() as db:
+        db.execute(insert(Role), [{"name": "Empleado"}, {"name": "Responsable"}])
+        db.execute(insert(AdminArea), [{"name": f"Area {i}"} for i in range(20)])
+        db.execute(
+            insert(AdminGroup),
+            [{"name": f"Grupo {i}", "area_id": 1 + i % 20} for i in range(100)],
+        )
+        db.execute(
+            insert(Employee),
+            [
+                {
+                    "name": f"Empleado {i}",
+                    "email": f"e{i}@bench.local",
+                    "role_id": 1 + (i % 10 == 0),
+                    "group_id": 1 + i % 100,
+                }
+                for i in range(n)
+            ],
+        )
+        db.commit()
+
+    def _timed(label):
+        with Session() as db:
+            t0 = time.perf_counter()
+            report = sync_employees(db)
+            db.commit()
+            print(f"{label:<22} {time.perf_counter() - t0:6.2f} s  {report.summary()}")
+
+    _timed("primera pasada")
+    _timed("sin cambios")
+    with Session() as db:
+        db.execute(
+            update(Employee),
+            [{"id": i, "name": f"Renombrado {i}"} for i in range(1, n + 1, 10)],
+        )
+        db.commit()
+    _timed("10% modificados")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
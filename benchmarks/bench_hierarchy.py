@@ -0,0 +1,80 @@
+"""Benchmark: tabla de cierre de supervisores (regeneración, subárbol, movimiento).
+
+Uso: python benchmarks/bench_hierarchy.py [n_usuarios] [niveles]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, func, insert, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from models import Base, TimeEntry, User  # noqa: E402
+from hierarchy import rebuild_closure, set_supervisor, subordinate_ids  # noqa: E402
+
+
+def main(n: int, levels: int) -> None:
+    path = Path(tempfile.mkdtemp()) / "bench_hierarchy.db"
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    # Árbol equilibrado: cada nivel tiene ``fanout`` veces más usuarios.
+    fanout = max(2, round(n ** (1 / (levels - 1))))
+    with Session() as db:
+        rows = []
+        for i in range(1, n + 1):
+            parent = (i - 2) // fanout + 1 if i > 1 else None
+            rows.append(
+                {
+                    "id": i,
+                    "email": f"u{i}@bench.local",
+                    "name": f"Usuario {i}",
+                    "password_hash": "x",
+                    "supervisor_id": parent,
+                }
+            )
+        db.execute(insert(User), rows)
+        db.commit()
+
+        t0 = time.perf_counter()
+        pairs = rebuild_closure(db)
+        db.commit()
+        print(f"{n} usuarios, fanout {fanout}")
+        print(f"regeneración           {time.perf_counter() - t0:7.3f} s  ({pairs} pares)")
+
+        t0 = time.perf_counter()
+        reps = 200
+        for uid in range(1, reps + 1):
+            db.execute(
+                select(func.count()).select_from(User).where(User.id.in_(subordinate_ids(uid)))
+            ).scalar_one()
+        print(f"subárbol (consulta)    {(time.perf_counter() - t0) / reps * 1000:7.3f} ms")
+
+        t0 = time.perf_counter()
+        db.execute(
+            select(func.count())
+            .select_from(TimeEntry)
+            .where(TimeEntry.user_id.in_(subordinate_ids(1)))
+        ).scalar_one()
+        print(f"fichajes de la raíz    {(time.perf_counter() - t0) * 1000:7.3f} ms")
+
+        # Mover un subárbol de segundo nivel bajo otro superior.
+        user = db.get(User, 2)
+        t0 = time.perf_counter()
+        set_supervisor(db, user, 3)
+        db.commit()
+        print(f"mover subárbol         {time.perf_counter() - t0:7.3f} s")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+    )
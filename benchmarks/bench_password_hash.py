@@ -0,0 +1,70 @@
+"""Benchmark: logins/s por núcleo según los parámetros del hash.
+
+Mide ``check_password_hash`` con cada conjunto de parámetros (un hilo) y
+la tasa agregada pasando por el pool acotado de ``passwords``.
+
+Uso: python benchmarks/bench_password_hash.py [repeticiones] [método ...]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from werkzeug.security import check_password_hash  # noqa: E402
+
+import passwords  # noqa: E402
+
+DEFAULT_METHODS = [
+    "scrypt:32768:8:1",
+    "scrypt:16384:8:1",
+    "scrypt:8192:8:1",
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:260000",
+]
+
+
+def bench(method: str, repeat: int) -> None:
+    pwhash = passwords.hash_password("contraseña-demo", method)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        assert check_password_hash(pwhash, "contraseña-demo")
+    single = (time.perf_counter() - t0) / repeat
+
+    # Ráfaga de logins concurrentes (8 hilos de gunicorn) por el pool acotado.
+    burst = repeat * passwords.VERIFY_WORKERS
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as clients:
+        results = list(
+            clients.map(lambda _: _retry(passwords.verify_password, pwhash, "contraseña-demo"), range(burst))
+        )
+    pooled = time.perf_counter() - t0
+    assert all(results)
+
+    print(
+        f"{passwords.normalize_method(method):24s} {single * 1000:8.1f} ms/verif"
+        f" {1 / single:8.1f} logins/s/núcleo"
+        f" {burst / pooled:8.1f} logins/s con pool({passwords.VERIFY_WORKERS})"
+    )
+
+
+def _retry(fn, *args):
+    while True:
+        try:
+            return fn(*args)
+        except passwords.VerifyBusy:
+            time.sleep(0.005)
+
+
+def main(repeat: int, methods) -> None:
+    print(f"{os.cpu_count()} CPU, {repeat} verificaciones por método")
+    for method in methods:
+        bench(method, repeat)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    main(n, sys.argv[2:] or DEFAULT_METHODS)
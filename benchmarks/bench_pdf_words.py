@@ -0,0 +1,58 @@
+"""Benchmark: páginas/s de ``pdf_words.extract`` en serie y por procesos.
+
+Genera un PDF sintético (45 líneas por página) y mide la extracción de
+palabras con cajas con un solo proceso y repartida entre
+``PDF_WORDS_WORKERS`` procesos. El primer uso del pool paga el arranque de
+los procesos (``spawn``); se mide aparte.
+
+Uso: python benchmarks/bench_pdf_words.py [páginas] [procesos]
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import fitz  # noqa: E402
+
+import pdf_words  # noqa: E402
+
+LINE = "Línea {l} de la página {p}: Paciente Ana Pérez, DNI 12345678Z, Calle Mayor 15, 28013 Madrid"
+
+
+def make_pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        for l in range(45):
+            page.insert_text((40, 40 + 17 * l), LINE.format(l=l, p=p), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else min(4, os.cpu_count() or 1)
+    pdf = make_pdf(pages)
+    print(f"PDF: {pages} páginas, {len(pdf) / 1024 / 1024:.1f} MB, {os.cpu_count()} CPU")
+
+    serial = timed(lambda: pdf_words.extract(pdf, workers=1))
+    print(f"{'serie':24s} {pages / serial:8.0f} páginas/s")
+    if workers > 1:
+        cold = timed(lambda: pdf_words.extract(pdf, workers=workers, parallel_pages=0))
+        warm = timed(lambda: pdf_words.extract(pdf, workers=workers, parallel_pages=0))
+        print(f"{f'{workers} procesos (arranque)':24s} {pages / cold:8.0f} páginas/s")
+        print(f"{f'{workers} procesos':24s} {pages / warm:8.0f} páginas/s")
+
+
+if __name__ == "__main__":
+    main()
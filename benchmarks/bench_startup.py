@@ -0,0 +1,67 @@
+"""Benchmark: tiempo de arranque (import + create_app + primera petición).
+
+Cada medida se hace en un intérprete nuevo para que no cuenten módulos ya
+cargados. Con ``--budget-ms`` termina con código 1 si la mediana lo supera,
+para poder usarlo en CI.
+
+Uso: python benchmarks/bench_startup.py [--runs N] [--budget-ms MS]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app as module
+t1 = time.perf_counter()
+flask_app = module.create_app()
+t2 = time.perf_counter()
+resp = flask_app.test_client().get("/login")
+t3 = time.perf_counter()
+assert resp.status_code == 200, resp.status_code
+print(json.dumps({
+    "import": t1 - t0,
+    "create_app": t2 - t1,
+    "first_request": t3 - t2,
+    "total": t3 - t0,
+    "heavy": sorted(m for m in ("openai", "jsonschema", "fitz") if m in sys.modules),
+}))
+"""
+
+
+def measure() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    for key in ("import", "create_app", "first_request", "total"):
+        values = [r[key] * 1000 for r in runs]
+        print(f"{key:14s} mediana {statistics.median(values):8.1f} ms  máx {max(values):8.1f} ms")
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+    print(f"dependencias pesadas cargadas: {', '.join(heavy) or 'ninguna'}")
+
+    total = statistics.median(r["total"] * 1000 for r in runs)
+    if args.budget_ms is not None and total > args.budget_ms:
+        print(f"✗ arranque {total:.1f} ms > presupuesto {args.budget_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
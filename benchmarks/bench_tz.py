@@ -0,0 +1,60 @@
+"""Micro-benchmark: conversión horaria por fila vs. por lotes (tzbatch).
+
+Uso: python benchmarks/bench_tz.py [n_filas]
+"""
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import tzbatch  # noqa: E402
+
+TZ = ZoneInfo("Europe/Madrid")
+
+
+# Réplica de los helpers por fila de app.py (to_local / día local).
+def to_local(ts):
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(TZ).strftime("%d/%m/%Y %H:%M:%S")
+
+
+def local_day(ts):
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(TZ).date()
+
+
+def _bench(label, fn, rows):
+    t0 = time.perf_counter()
+    out = fn(rows)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<32} {elapsed * 1000:9.1f} ms  {len(rows) / elapsed / 1e6:6.2f} Mfilas/s")
+    return out
+
+
+def main(n: int) -> None:
+    rng = random.Random(0)
+    base = datetime(2024, 1, 1)
+    # Datetimes naive como los devuelve SQLite, repartidos en un año (cruza DST).
+    rows = [base + timedelta(seconds=rng.randint(0, 366 * 86400)) for _ in range(n)]
+    print(f"{n} filas, numpy={'sí' if tzbatch.np is not None else 'no'}")
+
+    tzbatch.table_for(TZ, [0])  # calienta la caché de la tabla
+
+    per_row = _bench("to_local por fila", lambda rs: [to_local(r) for r in rs], rows)
+    batch = _bench("format_local_many", lambda rs: tzbatch.format_local_many(TZ, rs), rows)
+    assert per_row == batch
+
+    days_row = _bench("día local por fila", lambda rs: [local_day(r) for r in rs], rows)
+    days_batch = _bench("local_days_many", lambda rs: tzbatch.local_days_many(TZ, rs), rows)
+    assert days_row == days_batch
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,73 @@
+"""Benchmark: permisos por fila (can_view_user) vs. scope precalculado.
+
+Uso: python benchmarks/bench_visibility.py [n_usuarios]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from models import Area, Base, Group, Role, User  # noqa: E402
+from hierarchy import rebuild_closure  # noqa: E402
+from rbac import can_view_user  # noqa: E402
+from visibility import viewer_scope  # noqa: E402
+
+
+def main(n: int) -> None:
+    path = Path(tempfile.mkdtemp()) / "bench_visibility.db"
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+    with Session() as db:
+        db.execute(insert(Area), [{"id": i, "name": f"Area {i}"} for i in range(1, 11)])
+        db.execute(
+            insert(Group), [{"id": i, "name": f"G{i}", "area_id": 1 + i % 10} for i in range(1, 101)]
+        )
+        db.execute(
+            insert(User),
+            [
+                {
+                    "id": i,
+                    "email": f"u{i}@bench.local",
+                    "name": f"u{i}",
+                    "password_hash": "x",
+                    "role": Role.cap_area if i == 1 else Role.employee,
+                    "group_id": 1 + i % 100,
+                    "area_id": 1 + (1 + i % 100) % 10,
+                    "supervisor_id": (i - 2) // 4 + 1 if i > 1 else None,
+                }
+                for i in range(1, n + 1)
+            ],
+        )
+        rebuild_closure(db)
+        db.commit()
+
+        viewer = db.get(User, 1)
+        users = db.execute(select(User)).scalars().all()
+        print(f"{n} usuarios, viewer cap_area con {n - 1} subordinados")
+
+        t0 = time.perf_counter()
+        per_row = [bool(can_view_user(viewer, u, db)) for u in users]
+        print(f"can_view_user por fila  {time.perf_counter() - t0:7.3f} s")
+
+        t0 = time.perf_counter()
+        scope = viewer_scope(db, viewer)
+        print(f"scope (cálculo)         {time.perf_counter() - t0:7.3f} s  ({scope.view.nbytes} bytes)")
+        t0 = time.perf_counter()
+        scope = viewer_scope(db, viewer)
+        batch = [scope.can_view(u.id) for u in users]
+        print(f"scope (caché) + filas   {time.perf_counter() - t0:7.3f} s")
+        assert per_row == batch
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,173 @@
+"""Migraciones del esquema con Alembic (``migrations/``).
+
+* :func:`upgrade_database` lleva cualquier BD a la última revisión. Las BD
+  antiguas sin ``alembic_version`` (creadas con ``create_all``) se marcan
+  como ``0001_rbac`` y la revisión ``0002`` completa lo que les falte.
+  Lo usa ``flask init-db``; nunca se ejecuta al importar la app.
+* :func:`check_schema` es la comprobación de arranque: lee una fila de
+  ``alembic_version`` y la compara con :data:`SCHEMA_HEAD`, sin cargar
+  Alembic ni inspeccionar tablas.
+* :func:`backfill_in_batches` rellena columnas de tablas grandes por
+  tramos de clave primaria, con commit por tramo, para que una migración
+  sobre ``attendance`` no bloquee los fichajes mientras dura.
+"""
+
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Mapping, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+# Última revisión; tests/test_migrations.py comprueba que coincide con Alembic.
+SCHEMA_HEAD = "0008_users_name_folded"
+# Revisión desde la que se adoptan las BD creadas antes de usar Alembic.
+LEGACY_BASE = "0001_rbac"
+BACKFILL_BATCH = 5000
+# Clave del advisory lock de PostgreSQL que serializa `flask init-db`.
+INIT_LOCK_KEY = 0x66696368  # "fich"
+
+
+class SchemaOutdated(RuntimeError):
+    """La BD no está en :data:`SCHEMA_HEAD`; hay que ejecutar ``flask init-db``."""
+
+
+def current_revision(conn: Connection) -> Optional[str]:
+    """Revisión aplicada o ``None`` si la BD no está versionada."""
+    try:
+        with conn.begin_nested() if conn.in_transaction() else conn.begin():
+            return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except DBAPIError:
+        return None
+
+
+def check_schema(engine: Engine) -> Tuple[Optional[str], str]:
+    """(revisión actual, revisión esperada): una consulta de una fila."""
+    with engine.connect() as conn:
+        return current_revision(conn), SCHEMA_HEAD
+
+
+def require_current_schema(engine: Engine) -> None:
+    current, head = check_schema(engine)
+    if current != head:
+        raise SchemaOutdated(
+            f"Esquema en {current or 'sin versionar'}, se esperaba {head}: "
+            "ejecuta `flask --app app.py init-db`"
+        )
+
+
+@contextmanager
+def init_lock(engine: Engine) -> Iterator[None]:
+    """Serializa la inicialización entre contenedores/procesos.
+
+    PostgreSQL: ``pg_advisory_lock`` en una conexión dedicada (se libera
+    aunque el proceso muera). SQLite: ``flock`` sobre ``<bd>.init.lock``.
+    El resto de procesos esperan y, al entrar, ven la BD ya migrada.
+    """
+    url = engine.url
+    if url.get_backend_name() == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": INIT_LOCK_KEY})
+            conn.commit()
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": INIT_LOCK_KEY})
+                conn.commit()
+        return
+    try:
+        import fcntl
+    except ImportError:  # Windows: sin bloqueo, un solo proceso en desarrollo
+        fcntl = None
+    if fcntl is None or not url.database or url.database == ":memory:":
+        yield
+        return
+    with open(f"{url.database}.init.lock", "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _alembic_config(conn: Connection):
+    from alembic.config import Config
+
+    cfg = Config()
+    cfg.set_main_option("script_location", str(MIGRATIONS_DIR))
+    cfg.attributes["connection"] = conn
+    return cfg
+
+
+def upgrade_database(engine: Engine, revision: str = "head") -> Tuple[Optional[str], str]:
+    """Aplica las migraciones pendientes; devuelve (revisión inicial, final)."""
+    from alembic import command
+
+    with engine.connect() as conn:
+        start = current_revision(conn)
+        conn.commit()
+        cfg = _alembic_config(conn)
+        if start is None:
+            command.stamp(cfg, LEGACY_BASE)
+            conn.commit()
+        command.upgrade(cfg, revision)
+        conn.commit()
+        return start, current_revision(conn)
+
+
+def backfill_in_batches(
+    conn: Connection,
+    table,
+    values: Mapping,
+    where=None,
+    *,
+    pk: str = "id",
+    batch_size: int = BACKFILL_BATCH,
+    pause: float = 0.0,
+) -> int:
+    """``UPDATE table SET values WHERE where`` en tramos de ``batch_size`` ids.
+
+    Cada tramo es una transacción corta: en migraciones de Alembic hay que
+    llamarlo dentro de ``op.get_context().autocommit_block()`` para que
+    el bloqueo de escritura se libere entre tramos. ``pause`` deja un
+    hueco entre tramos a los fichajes concurrentes. Devuelve las filas
+    actualizadas.
+    """
+    key = table.c[pk]
+    # Sin transacción abierta por quien llama, cada tramo lleva la suya.
+    owns = not conn.in_transaction()
+    bounds = conn.execute(select(func.min(key), func.max(key))).first()
+    if owns:
+        conn.commit()
+    if bounds is None or bounds[0] is None:
+        return 0
+    low, high = bounds
+    total = 0
+    while low <= high:
+        stmt = table.update().where(key >= low, key < low + batch_size).values(**values)
+        if where is not None:
+            stmt = stmt.where(where)
+        if owns:
+            with conn.begin():
+                total += conn.execute(stmt).rowcount or 0
+        else:
+            total += conn.execute(stmt).rowcount or 0
+        low += batch_size
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+__all__ = [
+    "SCHEMA_HEAD",
+    "SchemaOutdated",
+    "backfill_in_batches",
+    "check_schema",
+    "current_revision",
+    "init_lock",
+    "require_current_schema",
+    "upgrade_database",
+]
@@ -0,0 +1,188 @@
+"""Reintentos de escritura ante ``database is locked`` y métricas de contención.
+
+Con varios workers e hilos escribiendo en SQLite, un ``commit`` puede
+encontrarse la BD bloqueada más allá del ``busy_timeout`` de la conexión
+(``DB_BUSY_TIMEOUT``). En vez de un 500, :func:`retry_on_busy` vuelve a
+ejecutar la vista con espera exponencial con jitter hasta un plazo
+(``DB_BUSY_DEADLINE``); agotado el plazo la vista responde 503 con
+``Retry-After``.
+
+Solo se repite una vista si en ese intento no se llegó a confirmar nada
+(se vigila ``after_commit`` de cualquier sesión), así que repetir nunca
+duplica una escritura. En PostgreSQL se tratan igual los fallos de
+serialización, interbloqueos y ``lock_not_available``.
+
+Cada ruta acumula transacciones, reintentos, agotamientos y tiempo de
+espera por bloqueo; :func:`stats` los devuelve (por proceso) y ``/readyz``
+los publica.
+"""
+
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from functools import wraps
+from typing import Callable, Dict, Optional
+
+from flask import current_app, jsonify, make_response, request
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+
+BUSY_DEADLINE = float(os.getenv("DB_BUSY_DEADLINE", "5"))
+BUSY_BASE_DELAY = 0.02
+BUSY_MAX_DELAY = 0.5
+
+# SQLSTATE reintentables en PostgreSQL
+_PG_RETRYABLE = {"40001", "40P01", "55P03"}
+_SQLITE_BUSY = ("database is locked", "database table is locked", "database is busy")
+
+
+class WriteContention(RuntimeError):
+    """Se agotó ``DB_BUSY_DEADLINE`` reintentando una escritura."""
+
+
+def is_busy_error(exc: BaseException) -> bool:
+    """¿Es un error de bloqueo transitorio que merece reintento?"""
+    if not isinstance(exc, DBAPIError):
+        return False
+    orig = exc.orig
+    code = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    if code in _PG_RETRYABLE:
+        return True
+    message = str(orig).lower()
+    return any(m in message for m in _SQLITE_BUSY)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Espera antes del reintento ``attempt`` (1, 2, ...): full jitter."""
+    return random.uniform(0, min(BUSY_MAX_DELAY, BUSY_BASE_DELAY * (2 ** attempt)))
+
+
+@dataclass
+class RouteStats:
+    transactions: int = 0
+    retries: int = 0
+    exhausted: int = 0
+    wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+
+
+_stats: Dict[str, RouteStats] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(route: str, retries: int, waited: float, exhausted: bool = False) -> None:
+    ms = waited * 1000
+    with _stats_lock:
+        s = _stats.setdefault(route, RouteStats())
+        s.transactions += 1
+        s.retries += retries
+        s.exhausted += int(exhausted)
+        s.wait_ms += ms
+        s.max_wait_ms = max(s.max_wait_ms, ms)
+
+
+def stats() -> dict:
+    """Contadores por ruta de este proceso (``wait_ms`` redondeado)."""
+    with _stats_lock:
+        return {
+            route: {**asdict(s), "wait_ms": round(s.wait_ms, 1), "max_wait_ms": round(s.max_wait_ms, 1)}
+            for route, s in sorted(_stats.items())
+        }
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+# Commits confirmados durante el intento en curso (por petición/hilo). Se
+# escucha la clase ``Session`` y no ``SessionLocal``: así este módulo no
+# importa ``models`` (que a su vez carga las vistas del panel que lo usan).
+_commits: ContextVar[Optional[list]] = ContextVar("dbretry_commits", default=None)
+
+
+@event.listens_for(Session, "after_commit")
+def _count_commit(session) -> None:
+    commits = _commits.get()
+    if commits is not None:
+        commits.append(1)
+
+
+def run_with_retry(
+    fn: Callable,
+    *,
+    route: str,
+    deadline: Optional[float] = None,
+    sleep: Callable[[float], None] = time.sleep,
+):
+    """Ejecuta ``fn()`` repitiéndola mientras falle por bloqueo.
+
+    ``fn`` abre y cierra su propia sesión (como las vistas). Si falla
+    después de un ``commit`` no se repite: el error se propaga tal cual.
+    """
+    limit = time.monotonic() + (BUSY_DEADLINE if deadline is None else deadline)
+    retries, waited = 0, 0.0
+    while True:
+        commits: list = []
+        token = _commits.set(commits)
+        started = time.monotonic()
+        try:
+            result = fn()
+        except DBAPIError as exc:
+            if not is_busy_error(exc) or commits:
+                raise
+            # Lo que el intento pasó esperando el busy_timeout cuenta como espera
+            waited += time.monotonic() - started
+            retries += 1
+            delay = backoff_delay(retries)
+            if time.monotonic() + delay >= limit:
+                _record(route, retries, waited, exhausted=True)
+                raise WriteContention(
+                    f"{route}: BD bloqueada tras {retries} reintentos ({waited * 1000:.0f} ms)"
+                ) from exc
+            sleep(delay)
+            waited += delay
+            continue
+        finally:
+            _commits.reset(token)
+        _record(route, retries, waited)
+        return result
+
+
+def retry_on_busy(view):
+    """Decorador de vistas de escritura: ver :func:`run_with_retry`.
+
+    Va justo debajo de ``@routes.route`` para que cada intento repita
+    también la carga del usuario y los permisos.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        route = request.endpoint or view.__name__
+        try:
+            return run_with_retry(lambda: view(*args, **kwargs), route=route)
+        except WriteContention as exc:
+            current_app.logger.warning("%s", exc)
+            if request.headers.get("HX-Request") or request.accept_mimetypes.best == "application/json":
+                resp = make_response(jsonify({"ok": False, "error": "La base de datos está ocupada, reinténtalo."}), 503)
+            else:
+                resp = make_response("La base de datos está ocupada, reinténtalo en unos segundos.", 503)
+            resp.headers["Retry-After"] = "1"
+            return resp
+
+    return wrapper
+
+
+__all__ = [
+    "WriteContention",
+    "is_busy_error",
+    "retry_on_busy",
+    "run_with_retry",
+    "reset_stats",
+    "stats",
+]
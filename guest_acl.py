@@ -0,0 +1,128 @@
+"""Caché de accesos de invitados (``GuestAccess``).
+
+Cada invitado tiene un conjunto de ids de usuarios que puede ver. El
+conjunto se carga una vez por proceso y se guarda junto a la identidad del
+usuario (``user.guest_targets``, ver ``load_user``), así que cada
+comprobación de permisos es una búsqueda en memoria.
+
+La invalidación entre workers usa ``CacheVersion``: toda escritura en
+``GuestAccess`` incrementa la versión del invitado en la misma transacción
+(las altas/bajas en bloque con :func:`grant`/:func:`revoke`/:func:`set_targets`
+y, por si acaso, cualquier flush del ORM que toque la tabla) y cada
+petición compara esa versión con la cacheada.
+"""
+
+import threading
+import weakref
+from typing import Dict, FrozenSet, Iterable, Set, Tuple
+
+from sqlalchemy import delete, event, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from models import GuestAccess, bump_cache_versions, dialect_insert, read_cache_versions
+
+_lock = threading.Lock()
+# Engine -> {guest_id: (versión, ids visibles)}
+_cache: "weakref.WeakKeyDictionary[Engine, Dict[int, Tuple[int, FrozenSet[int]]]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _version_key(guest_id: int) -> str:
+    return f"guest_acl:{guest_id}"
+
+
+def _bump_versions(conn: Connection, guest_ids: Iterable[int]) -> None:
+    bump_cache_versions(conn, (_version_key(g) for g in guest_ids))
+
+
+def _engine_cache(db: Session) -> Dict[int, Tuple[int, FrozenSet[int]]]:
+    bind = db.get_bind()
+    engine = getattr(bind, "engine", bind)
+    with _lock:
+        per_engine = _cache.get(engine)
+        if per_engine is None:
+            per_engine = _cache[engine] = {}
+        return per_engine
+
+
+def current_version(db: Session, guest_id: int) -> int:
+    key = _version_key(guest_id)
+    return read_cache_versions(db, [key])[key]
+
+
+def targets_for(db: Session, guest_id: int) -> FrozenSet[int]:
+    """Ids visibles para el invitado; recarga solo si cambió su versión."""
+    cache = _engine_cache(db)
+    version = current_version(db, guest_id)
+    cached = cache.get(guest_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    targets = frozenset(
+        db.execute(
+            select(GuestAccess.target_user_id).where(GuestAccess.guest_user_id == guest_id)
+        ).scalars()
+    )
+    cache[guest_id] = (version, targets)
+    return targets
+
+
+def grant(db: Session, guest_id: int, target_ids: Iterable[int]) -> int:
+    """Concede acceso a varios usuarios de una vez; devuelve cuántos son nuevos."""
+    wanted = sorted({int(t) for t in target_ids if t and int(t) != guest_id})
+    if not wanted:
+        return 0
+    # Idempotente también entre workers: los pares ya concedidos se ignoran.
+    added = db.execute(
+        dialect_insert(db, GuestAccess)
+        .on_conflict_do_nothing(index_elements=["guest_user_id", "target_user_id"])
+        .returning(GuestAccess.target_user_id),
+        [{"guest_user_id": guest_id, "target_user_id": t} for t in wanted],
+    ).all()
+    if added:
+        _bump_versions(db.connection(), [guest_id])
+    return len(added)
+
+
+def revoke(db: Session, guest_id: int, target_ids: Iterable[int]) -> int:
+    """Retira el acceso a varios usuarios de una vez; devuelve cuántos se quitaron."""
+    ids = {int(t) for t in target_ids if t}
+    if not ids:
+        return 0
+    result = db.execute(
+        delete(GuestAccess)
+        .where(GuestAccess.guest_user_id == guest_id, GuestAccess.target_user_id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        _bump_versions(db.connection(), [guest_id])
+    return result.rowcount or 0
+
+
+def set_targets(db: Session, guest_id: int, target_ids: Iterable[int]) -> Tuple[int, int]:
+    """Deja exactamente ``target_ids`` como accesos; devuelve (añadidos, quitados)."""
+    wanted: Set[int] = {int(t) for t in target_ids if t and int(t) != guest_id}
+    existing = set(
+        db.execute(
+            select(GuestAccess.target_user_id).where(GuestAccess.guest_user_id == guest_id)
+        ).scalars()
+    )
+    added = grant(db, guest_id, wanted - existing)
+    removed = revoke(db, guest_id, existing - wanted)
+    return added, removed
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_on_orm_changes(session: Session, flush_context) -> None:
+    # Altas/bajas hechas objeto a objeto (datos demo, scripts) también invalidan.
+    touched = [
+        obj.guest_user_id
+        for obj in (*session.new, *session.deleted, *session.dirty)
+        if isinstance(obj, GuestAccess) and obj.guest_user_id
+    ]
+    if touched:
+        _bump_versions(session.connection(), touched)
+
+
+__all__ = ["current_version", "grant", "revoke", "set_targets", "targets_for"]
@@ -12,13 +12,28 @@ loglevel = 'info'
 capture_output = True
 enable_stdio_inheritance = True
 
-# IMPORTANTE: preload_app inicializa la BD antes de crear workers
+# preload_app construye la app una vez antes de crear workers.
+# La BD se inicializa antes, con `flask --app app.py init-db` (ver Dockerfile).
 preload_app = True
 
 # Hook que se ejecuta ANTES de cargar los workers
 def on_starting(server):
     """Se ejecuta UNA SOLA VEZ antes de crear workers."""
     print("🚀 Gunicorn iniciando en puerto", os.getenv('PORT', '5000'))
+    # Arranque barato: solo se compara la revisión del esquema (una fila).
+    from dbmigrate import SchemaOutdated, require_current_schema
+    from models import engine
+    try:
+        require_current_schema(engine)
+    except SchemaOutdated as exc:
+        print(f"✗ {exc}")
+        raise SystemExit(1)
+
+def post_fork(server, worker):
+    """Cada worker abre sus propias conexiones: las heredadas del maestro
+    (preload_app) no se pueden compartir entre procesos."""
+    from models import engine
+    engine.dispose(close=False)
 
 def when_ready(server):
     """Se ejecuta cuando el servidor está listo."""
@@ -0,0 +1,159 @@
+"""Sondas de salud para el contenedor y el balanceador.
+
+* ``/healthz``: solo comprueba que el proceso responde; no toca la BD.
+* ``/readyz``: conexión del pool con ``SELECT 1`` y versión de migraciones
+  (ambas bajo el mismo timeout), espacio libre junto al fichero SQLite y
+  presencia de las dependencias opcionales (PyMuPDF, cliente OpenAI).
+
+Ninguna pasa por ``login_required``, sesión ni CSRF, así que ``/readyz``
+solo publica el estado y un booleano por comprobación; el detalle (errores,
+revisiones, reintentos por BD bloqueada de :mod:`dbretry`) lo devuelve
+:func:`readiness` y solo lo ven los admin en ``/admin/readyz``. El
+resultado se cachea ``READYZ_CACHE_SECONDS`` para que las sondas salgan
+prácticamente gratis aunque lleguen de varios sitios a la vez.
+"""
+
+import importlib.util
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from pathlib import Path
+from typing import Optional, Tuple
+
+from flask import Blueprint, jsonify
+from sqlalchemy import text
+
+import dbretry
+import models
+from dbmigrate import check_schema
+
+READYZ_CACHE_SECONDS = float(os.getenv("READYZ_CACHE_SECONDS", "1"))
+DB_PROBE_TIMEOUT = float(os.getenv("READYZ_DB_TIMEOUT", "2"))
+MIN_FREE_DISK_MB = int(os.getenv("READYZ_MIN_FREE_MB", "100"))
+
+bp = Blueprint("health", __name__)
+
+_started = time.monotonic()
+_lock = threading.Lock()
+_cached: Optional[Tuple[float, dict, int]] = None
+# Un único hilo: si la BD se cuelga, las sondas no acumulan hilos bloqueados.
+_probe_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="readyz")
+
+
+def _probe(fn):
+    """Ejecuta ``fn`` en el hilo de sondas con ``DB_PROBE_TIMEOUT``.
+
+    Devuelve (resultado, None) o (None, error).
+    """
+    try:
+        return _probe_executor.submit(fn).result(timeout=DB_PROBE_TIMEOUT), None
+    except FutureTimeout:
+        return None, f"timeout tras {DB_PROBE_TIMEOUT:g} s"
+    except Exception as exc:
+        return None, str(exc)
+
+
+def _check_database() -> dict:
+    def ping():
+        with models.engine.connect() as conn:
+            conn.execute(text("SELECT 1")).scalar_one()
+
+    t0 = time.perf_counter()
+    _, error = _probe(ping)
+    if error is not None:
+        return {"ok": False, "error": error}
+    return {"ok": True, "ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+
+def _check_migrations() -> dict:
+    # Misma comprobación que el arranque: una fila de alembic_version
+    revisions, error = _probe(lambda: check_schema(models.engine))
+    if error is not None:
+        return {"ok": False, "error": error}
+    current, head = revisions
+    return {"ok": current == head, "current": current, "head": head}
+
+
+def _check_disk() -> dict:
+    url = models.engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return {"ok": True, "skipped": "no es SQLite en fichero"}
+    folder = Path(url.database).resolve().parent
+    try:
+        free_mb = shutil.disk_usage(folder).free // (1024 * 1024)
+    except OSError as exc:
+        return {"ok": False, "error": str(exc)}
+    return {"ok": free_mb >= MIN_FREE_DISK_MB, "free_mb": free_mb, "min_mb": MIN_FREE_DISK_MB}
+
+
+def _check_optional() -> dict:
+    # Informativo: sin ellas la app funciona, pero la herramienta PDF/IA no.
+    return {
+        "pymupdf": importlib.util.find_spec("fitz") is not None,
+        "openai": importlib.util.find_spec("openai") is not None,
+        "openai_api_key": bool(os.environ.get("OPENAI_API_KEY")),
+    }
+
+
+def readiness() -> Tuple[dict, int]:
+    """Detalle de la comprobación (cacheado); devuelve (cuerpo, código HTTP)."""
+    global _cached
+    now = time.monotonic()
+    cached = _cached
+    if cached is not None and now - cached[0] < READYZ_CACHE_SECONDS:
+        return cached[1], cached[2]
+    with _lock:
+        cached = _cached
+        if cached is not None and now - cached[0] < READYZ_CACHE_SECONDS:
+            return cached[1], cached[2]
+        checks = {
+            "database": _check_database(),
+            "migrations": _check_migrations(),
+            "disk": _check_disk(),
+        }
+        ready = all(c["ok"] for c in checks.values())
+        body = {
+            "status": "ready" if ready else "unavailable",
+            "checks": checks,
+            "optional": _check_optional(),
+            # Contención de escrituras de este worker (ver dbretry)
+            "db_writes": dbretry.stats(),
+        }
+        status = 200 if ready else 503
+        _cached = (time.monotonic(), body, status)
+        return body, status
+
+
+def _no_store(resp):
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@bp.route("/healthz")
+def healthz():
+    return _no_store(
+        jsonify({"status": "ok", "pid": os.getpid(), "uptime_s": round(time.monotonic() - _started, 1)})
+    )
+
+
+def public_readiness(body: dict) -> dict:
+    """Lo que ``/readyz`` puede enseñar sin autenticar: estado y booleanos."""
+    return {
+        "status": body["status"],
+        "checks": {name: check["ok"] for name, check in body["checks"].items()},
+        "optional": body["optional"],
+    }
+
+
+@bp.route("/readyz")
+def readyz():
+    body, status = readiness()
+    resp = jsonify(public_readiness(body))
+    resp.status_code = status
+    return _no_store(resp)
+
+
+__all__ = ["bp", "public_readiness", "readiness"]
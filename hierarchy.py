@@ -0,0 +1,199 @@
+"""Tabla de cierre de la jerarquía de supervisores.
+
+``users.supervisor_id`` forma un árbol; ``user_hierarchy`` guarda todos los
+pares (superior, subordinado) con su profundidad, de modo que "todos mis
+subordinados" o "¿es X jefe (indirecto) de Y?" son una única consulta
+indexada en vez de un recorrido recursivo en Python.
+
+Toda asignación de supervisor debe pasar por :func:`set_supervisor`, que
+actualiza ``supervisor_id`` y la tabla de cierre en la misma transacción.
+:func:`rebuild_closure` la regenera entera (comando ``flask rebuild-hierarchy``).
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from models import ORG_CACHE_VERSION, User, UserHierarchy, bump_cache_versions
+
+BATCH_SIZE = 5000
+
+
+class HierarchyCycleError(ValueError):
+    """La asignación haría a un usuario superior de sí mismo."""
+
+
+def _batched(rows: List[dict], size: int = BATCH_SIZE) -> Iterable[List[dict]]:
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+def subordinate_ids(user_id: int, max_depth: Optional[int] = None):
+    """SELECT de los ids de todos los subordinados (directos e indirectos).
+
+    Pensado para usarse como subconsulta: ``User.id.in_(subordinate_ids(x))``.
+    """
+    q = select(UserHierarchy.descendant_id).where(UserHierarchy.ancestor_id == user_id)
+    if max_depth is not None:
+        q = q.where(UserHierarchy.depth <= max_depth)
+    return q
+
+
+def superior_ids(user_id: int):
+    """SELECT de los ids de la cadena de superiores de ``user_id``."""
+    return select(UserHierarchy.ancestor_id).where(UserHierarchy.descendant_id == user_id)
+
+
+def is_subordinate(db: Session, superior_id: Optional[int], user_id: Optional[int]) -> bool:
+    """True si ``user_id`` está por debajo de ``superior_id`` a cualquier nivel."""
+    if not superior_id or not user_id or superior_id == user_id:
+        return False
+    return (
+        db.execute(
+            select(UserHierarchy.depth).where(
+                UserHierarchy.ancestor_id == superior_id,
+                UserHierarchy.descendant_id == user_id,
+            )
+        ).first()
+        is not None
+    )
+
+
+def set_supervisor(db: Session, user: User, supervisor_id: Optional[int]) -> None:
+    """Cambia el supervisor de ``user`` y mueve su subárbol en la tabla de cierre.
+
+    Lanza :class:`HierarchyCycleError` si ``supervisor_id`` es el propio
+    usuario o uno de sus subordinados. No hace commit.
+    """
+    if user.id is None:
+        db.flush()
+    uid = user.id
+    if supervisor_id == uid or is_subordinate(db, uid, supervisor_id):
+        raise HierarchyCycleError("Un usuario no puede depender de sí mismo ni de un subordinado.")
+    if user.supervisor_id == supervisor_id:
+        return
+
+    subtree = [(uid, 0)] + list(
+        db.execute(
+            select(UserHierarchy.descendant_id, UserHierarchy.depth).where(
+                UserHierarchy.ancestor_id == uid
+            )
+        ).all()
+    )
+    # Se desenganchan las filas que unen el subárbol con sus superiores
+    # actuales; las internas del subárbol no cambian.
+    inside = subordinate_ids(uid)
+    db.execute(
+        delete(UserHierarchy)
+        .where(
+            or_(UserHierarchy.descendant_id == uid, UserHierarchy.descendant_id.in_(inside)),
+            UserHierarchy.ancestor_id != uid,
+            UserHierarchy.ancestor_id.not_in(inside),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    if supervisor_id is not None:
+        ancestors = [(supervisor_id, 0)] + list(
+            db.execute(
+                select(UserHierarchy.ancestor_id, UserHierarchy.depth).where(
+                    UserHierarchy.descendant_id == supervisor_id
+                )
+            ).all()
+        )
+        rows = [
+            {"ancestor_id": a, "descendant_id": d, "depth": a_depth + d_depth + 1}
+            for a, a_depth in ancestors
+            for d, d_depth in subtree
+        ]
+        for batch in _batched(rows):
+            db.execute(insert(UserHierarchy), batch)
+
+    user.supervisor_id = supervisor_id
+
+
+def _closure_rows(parents: Dict[int, Optional[int]]) -> List[dict]:
+    """Pares (superior, subordinado, profundidad) a partir de ``id -> supervisor``.
+
+    Las cadenas de superiores se memorizan, así que el coste es lineal en
+    el número de filas generadas. Un ciclo en los datos se corta donde se
+    detecta en lugar de entrar en bucle.
+    """
+
+    def parent_of(user_id: int) -> Optional[int]:
+        parent = parents.get(user_id)
+        return parent if parent in parents else None
+
+    chains: Dict[int, List[int]] = {}
+    for start in parents:
+        path: List[int] = []
+        on_path = set()
+        node = start
+        while node is not None and node not in chains:
+            if node in on_path:
+                chains[node] = []
+                break
+            path.append(node)
+            on_path.add(node)
+            node = parent_of(node)
+        # De arriba abajo: cadena(x) = [padre] + cadena(padre).
+        for current in reversed(path):
+            if current in chains:
+                continue
+            parent = parent_of(current)
+            chains[current] = [] if parent is None else [parent] + chains[parent]
+
+    rows = []
+    for user_id, chain in chains.items():
+        for depth, ancestor in enumerate(chain, start=1):
+            rows.append({"ancestor_id": ancestor, "descendant_id": user_id, "depth": depth})
+    return rows
+
+
+def rebuild_closure(db: Session) -> int:
+    """Regenera ``user_hierarchy`` desde ``users.supervisor_id``; no hace commit."""
+    parents = dict(db.execute(select(User.id, User.supervisor_id)).all())
+    rows = _closure_rows(parents)
+    db.execute(delete(UserHierarchy))
+    for batch in _batched(rows):
+        db.execute(insert(UserHierarchy), batch)
+    bump_cache_versions(db.connection(), [ORG_CACHE_VERSION])
+    return len(rows)
+
+
+def closure_is_stale(db: Session) -> bool:
+    """Comprobación barata: las aristas directas deben coincidir con ``supervisor_id``."""
+    direct = db.execute(
+        select(func.count()).select_from(UserHierarchy).where(UserHierarchy.depth == 1)
+    ).scalar_one()
+    assigned = db.execute(
+        select(func.count()).select_from(User).where(User.supervisor_id.is_not(None))
+    ).scalar_one()
+    if direct != assigned:
+        return True
+    missing = db.execute(
+        select(User.id)
+        .outerjoin(
+            UserHierarchy,
+            and_(
+                UserHierarchy.descendant_id == User.id,
+                UserHierarchy.ancestor_id == User.supervisor_id,
+                UserHierarchy.depth == 1,
+            ),
+        )
+        .where(User.supervisor_id.is_not(None), UserHierarchy.ancestor_id.is_(None))
+        .limit(1)
+    ).first()
+    return missing is not None
+
+
+__all__ = [
+    "HierarchyCycleError",
+    "closure_is_stale",
+    "is_subordinate",
+    "rebuild_closure",
+    "set_supervisor",
+    "subordinate_ids",
+    "superior_ids",
+]
@@ -0,0 +1,276 @@
+"""Esquema completo a fecha de adopción de Alembic.
+
+Sustituye a ``create_all`` + ``PRAGMA table_info``/``ALTER TABLE`` que
+hacía ``init_db_with_demo`` en cada arranque. Es idempotente: crea las
+tablas que falten y añade las columnas que se fueron incorporando a mano,
+así sirve tanto para una BD vacía como para las creadas antes de usar
+Alembic (que se marcan como ``0001_rbac``, ver ``dbmigrate``).
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002_schema_baseline'
+down_revision = '0001_rbac'
+branch_labels = None
+depends_on = None
+
+
+def _enum(bind, *values, name):
+    if bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import ENUM
+
+        enum = ENUM(*values, name=name, create_type=False)
+        enum.create(bind, checkfirst=True)
+        return enum
+    return sa.Enum(*values, name=name)
+
+
+def _timestamps():
+    return (
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+# (tabla, columna) añadidas con ALTER TABLE antes de las migraciones
+LEGACY_COLUMNS = (
+    ('users', lambda: sa.Column('is_active', sa.Boolean(), nullable=False, server_default=sa.true())),
+    ('users', lambda: sa.Column('group_id', sa.Integer(), nullable=True)),
+    ('users', lambda: sa.Column('area_id', sa.Integer(), nullable=True)),
+    ('users', lambda: sa.Column('supervisor_id', sa.Integer(), nullable=True)),
+    ('absences', lambda: sa.Column('subtype', sa.String(length=50), nullable=True)),
+    ('areas', lambda: sa.Column('manager_id', sa.Integer(), nullable=True)),
+    ('work_calendars', lambda: sa.Column('weekly_hours', sa.Float(), nullable=False, server_default=sa.text('40.0'))),
+    ('work_calendars', lambda: sa.Column('break_minutes', sa.Integer(), nullable=False, server_default=sa.text('0'))),
+    ('work_calendars', lambda: sa.Column('clock_in_start_time', sa.Time(), nullable=True)),
+    ('work_calendars', lambda: sa.Column('clock_in_end_time', sa.Time(), nullable=True)),
+    ('work_calendars', lambda: sa.Column('max_daily_hours', sa.Float(), nullable=False, server_default=sa.text('8.0'))),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = set(inspector.get_table_names())
+    sqlite = bind.dialect.name == 'sqlite'
+
+    def create(name, *columns):
+        if name not in existing:
+            op.create_table(name, *columns)
+
+    entrystatus = _enum(bind, 'pending', 'approved', 'rejected', name='entrystatus')
+
+    create('admin_areas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('description', sa.String(length=255), nullable=True),
+        *_timestamps(),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name', name='uq_admin_areas_name'),
+    )
+    create('admin_roles',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('description', sa.String(length=255), nullable=True),
+        *_timestamps(),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name', name='uq_admin_roles_name'),
+    )
+    # areas <-> users es circular: fuera de SQLite la FK del responsable se añade después
+    create('areas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('manager_id', sa.Integer(), nullable=True),
+        *([sa.ForeignKeyConstraint(['manager_id'], ['users.id'])] if sqlite else []),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+    )
+    create('cache_versions',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    create('groups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('area_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['area_id'], ['areas.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create('users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('password_hash', sa.String(length=255), nullable=False),
+        sa.Column('role', _enum(bind, 'employee', 'responsable', 'cap_area', 'rrhh', 'admin', 'invitado', name='role'), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False, server_default=sa.true()),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('area_id', sa.Integer(), nullable=True),
+        sa.Column('supervisor_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['area_id'], ['areas.id']),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id']),
+        sa.ForeignKeyConstraint(['supervisor_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+    )
+    if 'areas' not in existing and not sqlite:
+        op.create_foreign_key('fk_areas_manager', 'areas', 'users', ['manager_id'], ['id'])
+    create('work_calendars',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=140), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('weekly_hours', sa.Float(), nullable=False),
+        sa.Column('weekday_hours', sa.Float(), nullable=False),
+        sa.Column('saturday_hours', sa.Float(), nullable=False),
+        sa.Column('sunday_hours', sa.Float(), nullable=False),
+        sa.Column('break_minutes', sa.Integer(), nullable=False),
+        sa.Column('clock_in_start_time', sa.Time(), nullable=True),
+        sa.Column('clock_in_end_time', sa.Time(), nullable=True),
+        sa.Column('max_daily_hours', sa.Float(), nullable=False),
+        *_timestamps(),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name', 'year', name='uq_work_calendars_name_year'),
+    )
+    create('work_schedule_policies',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('mode', sa.String(length=32), nullable=False),
+        sa.Column('expected_weekly_hours', sa.Float(), nullable=False),
+        sa.Column('min_daily_hours', sa.Float(), nullable=True),
+        sa.Column('start_time', sa.Time(), nullable=True),
+        sa.Column('end_time', sa.Time(), nullable=True),
+        sa.Column('allow_early_entry', sa.Boolean(), nullable=False),
+        sa.Column('allow_late_exit', sa.Boolean(), nullable=False),
+        sa.Column('break_minutes', sa.Integer(), nullable=False),
+        sa.Column('working_days', sa.String(length=64), nullable=False),
+        sa.Column('no_time_enforcement', sa.Boolean(), nullable=False),
+        sa.Column('allow_overtime', sa.Boolean(), nullable=False),
+        sa.Column('overtime_after_minutes', sa.Integer(), nullable=True),
+        sa.Column('is_night_shift', sa.Boolean(), nullable=False),
+        sa.Column('entry_margin_minutes', sa.Integer(), nullable=False),
+        sa.Column('exit_margin_minutes', sa.Integer(), nullable=False),
+        *_timestamps(),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name', name='uq_work_schedule_policies_name'),
+    )
+    create('absences',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('date_from', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('date_to', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('subtype', sa.String(length=50), nullable=True),
+        sa.Column('status', entrystatus, nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create('admin_groups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('description', sa.String(length=255), nullable=True),
+        sa.Column('area_id', sa.Integer(), nullable=False),
+        *_timestamps(),
+        sa.ForeignKeyConstraint(['area_id'], ['admin_areas.id'], ondelete='RESTRICT'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name', 'area_id', name='uq_admin_groups_name_area'),
+    )
+    create('attendance',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('action', _enum(bind, '_in', '_out', name='attendanceaction'), nullable=False),
+        sa.Column('ts', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('ip', sa.String(length=64), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create('guest_access',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('guest_user_id', sa.Integer(), nullable=False),
+        sa.Column('target_user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['guest_user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['target_user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create('pauses',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('start_ts', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('end_ts', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create('time_entries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('ts_in', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('ts_out', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('type', _enum(bind, 'in_', 'out', 'pause', name='timeentrytype'), nullable=False),
+        sa.Column('status', entrystatus, nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create('user_hierarchy',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['descendant_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id'),
+    )
+    create('work_calendar_holidays',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('calendar_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('name', sa.String(length=140), nullable=True),
+        sa.Column('holiday_type', sa.String(length=32), nullable=False),
+        sa.Column('note', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['calendar_id'], ['work_calendars.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('calendar_id', 'date', name='uq_calendar_holiday_date'),
+    )
+    create('admin_employees',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('role_id', sa.Integer(), nullable=False),
+        sa.Column('area_id', sa.Integer(), nullable=True),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        *_timestamps(),
+        sa.ForeignKeyConstraint(['area_id'], ['admin_areas.id'], ondelete='RESTRICT'),
+        sa.ForeignKeyConstraint(['group_id'], ['admin_groups.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['role_id'], ['admin_roles.id'], ondelete='RESTRICT'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email', name='uq_admin_employees_email'),
+    )
+
+    for table, make_column in LEGACY_COLUMNS:
+        if table not in existing:
+            continue
+        column = make_column()
+        if column.name not in {c['name'] for c in inspector.get_columns(table)}:
+            op.add_column(table, column)
+
+    op.create_index('ix_guest_access_guest', 'guest_access', ['guest_user_id', 'target_user_id'], if_not_exists=True)
+    op.create_index('ix_user_hierarchy_descendant', 'user_hierarchy', ['descendant_id', 'depth'], if_not_exists=True)
+    op.create_index('ix_admin_employees_name', 'admin_employees', ['name'], if_not_exists=True)
+    op.create_index('ix_users_name_lower', 'users', [sa.text('lower(name)')], if_not_exists=True)
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], if_not_exists=True)
+
+
+def downgrade():
+    # No-op deliberado: es la línea base y sus tablas existían antes de
+    # Alembic (las BD heredadas se marcan como 0001). Bajar a 0001 deja el
+    # esquema como está, y volver a subir es seguro porque upgrade() solo
+    # crea lo que falta.
+    pass
@@ -0,0 +1,76 @@
+"""Índice de búsqueda del directorio de empleados.
+
+SQLite: tabla FTS5 externa con triggers; PostgreSQL: ``pg_trgm``. Antes se
+creaba en cada arranque (``ensure_search_index``); ahora la búsqueda solo
+comprueba si la tabla existe y cae a ``LIKE`` si el runtime no tiene FTS5.
+"""
+
+from alembic import op
+
+revision = '0003_employee_search'
+down_revision = '0002_schema_baseline'
+branch_labels = None
+depends_on = None
+
+FTS_TABLE = 'admin_employees_fts'
+
+SQLITE_DDL = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, email,
+        content='admin_employees', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS admin_employees_fts_ai AFTER INSERT ON admin_employees BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS admin_employees_fts_ad AFTER DELETE ON admin_employees BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email)
+        VALUES ('delete', old.id, old.name, old.email);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS admin_employees_fts_au AFTER UPDATE OF name, email ON admin_employees BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email)
+        VALUES ('delete', old.id, old.name, old.email);
+        INSERT INTO {FTS_TABLE}(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+POSTGRES_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_admin_employees_name_trgm "
+    "ON admin_employees USING gin (lower(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_admin_employees_email_trgm "
+    "ON admin_employees USING gin (lower(email) gin_trgm_ops)",
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        compile_options = {r[0] for r in bind.exec_driver_sql('PRAGMA compile_options')}
+        if 'ENABLE_FTS5' not in compile_options:
+            return
+        for ddl in SQLITE_DDL:
+            op.execute(ddl)
+    elif bind.dialect.name == 'postgresql':
+        for ddl in POSTGRES_DDL:
+            op.execute(ddl)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for trigger in ('ai', 'ad', 'au'):
+            op.execute(f'DROP TRIGGER IF EXISTS admin_employees_fts_{trigger}')
+        op.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_admin_employees_email_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_admin_employees_name_trgm')
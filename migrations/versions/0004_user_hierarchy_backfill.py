@@ -0,0 +1,39 @@
+"""Rellena la tabla de cierre ``user_hierarchy`` desde ``users.supervisor_id``.
+
+Antes se comprobaba (y regeneraba) en cada arranque. Aquí se hace una vez
+con una CTE recursiva; después la mantiene ``hierarchy.set_supervisor``.
+La profundidad se limita para que datos con ciclos no hagan bucle.
+"""
+
+from alembic import op
+
+revision = '0004_user_hierarchy_backfill'
+down_revision = '0003_employee_search'
+branch_labels = None
+depends_on = None
+
+MAX_DEPTH = 64
+
+
+def upgrade():
+    op.execute('DELETE FROM user_hierarchy')
+    op.execute(
+        f"""
+        INSERT INTO user_hierarchy (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE chain(ancestor_id, descendant_id, depth) AS (
+            SELECT supervisor_id, id, 1 FROM users
+            WHERE supervisor_id IS NOT NULL AND supervisor_id <> id
+            UNION ALL
+            SELECT u.supervisor_id, c.descendant_id, c.depth + 1
+            FROM chain c JOIN users u ON u.id = c.ancestor_id
+            WHERE u.supervisor_id IS NOT NULL AND c.depth < {MAX_DEPTH}
+        )
+        SELECT ancestor_id, descendant_id, MIN(depth) FROM chain
+        WHERE ancestor_id <> descendant_id
+        GROUP BY ancestor_id, descendant_id
+        """
+    )
+
+
+def downgrade():
+    op.execute('DELETE FROM user_hierarchy')
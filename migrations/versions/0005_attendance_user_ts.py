@@ -0,0 +1,39 @@
+"""Índice ``attendance(user_id, ts)`` y ``created_at`` de fichajes antiguos.
+
+Todas las consultas de fichajes filtran por usuario y rango de fechas.
+``created_at`` quedó a NULL en filas importadas antes de tener default; se
+rellena con ``ts`` por tramos (``dbmigrate.backfill_in_batches``) fuera de
+la transacción de la migración, para no bloquear los fichajes en curso.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from dbmigrate import backfill_in_batches
+
+revision = '0005_attendance_user_ts'
+down_revision = '0004_user_hierarchy_backfill'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        # En PostgreSQL el índice se construye sin bloquear escrituras
+        op.create_index(
+            'ix_attendance_user_ts', 'attendance', ['user_id', 'ts'],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+        attendance = sa.table('attendance', sa.column('id'), sa.column('ts'), sa.column('created_at'))
+        backfill_in_batches(
+            bind,
+            attendance,
+            {'created_at': attendance.c.ts},
+            attendance.c.created_at.is_(None),
+        )
+
+
+def downgrade():
+    op.drop_index('ix_attendance_user_ts', table_name='attendance')
@@ -0,0 +1,34 @@
+"""Pares (invitado, usuario) únicos en ``guest_access``.
+
+Permite conceder accesos con ``INSERT ... ON CONFLICT DO NOTHING`` desde
+varios workers sin duplicar filas. Antes se borran los duplicados que
+hubiera, conservando el de menor id.
+"""
+
+from alembic import op
+
+revision = '0006_guest_access_unique'
+down_revision = '0005_attendance_user_ts'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        DELETE FROM guest_access
+        WHERE id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM guest_access
+                GROUP BY guest_user_id, target_user_id
+            ) AS keep
+        )
+        """
+    )
+    op.drop_index('ix_guest_access_guest', table_name='guest_access')
+    op.create_index('ix_guest_access_guest', 'guest_access', ['guest_user_id', 'target_user_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_guest_access_guest', table_name='guest_access')
+    op.create_index('ix_guest_access_guest', 'guest_access', ['guest_user_id', 'target_user_id'])
@@ -0,0 +1,55 @@
+"""Tabla ``pdf_jobs`` para el análisis IA de PDFs en segundo plano.
+
+Los trabajos se guardan en la BD (no en memoria del worker) para que el
+estado se pueda consultar desde cualquier worker y un trabajo interrumpido
+por el reciclado de un worker lo retome otro.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007_pdf_jobs'
+down_revision = '0006_guest_access_unique'
+branch_labels = None
+depends_on = None
+
+
+def _status_enum(bind):
+    values = ('queued', 'running', 'done', 'failed')
+    if bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import ENUM
+
+        enum = ENUM(*values, name='pdfjobstatus', create_type=False)
+        enum.create(bind, checkfirst=True)
+        return enum
+    return sa.Enum(*values, name='pdfjobstatus')
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.create_table(
+        'pdf_jobs',
+        sa.Column('id', sa.String(length=32), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('status', _status_enum(bind), nullable=False),
+        sa.Column('text', sa.Text(), nullable=True),
+        sa.Column('shards_done', sa.Integer(), nullable=False, server_default=sa.text('0')),
+        sa.Column('shards_total', sa.Integer(), nullable=False, server_default=sa.text('0')),
+        sa.Column('partial', sa.Text(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.String(length=500), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default=sa.text('0')),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_pdf_jobs_user_created', 'pdf_jobs', ['user_id', 'created_at'])
+    op.create_index('ix_pdf_jobs_status_updated', 'pdf_jobs', ['status', 'updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_pdf_jobs_status_updated', table_name='pdf_jobs')
+    op.drop_index('ix_pdf_jobs_user_created', table_name='pdf_jobs')
+    op.drop_table('pdf_jobs')
+    if op.get_bind().dialect.name == 'postgresql':
+        sa.Enum(name='pdfjobstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,50 @@
+"""``users.name_folded``: nombre sin mayúsculas ni acentos para el typeahead.
+
+``lower()`` de SQLite solo pliega ASCII, así que "Án" no encontraba a
+"Ángela". El plegado (NFKD sin marcas combinantes + ``casefold``) se hace
+en Python: se rellena aquí por tramos y después lo mantiene el modelo
+(``models.fold_name``). Sustituye al índice sobre ``lower(name)``.
+"""
+
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008_users_name_folded'
+down_revision = '0007_pdf_jobs'
+branch_labels = None
+depends_on = None
+
+BATCH = 500
+
+
+def _fold(value):
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def upgrade():
+    op.add_column('users', sa.Column('name_folded', sa.String(length=120), nullable=True))
+    bind = op.get_bind()
+    users = sa.table('users', sa.column('id'), sa.column('name'), sa.column('name_folded'))
+    last = 0
+    while True:
+        rows = bind.execute(
+            sa.select(users.c.id, users.c.name).where(users.c.id > last).order_by(users.c.id).limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            users.update().where(users.c.id == sa.bindparam('uid')).values(name_folded=sa.bindparam('folded')),
+            [{'uid': uid, 'folded': _fold(name)} for uid, name in rows],
+        )
+        last = rows[-1][0]
+    op.create_index('ix_users_name_folded', 'users', ['name_folded'], if_not_exists=True)
+    op.drop_index('ix_users_name_lower', table_name='users', if_exists=True)
+
+
+def downgrade():
+    op.create_index('ix_users_name_lower', 'users', [sa.text('lower(name)')], if_not_exists=True)
+    op.drop_index('ix_users_name_folded', table_name='users', if_exists=True)
+    op.drop_column('users', 'name_folded')
@@ -6,22 +6,64 @@ from sqlalchemy import (
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     String,
+    Text,
     create_engine,
+    func,
     select,
 )
-from sqlalchemy.orm import DeclarativeBase, relationship, sessionmaker, synonym
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import DeclarativeBase, object_session, relationship, sessionmaker, synonym, validates
+from werkzeug.security import check_password_hash
 import enum
 import os
+import unicodedata
+
+from passwords import hash_password
 
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///fichaje.db")
 
 class Base(DeclarativeBase):
     pass
 
-engine = create_engine(DB_URL, echo=False, future=True)
+
+
+# Backends con ``ON CONFLICT`` (ver :func:`dialect_insert`)
+SUPPORTED_BACKENDS = ("sqlite", "postgresql")
+
+
+def engine_options(url: str) -> dict:
+    """Opciones del pool según el backend.
+
+    SQLite en fichero ya usa ``QueuePool``; en PostgreSQL el pool se
+    dimensiona por worker (``DB_POOL_SIZE`` + ``DB_MAX_OVERFLOW`` >= hilos de
+    gunicorn) y se comprueba la conexión antes de usarla, para sobrevivir
+    a reinicios de la BD o a un balanceador que corta conexiones inactivas.
+    Cualquier otro backend se rechaza aquí, al configurar el engine, y no
+    con la primera escritura idempotente.
+    """
+    backend = make_url(url).get_backend_name()
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(
+            f"DATABASE_URL usa el backend '{backend}', no soportado: "
+            f"use {' o '.join(SUPPORTED_BACKENDS)}"
+        )
+    if url.startswith("sqlite"):
+        # Espera corta del driver ante ``database is locked``; el resto lo
+        # reintenta dbretry con backoff hasta DB_BUSY_DEADLINE.
+        return {"connect_args": {"timeout": float(os.getenv("DB_BUSY_TIMEOUT", "1"))}}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "5")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+
+engine = create_engine(DB_URL, echo=False, future=True, **engine_options(DB_URL))
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
 
 
@@ -40,11 +82,29 @@ class AttendanceAction(str, enum.Enum):
     _out = "out"
 
 
+def fold_name(value) -> str:
+    """Nombre sin mayúsculas ni acentos ("Ángela" -> "angela").
+
+    ``lower()`` de SQLite solo entiende ASCII, así que el plegado se hace en
+    Python y se guarda en ``users.name_folded``.
+    """
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def _name_folded_default(context) -> str:
+    # También para INSERT de Core (importación, sincronización de empleados)
+    return fold_name(context.get_current_parameters().get("name"))
+
+
 class User(Base, UserMixin):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
     email = Column(String(255), unique=True, nullable=False)
     name = Column(String(120), nullable=False)
+    # fold_name(name): lo rellena el default al insertar y _fold_name al
+    # cambiar el nombre por el ORM; los UPDATE masivos lo pasan explícito
+    name_folded = Column(String(120), default=_name_folded_default)
     password_hash = Column(String(255), nullable=False)
     role = Column(Enum(Role), default=Role.employee, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
@@ -77,8 +137,19 @@ class User(Base, UserMixin):
         foreign_keys="User.supervisor_id",
     )
 
+    # Búsqueda por prefijo sin distinguir mayúsculas ni acentos (typeahead del login)
+    __table_args__ = (
+        Index("ix_users_name_folded", name_folded),
+        Index("ix_users_email_lower", func.lower(email)),
+    )
+
+    @validates("name")
+    def _fold_name(self, key, value):
+        self.name_folded = fold_name(value)
+        return value
+
     def set_password(self, raw):
-        self.password_hash = generate_password_hash(raw)
+        self.password_hash = hash_password(raw)
 
     def check_password(self, raw):
         return check_password_hash(self.password_hash, raw)
@@ -95,6 +166,18 @@ class User(Base, UserMixin):
         if target.responsible_id and target.responsible_id == self.id:
             return True
 
+        # Jefes indirectos: una consulta a la tabla de cierre de la jerarquía.
+        session = object_session(target) or object_session(self)
+        if session is not None and self.id and target.id and target.responsible_id:
+            indirect = session.execute(
+                select(UserHierarchy.depth).where(
+                    UserHierarchy.ancestor_id == self.id,
+                    UserHierarchy.descendant_id == target.id,
+                )
+            ).first()
+            if indirect is not None:
+                return True
+
         # Area heads can validate requests in their area regardless of direct responsibility.
         if self.role == Role.cap_area and self.area_id and target.area_id == self.area_id:
             return True
@@ -116,6 +199,8 @@ class Attendance(Base):
 
     user = relationship("User", back_populates="attendances")
 
+    __table_args__ = (Index("ix_attendance_user_ts", "user_id", "ts"),)
+
 
 class Pause(Base):
     __tablename__ = "pauses"
@@ -202,12 +287,123 @@ class Absence(Base):
         return user.can_validate_request_for(requester)
 
 
+class UserHierarchy(Base):
+    """Tabla de cierre de la jerarquía ``supervisor_id``.
+
+    Una fila por cada par (superior, subordinado) a cualquier profundidad
+    (``depth`` >= 1). Se mantiene con las funciones de ``hierarchy``.
+    """
+    __tablename__ = "user_hierarchy"
+    ancestor_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    depth = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("ix_user_hierarchy_descendant", "descendant_id", "depth"),)
+
+
 class GuestAccess(Base):
     __tablename__ = "guest_access"
     id = Column(Integer, primary_key=True)
     guest_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     target_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
+    # Único: las altas repetidas se resuelven con ON CONFLICT DO NOTHING
+    __table_args__ = (Index("ix_guest_access_guest", "guest_user_id", "target_user_id", unique=True),)
+
+
+class CacheVersion(Base):
+    """Contador de versión para invalidar cachés en memoria entre procesos.
+
+    Cada worker compara la versión guardada con la de su caché y recarga
+    solo si ha cambiado (una lectura por clave primaria).
+    """
+    __tablename__ = "cache_versions"
+    name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class PdfJobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class PdfJob(Base):
+    """Análisis IA de un PDF en segundo plano (ver ``pdf_jobs``).
+
+    ``text`` guarda la entrada mientras el trabajo está pendiente, para
+    poder retomarlo desde otro worker; se borra al terminar. ``partial``
+    acumula lo encontrado por trozo y ``result`` el resultado final (JSON).
+    """
+    __tablename__ = "pdf_jobs"
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    status = Column(Enum(PdfJobStatus), default=PdfJobStatus.queued, nullable=False)
+    text = Column(Text)
+    shards_done = Column(Integer, nullable=False, default=0)
+    shards_total = Column(Integer, nullable=False, default=0)
+    partial = Column(Text)
+    result = Column(Text)
+    error = Column(String(500))
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("ix_pdf_jobs_user_created", "user_id", "created_at"),
+        Index("ix_pdf_jobs_status_updated", "status", "updated_at"),
+    )
+
+
+# Versión de la estructura organizativa (roles, grupos, áreas, supervisores)
+ORG_CACHE_VERSION = "org"
+
+
+def dialect_insert(bind, table):
+    """``INSERT`` con ``on_conflict_do_nothing``/``on_conflict_do_update``.
+
+    SQLite y PostgreSQL comparten la sintaxis ``ON CONFLICT``; ``bind`` es
+    una sesión, conexión o engine. :func:`engine_options` ya rechaza los
+    demás backends al arrancar.
+    """
+    name = bind.get_bind().dialect.name if hasattr(bind, "get_bind") else bind.dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as _insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as _insert
+    else:
+        raise ValueError(f"ON CONFLICT no soportado en {name}: use {' o '.join(SUPPORTED_BACKENDS)}")
+    return _insert(table)
+
+
+def bump_cache_versions(conn, names):
+    """Incrementa las versiones ``names`` (las crea a 1 si no existen).
+
+    Un único upsert por clave: dos workers que incrementan a la vez una
+    clave nueva no chocan con la clave primaria.
+    """
+    for name in sorted(set(names)):
+        stmt = dialect_insert(conn, CacheVersion).values(name=name, version=1)
+        conn.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[CacheVersion.name],
+                set_={"version": CacheVersion.version + 1},
+            )
+        )
+
+
+def read_cache_versions(db, names) -> dict:
+    """Versión actual de cada clave de ``names`` (0 si nunca se incrementó)."""
+    names = list(names)
+    found = dict(
+        db.execute(
+            select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_(names))
+        ).all()
+    )
+    return {name: found.get(name, 0) for name in names}
+
 # Import admin panel models so they are registered on shared metadata.
 for module in (
     "admin_panel.roles.models",
@@ -223,69 +419,29 @@ for module in (
 
 
 def init_db_with_demo():
-    """Inicializa la base de datos y crea datos de demostración si no existen."""
+    """Inicializa la base de datos y crea datos de demostración si no existen.
+
+    Todo ocurre bajo ``dbmigrate.init_lock``: con varios contenedores
+    arrancando a la vez solo uno migra y siembra; el resto espera y lo
+    encuentra hecho.
+    """
+    from dbmigrate import init_lock
+
     print("Iniciando configuración de base de datos...")
-    
-    # 1. Crear tablas si no existen
-    try:
-        Base.metadata.create_all(engine)
-        print("✓ Tablas verificadas/creadas")
-    except Exception as e:
-        print(f"⚠ Advertencia al crear tablas: {e}")
-    
-    # 2. Migrar columnas faltantes en SQLite (solo si es necesario)
-    try:
-        with engine.begin() as con:
-            cols = [r[1] for r in con.exec_driver_sql("PRAGMA table_info('users')").fetchall()]
-            migrated = []
-            if 'is_active' not in cols:
-                con.exec_driver_sql("ALTER TABLE users ADD COLUMN is_active BOOLEAN DEFAULT 1 NOT NULL")
-                migrated.append('is_active')
-            if 'group_id' not in cols:
-                con.exec_driver_sql("ALTER TABLE users ADD COLUMN group_id INTEGER")
-                migrated.append('group_id')
-            if 'area_id' not in cols:
-                con.exec_driver_sql("ALTER TABLE users ADD COLUMN area_id INTEGER")
-                migrated.append('area_id')
-            if 'supervisor_id' not in cols:
-                con.exec_driver_sql("ALTER TABLE users ADD COLUMN supervisor_id INTEGER")
-                migrated.append('supervisor_id')
-            # Ensure 'subtype' column exists on 'absences'
-            try:
-                abs_cols = [r[1] for r in con.exec_driver_sql("PRAGMA table_info('absences')").fetchall()]
-                if 'subtype' not in abs_cols:
-                    con.exec_driver_sql("ALTER TABLE absences ADD COLUMN subtype VARCHAR(50)")
-                    print("✔ Columna 'subtype' agregada a 'absences'")
-            except Exception as e:
-                print(f"⚠ Advertencia al migrar 'absences.subtype': {e}")
-            # Ensure manager column exists on areas
-            area_cols = [r[1] for r in con.exec_driver_sql("PRAGMA table_info('areas')").fetchall()]
-            if 'manager_id' not in area_cols:
-                con.exec_driver_sql("ALTER TABLE areas ADD COLUMN manager_id INTEGER")
-                migrated.append('areas.manager_id')
-            # Ensure work calendar columns exist
-            calendar_cols = [r[1] for r in con.exec_driver_sql("PRAGMA table_info('work_calendars')").fetchall()]
-            if 'weekly_hours' not in calendar_cols:
-                con.exec_driver_sql("ALTER TABLE work_calendars ADD COLUMN weekly_hours FLOAT DEFAULT 40.0 NOT NULL")
-                migrated.append('work_calendars.weekly_hours')
-            if 'break_minutes' not in calendar_cols:
-                con.exec_driver_sql("ALTER TABLE work_calendars ADD COLUMN break_minutes INTEGER DEFAULT 0 NOT NULL")
-                migrated.append('work_calendars.break_minutes')
-            if 'clock_in_start_time' not in calendar_cols:
-                con.exec_driver_sql("ALTER TABLE work_calendars ADD COLUMN clock_in_start_time TIME")
-                migrated.append('work_calendars.clock_in_start_time')
-            if 'clock_in_end_time' not in calendar_cols:
-                con.exec_driver_sql("ALTER TABLE work_calendars ADD COLUMN clock_in_end_time TIME")
-                migrated.append('work_calendars.clock_in_end_time')
-            if 'max_daily_hours' not in calendar_cols:
-                con.exec_driver_sql("ALTER TABLE work_calendars ADD COLUMN max_daily_hours FLOAT DEFAULT 8.0 NOT NULL")
-                migrated.append('work_calendars.max_daily_hours')
-            if migrated:
-                print(f"✓ Columnas migradas: {', '.join(migrated)}")
-    except Exception as e:
-        print(f"⚠ Advertencia al migrar columnas: {e}")
-    
-    # 3. Crear datos de demostración si NO existen
+    with init_lock(engine):
+        _init_db_with_demo()
+
+
+def _init_db_with_demo():
+    # 1. Esquema: migraciones de Alembic pendientes (ver dbmigrate)
+    from dbmigrate import upgrade_database
+    start, current = upgrade_database(engine)
+    if start != current:
+        print(f"✓ Esquema migrado: {start or 'sin versionar'} -> {current}")
+    else:
+        print(f"✓ Esquema al día ({current})")
+
+    # 2. Crear datos de demostración si NO existen
     db = SessionLocal()
     try:
         # IMPORTANTE: Verificar DENTRO de una transacción para evitar race conditions
@@ -392,17 +548,17 @@ def init_db_with_demo():
             GuestAccess(guest_user_id=guest_user.id, target_user_id=emp1_user.id),
             GuestAccess(guest_user_id=guest_user.id, target_user_id=emp2_user.id),
         ])
-        
+
+        db.flush()
+        from hierarchy import rebuild_closure
+        rebuild_closure(db)
+
         db.commit()
         print(f"✓ Base de datos inicializada con {len(created_users)} usuarios de demostración")
         print("  Credenciales: cualquier usuario con password 'demo1234'")
         
     except Exception as e:
         db.rollback()
-        # Si falla por UNIQUE constraint, es porque otro worker ganó la carrera
-        if "UNIQUE constraint failed" in str(e):
-            print("⚠ Otro worker ya inicializó la BD (race condition detectada)")
-        else:
-            print(f"✗ Error al crear datos de demostración: {e}")
+        print(f"✗ Error al crear datos de demostración: {e}")
     finally:
         db.close()
@@ -0,0 +1,160 @@
+"""Hash y verificación de contraseñas.
+
+Los parámetros del hash se configuran con ``PASSWORD_HASH_METHOD`` (formato
+de Werkzeug: ``scrypt:32768:8:1``, ``pbkdf2:sha256:600000``...). Al iniciar
+sesión, si el hash guardado usa otros parámetros se vuelve a generar con
+los actuales (:func:`verify_and_update`), así que cambiar el coste no
+obliga a resetear contraseñas.
+
+La verificación es CPU pura y lenta a propósito. Para que una ráfaga de
+logins (las 8:00) no ocupe todos los hilos de gunicorn, se ejecuta en un
+pool propio de ``PASSWORD_VERIFY_WORKERS`` hilos con una cola acotada a
+``PASSWORD_VERIFY_QUEUE`` peticiones; con la cola llena se lanza
+:class:`VerifyBusy` al momento en vez de esperar.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Optional
+
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+VERIFY_WORKERS = int(os.getenv("PASSWORD_VERIFY_WORKERS", "2"))
+# Peticiones admitidas a la vez (en curso + esperando); el resto, 503.
+VERIFY_QUEUE = int(os.getenv("PASSWORD_VERIFY_QUEUE", "4"))
+VERIFY_TIMEOUT = float(os.getenv("PASSWORD_VERIFY_TIMEOUT", "10"))
+
+
+class VerifyBusy(RuntimeError):
+    """No hay hueco en el pool de verificación; reintentar más tarde."""
+
+
+def normalize_method(method: str) -> str:
+    """Método con todos sus parámetros explícitos, como lo escribe Werkzeug."""
+    name, *args = method.split(":")
+    if name == "scrypt":
+        defaults = ["32768", "8", "1"]
+    elif name == "pbkdf2":
+        defaults = ["sha256", str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        raise ValueError(f"Método de hash no soportado: {method}")
+    args = args + defaults[len(args):]
+    return ":".join([name, *args])
+
+
+def hash_password(raw: str, method: Optional[str] = None) -> str:
+    return generate_password_hash(raw, method=normalize_method(method or HASH_METHOD))
+
+
+def needs_rehash(pwhash: Optional[str], method: Optional[str] = None) -> bool:
+    """True si ``pwhash`` es un hash válido generado con otros parámetros."""
+    if not pwhash or pwhash.count("$") < 2:
+        # Contraseñas inutilizables (p.ej. "!sync") no se tocan.
+        return False
+    stored = pwhash.split("$", 1)[0]
+    try:
+        return normalize_method(stored) != normalize_method(method or HASH_METHOD)
+    except ValueError:
+        return True
+
+
+class _VerifyPool:
+    """Pool acotado; se recrea tras un ``fork`` (gunicorn con ``preload_app``)."""
+
+    def __init__(self, workers: int, queue: int):
+        self.workers = max(1, workers)
+        self.queue = max(self.workers, queue)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[threading.BoundedSemaphore] = None
+
+    def _ensure(self) -> None:
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="pwverify"
+                )
+                self._slots = threading.BoundedSemaphore(self.queue)
+                self._pid = pid
+
+    def run(self, fn, *args, timeout: Optional[float] = None):
+        self._ensure()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise VerifyBusy("Demasiadas verificaciones de contraseña en curso")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _f: slots.release())
+        try:
+            return future.result(timeout=VERIFY_TIMEOUT if timeout is None else timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise VerifyBusy("Tiempo de verificación de contraseña agotado") from None
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
+            self._pid = None
+
+
+_pool = _VerifyPool(VERIFY_WORKERS, VERIFY_QUEUE)
+
+
+def configure_pool(workers: int, queue: int) -> None:
+    """Sustituye el pool de verificación (tests y ajustes en caliente)."""
+    global _pool
+    old = _pool
+    _pool = _VerifyPool(workers, queue)
+    old.shutdown()
+
+
+def verify_password(pwhash: Optional[str], raw: str) -> bool:
+    """``check_password_hash`` en el pool acotado; puede lanzar :class:`VerifyBusy`."""
+    if not pwhash:
+        return False
+    return _pool.run(check_password_hash, pwhash, raw)
+
+
+def verify_and_update(user, raw: str) -> bool:
+    """Verifica la contraseña de ``user`` y, si procede, la rehashea.
+
+    El nuevo hash se asigna a ``user.password_hash``; el commit es cosa de
+    quien llama. El rehash es opcional: si el pool está lleno se deja para
+    el siguiente login en vez de rechazar una contraseña ya verificada.
+    """
+    if not verify_password(user.password_hash, raw):
+        return False
+    if needs_rehash(user.password_hash):
+        try:
+            user.password_hash = _pool.run(hash_password, raw)
+        except VerifyBusy:
+            pass
+    return True
+
+
+__all__ = [
+    "HASH_METHOD",
+    "VerifyBusy",
+    "configure_pool",
+    "hash_password",
+    "needs_rehash",
+    "normalize_method",
+    "verify_and_update",
+    "verify_password",
+]
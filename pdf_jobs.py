@@ -0,0 +1,342 @@
+"""Análisis IA de PDFs en segundo plano.
+
+``/api/pdf/analyze`` ocupa un hilo de gunicorn (8 en total) mientras duran
+las llamadas al modelo: unos pocos PDFs a la vez dejan sin hilos a los
+fichajes, y el ``timeout`` de 120 s mata los documentos largos. Aquí el
+envío crea una fila en ``pdf_jobs`` y devuelve su id al momento; el
+análisis corre en un pool acotado por worker (``PDF_JOB_WORKERS``) y el
+cliente consulta el estado y los resultados parciales.
+
+El estado vive en la BD, no en memoria, así que cualquier worker responde
+a la consulta. Cada trozo terminado actualiza ``updated_at``; si un
+trabajo pendiente o en curso lleva ``PDF_JOB_STALE_SECONDS`` sin moverse
+(su worker se recicló o murió), quien lo consulte lo vuelve a encolar en
+su propio pool, hasta ``JOB_MAX_ATTEMPTS`` intentos. Tomar un trabajo es
+un ``UPDATE ... WHERE status = 'queued'``: solo un worker lo ejecuta.
+
+:meth:`JobRunner.events` sirve el mismo estado como Server-Sent Events:
+cada trozo terminado se emite en cuanto llega a la BD (al momento si el
+trabajo corre en el mismo worker, que avisa con una condición; si no, en
+la siguiente consulta cada ``PDF_SSE_POLL_SECONDS``). Un stream abierto
+ocupa un hilo de gunicorn (4 por worker), así que cada worker admite como
+mucho ``PDF_SSE_MAX_STREAMS`` a la vez (:meth:`JobRunner.open_stream`) y
+corta cada conexión a los ``PDF_SSE_MAX_SECONDS``; el navegador reconecta
+y ``Last-Event-ID`` indica por dónde seguir. Sin hueco, el cliente pasa a
+consultar el estado con peticiones cortas.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import delete, func, select, update
+
+import dbretry
+from models import PdfJob, PdfJobStatus, SessionLocal
+
+JOB_WORKERS = int(os.getenv("PDF_JOB_WORKERS", "2"))
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv("PDF_JOB_MAX_ACTIVE", "3"))
+JOB_STALE_SECONDS = int(os.getenv("PDF_JOB_STALE_SECONDS", "180"))
+JOB_RETENTION_SECONDS = int(os.getenv("PDF_JOB_RETENTION", str(24 * 3600)))
+JOB_MAX_ATTEMPTS = 3
+SSE_POLL_SECONDS = float(os.getenv("PDF_SSE_POLL_SECONDS", "0.5"))
+SSE_MAX_SECONDS = float(os.getenv("PDF_SSE_MAX_SECONDS", "20"))
+SSE_MAX_STREAMS = int(os.getenv("PDF_SSE_MAX_STREAMS", "1"))
+SSE_KEEPALIVE_SECONDS = 15
+
+ACTIVE = (PdfJobStatus.queued, PdfJobStatus.running)
+
+
+class TooManyJobs(RuntimeError):
+    """El usuario ya tiene ``PDF_JOB_MAX_ACTIVE`` trabajos pendientes o en curso."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def sse(event: str, data: dict, *, event_id: Optional[int] = None) -> str:
+    """Un mensaje Server-Sent Events con ``data`` en JSON."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _write(fn: Callable):
+    """Escritura corta en su propia sesión, reintentada si la BD está bloqueada."""
+
+    def run():
+        db = SessionLocal()
+        try:
+            result = fn(db)
+            db.commit()
+            return result
+        finally:
+            db.close()
+
+    return dbretry.run_with_retry(run, route="pdf_jobs")
+
+
+class JobRunner:
+    """Pool de trabajos de un worker; se crea perezosamente por proceso."""
+
+    def __init__(
+        self, app, analyze: Callable, *, workers: int = JOB_WORKERS, max_streams: int = SSE_MAX_STREAMS
+    ):
+        self.app = app
+        self.analyze = analyze
+        self.workers = max(1, workers)
+        self.max_streams = max(0, max_streams)
+        self._streams = 0
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        # Avisa a los streams SSE de este worker de que un trabajo ha cambiado
+        self._changed = threading.Condition()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        # Con preload_app el maestro no debe arrancar hilos: cada worker el suyo
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is None or self._pool_pid != pid:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pdf-job")
+                self._pool_pid = pid
+            return self._pool
+
+    def submit(self, user_id: int, text: str) -> str:
+        job_id = uuid.uuid4().hex
+
+        def create(db):
+            active = db.execute(
+                select(func.count()).select_from(PdfJob).where(
+                    PdfJob.user_id == user_id, PdfJob.status.in_(ACTIVE)
+                )
+            ).scalar_one()
+            if active >= JOB_MAX_ACTIVE_PER_USER:
+                raise TooManyJobs(f"Ya tienes {active} análisis en curso; espera a que terminen.")
+            # Limpieza oportunista de trabajos terminados antiguos
+            db.execute(
+                delete(PdfJob).where(
+                    PdfJob.status.in_((PdfJobStatus.done, PdfJobStatus.failed)),
+                    PdfJob.updated_at < _now() - timedelta(seconds=JOB_RETENTION_SECONDS),
+                )
+            )
+            db.add(PdfJob(id=job_id, user_id=user_id, status=PdfJobStatus.queued, text=text))
+
+        _write(create)
+        self._executor().submit(self._run, job_id)
+        return job_id
+
+    def _claim(self, job_id: str) -> Optional[tuple[str, int]]:
+        def claim(db):
+            claimed = db.execute(
+                update(PdfJob)
+                .where(PdfJob.id == job_id, PdfJob.status == PdfJobStatus.queued)
+                .values(status=PdfJobStatus.running, attempts=PdfJob.attempts + 1, updated_at=_now())
+            ).rowcount
+            if not claimed:
+                return None
+            return db.execute(select(PdfJob.text, PdfJob.attempts).where(PdfJob.id == job_id)).one()
+
+        return _write(claim)
+
+    def _update(self, job_id: str, attempt: int, **values) -> None:
+        # Un intento que ya se dio por perdido (y se reencoló) no pisa al nuevo
+        values["updated_at"] = _now()
+        _write(
+            lambda db: db.execute(
+                update(PdfJob)
+                .where(
+                    PdfJob.id == job_id,
+                    PdfJob.status == PdfJobStatus.running,
+                    PdfJob.attempts == attempt,
+                )
+                .values(**values)
+            )
+        )
+        with self._changed:
+            self._changed.notify_all()
+
+    def _run(self, job_id: str) -> None:
+        with self.app.app_context():
+            claimed = self._claim(job_id)
+            if claimed is None:
+                return
+            text, attempt = claimed
+            partial: list[dict] = []
+
+            def progress(event: dict) -> None:
+                partial.extend(event.get("items") or [])
+                self._update(
+                    job_id,
+                    attempt,
+                    shards_done=event["done"],
+                    shards_total=event["total"],
+                    partial=json.dumps(partial, ensure_ascii=False),
+                )
+
+            try:
+                result = self.analyze(text, progress=progress)
+            except Exception as exc:
+                self.app.logger.warning("PDF job %s failed: %s", job_id, exc)
+                self._update(
+                    job_id,
+                    attempt,
+                    status=PdfJobStatus.failed,
+                    error=str(exc)[:500],
+                    text=None,
+                    partial=None,
+                    finished_at=_now(),
+                )
+                return
+            result = {k: v for k, v in result.items() if k != "debug"}
+            self._update(
+                job_id,
+                attempt,
+                status=PdfJobStatus.done,
+                result=json.dumps(result, ensure_ascii=False),
+                text=None,
+                partial=None,
+                finished_at=_now(),
+            )
+
+    def _requeue_if_stale(self, job: PdfJob) -> bool:
+        """Vuelve a encolar un trabajo abandonado; True si lo ha hecho este worker."""
+        stale_since = job.updated_at
+        exhausted = job.attempts >= JOB_MAX_ATTEMPTS
+        values = (
+            {"status": PdfJobStatus.failed, "error": "Análisis interrumpido demasiadas veces.",
+             "text": None, "partial": None, "finished_at": _now()}
+            if exhausted
+            else {"status": PdfJobStatus.queued, "shards_done": 0, "partial": None}
+        )
+        # Solo gana quien ve la fila igual que la leyó (mismo updated_at)
+        taken = _write(
+            lambda db: db.execute(
+                update(PdfJob)
+                .where(PdfJob.id == job.id, PdfJob.status == job.status, PdfJob.updated_at == stale_since)
+                .values(updated_at=_now(), **values)
+            ).rowcount
+        )
+        if taken and not exhausted:
+            self.app.logger.info("PDF job %s requeued after %s", job.id, job.status.value)
+            self._executor().submit(self._run, job.id)
+        return bool(taken)
+
+    def get(self, job_id: str, user_id: int) -> Optional[dict]:
+        """Estado del trabajo ``job_id`` si pertenece a ``user_id``."""
+        db = SessionLocal()
+        try:
+            job = db.get(PdfJob, job_id)
+        finally:
+            db.close()
+        if job is None or job.user_id != user_id:
+            return None
+        updated = job.updated_at if job.updated_at.tzinfo else job.updated_at.replace(tzinfo=timezone.utc)
+        if job.status in ACTIVE and _now() - updated > timedelta(seconds=JOB_STALE_SECONDS):
+            if self._requeue_if_stale(job):
+                return self.get(job_id, user_id)
+        return serialize(job)
+
+    def open_stream(self) -> bool:
+        """Reserva un hueco para un stream SSE; False si el worker ya tiene el máximo.
+
+        Quien lo obtiene lo libera con :meth:`close_stream` al cerrar la respuesta.
+        """
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self) -> None:
+        with self._lock:
+            self._streams = max(0, self._streams - 1)
+
+    def events(
+        self,
+        job_id: str,
+        user_id: int,
+        *,
+        cursor: int = 0,
+        max_seconds: float = SSE_MAX_SECONDS,
+        interval: float = SSE_POLL_SECONDS,
+    ):
+        """Genera el stream SSE del trabajo desde el hallazgo parcial ``cursor``.
+
+        Eventos: ``progress`` (estado y trozos), ``items`` (hallazgos nuevos;
+        su ``id`` es el nuevo cursor), ``reset`` (el trabajo se reencoló y
+        los parciales empiezan de cero), ``done`` (resultado final) y
+        ``error``. Tras ``done`` o ``error`` el stream termina.
+        """
+        deadline = time.monotonic() + max_seconds
+        last_progress = None
+        last_sent = time.monotonic()
+        yield "retry: 1000\n\n"
+        while True:
+            job = self.get(job_id, user_id)
+            if job is None:
+                yield sse("error", {"error": "Trabajo no encontrado."})
+                return
+            partial = job.pop("partial", [])
+            progress = {"status": job["status"], "done": job["done"], "total": job["total"]}
+            if progress != last_progress:
+                last_progress = progress
+                last_sent = time.monotonic()
+                yield sse("progress", progress)
+            if len(partial) < cursor:
+                cursor = 0
+                yield sse("reset", {})
+            if len(partial) > cursor:
+                last_sent = time.monotonic()
+                yield sse("items", {"items": partial[cursor:]}, event_id=len(partial))
+                cursor = len(partial)
+            if job["status"] == PdfJobStatus.done.value:
+                yield sse("done", job)
+                return
+            if job["status"] == PdfJobStatus.failed.value:
+                yield sse("error", {"error": job.get("error")})
+                return
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            if now - last_sent >= SSE_KEEPALIVE_SECONDS:
+                last_sent = now
+                yield ": ping\n\n"
+            with self._changed:
+                self._changed.wait(interval)
+
+
+def serialize(job: PdfJob) -> dict:
+    data = {
+        "job_id": job.id,
+        "status": job.status.value,
+        "done": job.shards_done,
+        "total": job.shards_total,
+    }
+    if job.status in ACTIVE:
+        data["partial"] = json.loads(job.partial) if job.partial else []
+    elif job.status == PdfJobStatus.done:
+        data.update(json.loads(job.result))
+    else:
+        data["error"] = job.error
+    return data
+
+
+def init_app(
+    app, analyze: Callable, *, workers: int = JOB_WORKERS, max_streams: int = SSE_MAX_STREAMS
+) -> JobRunner:
+    runner = JobRunner(app, analyze, workers=workers, max_streams=max_streams)
+    app.extensions["pdf_jobs"] = runner
+    return runner
+
+
+def get_runner(app) -> JobRunner:
+    return app.extensions["pdf_jobs"]
+
+
+__all__ = ["JobRunner", "TooManyJobs", "get_runner", "init_app", "serialize", "sse"]
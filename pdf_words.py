@@ -0,0 +1,187 @@
+"""Texto y cajas de palabras de un PDF en el servidor (PyMuPDF).
+
+El visor extraía el texto con pdf.js para analizarlo y, al guardar, volvía
+a recorrer las páginas para calcular cajas que ``/api/pdf/redact`` tenía
+que voltear en Y a ojo. Aquí se extrae una sola vez con
+``page.get_text("words")`` y el resultado sirve para las dos cosas:
+
+* ``text``: páginas unidas por salto de línea y palabras por espacio, igual
+  que hacía el visor (los detectores y el troceo por páginas no cambian).
+* ``words``: columnas paralelas (``text``, ``page``, ``x0``, ``y0``,
+  ``x1``, ``y1``, ``line``, ``start``), con ``start`` la posición de la
+  palabra en ``text``. Las coordenadas son las de PyMuPDF (origen arriba a
+  la izquierda), las mismas que usa la redacción: no hay que voltear nada.
+
+:func:`find_boxes` traduce un valor detectado a las cajas de sus palabras.
+
+Un documento de más de ``PDF_WORDS_PARALLEL_PAGES`` páginas se reparte por
+tramos entre procesos (``PDF_WORDS_WORKERS``): PyMuPDF no suelta el GIL, así
+que con hilos no se ganaría nada. El pool se crea la primera vez en cada
+worker, con ``spawn`` para no hacer ``fork`` de un proceso con hilos.
+"""
+
+import bisect
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+PARALLEL_PAGES = int(os.getenv("PDF_WORDS_PARALLEL_PAGES", "40"))
+WORKERS = int(os.getenv("PDF_WORDS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Columnas de ``words`` en el orden en que se devuelven
+WORD_COLUMNS = ("text", "page", "x0", "y0", "x1", "y1", "line", "start")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _open(pdf_bytes: bytes):
+    import fitz  # PyMuPDF
+
+    return fitz.open(stream=pdf_bytes, filetype="pdf")
+
+
+def _page_words(pdf_bytes: bytes, first: int, last: int) -> list[tuple]:
+    """(ancho, alto, palabras) de las páginas ``first``..``last - 1``.
+
+    Cada palabra es (x0, y0, x1, y1, texto, bloque, línea) en orden de lectura.
+    """
+    doc = _open(pdf_bytes)
+    try:
+        pages = []
+        for number in range(first, last):
+            page = doc[number]
+            words = [w[:7] for w in page.get_text("words", sort=True)]
+            pages.append((page.rect.width, page.rect.height, words))
+        return pages
+    finally:
+        doc.close()
+
+
+def _executor(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _extract_pages(pdf_bytes: bytes, page_count: int, workers: int, parallel_pages: int) -> list[tuple]:
+    if workers <= 1 or page_count <= parallel_pages:
+        return _page_words(pdf_bytes, 0, page_count)
+    step = -(-page_count // workers)
+    pool = _executor(workers)
+    futures = [
+        pool.submit(_page_words, pdf_bytes, first, min(first + step, page_count))
+        for first in range(0, page_count, step)
+    ]
+    return [page for future in futures for page in future.result()]
+
+
+def extract(pdf_bytes: bytes, *, workers: int = WORKERS, parallel_pages: int = PARALLEL_PAGES) -> dict:
+    """Texto y palabras con caja del PDF, en formato columnar."""
+    doc = _open(pdf_bytes)
+    try:
+        page_count = doc.page_count
+    finally:
+        doc.close()
+    pages = _extract_pages(pdf_bytes, page_count, workers, parallel_pages)
+
+    columns: dict[str, list] = {name: [] for name in WORD_COLUMNS}
+    page_info: dict[str, list] = {"width": [], "height": [], "word_start": [], "text_start": []}
+    parts: list[str] = []
+    pos = 0
+    line_id = -1
+    for number, (width, height, words) in enumerate(pages, start=1):
+        if number > 1:
+            parts.append("\n")
+            pos += 1
+        page_info["width"].append(round(width, 2))
+        page_info["height"].append(round(height, 2))
+        page_info["word_start"].append(len(columns["text"]))
+        page_info["text_start"].append(pos)
+        last_line = None
+        for i, (x0, y0, x1, y1, word, block, line) in enumerate(words):
+            if i:
+                parts.append(" ")
+                pos += 1
+            if (block, line) != last_line:
+                last_line = (block, line)
+                line_id += 1
+            columns["text"].append(word)
+            columns["page"].append(number)
+            columns["x0"].append(round(x0, 2))
+            columns["y0"].append(round(y0, 2))
+            columns["x1"].append(round(x1, 2))
+            columns["y1"].append(round(y1, 2))
+            columns["line"].append(line_id)
+            columns["start"].append(pos)
+            parts.append(word)
+            pos += len(word)
+    return {"page_count": page_count, "pages": page_info, "words": columns, "text": "".join(parts)}
+
+
+def _value_pattern(value: str) -> Optional[re.Pattern]:
+    parts = value.split()
+    if not parts:
+        return None
+    return re.compile(r"\s+".join(re.escape(p) for p in parts), re.IGNORECASE)
+
+
+def find_boxes(extraction: dict, value: str) -> list[dict]:
+    """Cajas (página, x0, y0, x1, y1) de cada aparición de ``value`` en el texto.
+
+    Una aparición que ocupa varias palabras da una caja por línea (la unión
+    de sus palabras); una palabra tocada solo en parte se tapa entera.
+    """
+    pattern = _value_pattern(value)
+    if pattern is None:
+        return []
+    words = extraction["words"]
+    starts = words["start"]
+    boxes: list[dict] = []
+    for match in pattern.finditer(extraction["text"]):
+        first = max(0, bisect.bisect_right(starts, match.start()) - 1)
+        last = bisect.bisect_left(starts, match.end())
+        current = None
+        for i in range(first, last):
+            if starts[i] + len(words["text"][i]) <= match.start():
+                continue
+            if current is not None and current["line"] == words["line"][i]:
+                current["x0"] = min(current["x0"], words["x0"][i])
+                current["y0"] = min(current["y0"], words["y0"][i])
+                current["x1"] = max(current["x1"], words["x1"][i])
+                current["y1"] = max(current["y1"], words["y1"][i])
+                continue
+            current = {
+                "page": words["page"][i],
+                "x0": words["x0"][i],
+                "y0": words["y0"][i],
+                "x1": words["x1"][i],
+                "y1": words["y1"][i],
+                "line": words["line"][i],
+            }
+            boxes.append(current)
+    for box in boxes:
+        box.pop("line")
+    return boxes
+
+
+def boxes_for_terms(extraction: dict, terms: list[str]) -> tuple[list[dict], list[str]]:
+    """(cajas de todos los términos, términos sin ninguna aparición)."""
+    boxes: list[dict] = []
+    unmatched: list[str] = []
+    for term in dict.fromkeys(t.strip() for t in terms if t.strip()):
+        found = find_boxes(extraction, term)
+        if not found:
+            unmatched.append(term)
+        boxes.extend(found)
+    return boxes, unmatched
+
+
+__all__ = ["WORD_COLUMNS", "boxes_for_terms", "extract", "find_boxes"]
@@ -0,0 +1,319 @@
+"""Detector de datos personales por reglas, en una sola pasada.
+
+Versión servidor de los detectores de ``templates/pdf_tool.html``
+(``collectCandidateGroups``). Todos se compilan en **un único patrón**
+con un grupo con nombre por detector. Las listas de palabras clave
+(bancos, salud, legal, vulnerabilidad) comparten un solo grupo,
+factorizado en trie: el motor de ``re`` recorre los prefijos comunes una
+vez en lugar de probar cada palabra por separado en cada posición
+(``benchmarks/bench_pii_rules.py`` compara con Aho-Corasick en Python).
+
+Cada coincidencia sale como :class:`PiiMatch` con su posición y con
+``confident``:
+
+* Los datos con formato verificable (email, DNI/NIE con letra de control
+  correcta, IBAN español con módulo 97, teléfono español, fecha de
+  nacimiento rotulada) son seguros. Se devuelven tal cual y se enmascaran
+  en el texto que va al modelo (:func:`mask`).
+* El resto (nombres, direcciones, palabras clave, códigos, teléfonos
+  genéricos) son ambiguos y los decide el modelo.
+
+El orden de :data:`DETECTORS` es la prioridad cuando dos detectores
+empiezan en la misma posición: primero los de formato más estricto.
+"""
+
+import re
+import unicodedata
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+# Cambiarlo invalida las entradas de ai_cache calculadas con otras reglas
+RULES_VERSION = "1"
+
+_UPPER = "A-Z\u00C0-\u00DE"
+_LOWER = "a-z\u00DF-\u017F"
+
+
+@dataclass(frozen=True, slots=True)
+class PiiMatch:
+    label: str
+    value: str
+    start: int
+    end: int
+    confident: bool
+
+
+@dataclass(frozen=True)
+class Detector:
+    name: str
+    label: str
+    pattern: str
+    confident: bool = False
+    # check(valor) -> bool: False descarta la coincidencia o, con
+    # ``degrade``, la conserva como ambigua (p. ej. DNI con letra errónea).
+    check: Optional[Callable[[str], bool]] = None
+    degrade: bool = False
+
+
+def _fold(word: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFD", word) if unicodedata.category(c) != "Mn"
+    )
+
+
+def trie_pattern(words: Iterable[str]) -> str:
+    """Alternativa factorizada por prefijos: ``banco|banca`` -> ``banc(?:o|a)``.
+
+    Sin distinguir mayúsculas (se usa dentro de ``(?i:...)``); incluye la
+    variante sin tildes de cada palabra y un espacio casa con ``\\s+``.
+    """
+    trie: dict = {}
+    for word in words:
+        for variant in {word.lower(), _fold(word).lower()}:
+            node = trie
+            for ch in variant:
+                node = node.setdefault(ch, {})
+            node[""] = {}
+
+    def build(node: dict) -> str:
+        end = "" in node
+        branches = []
+        for ch in sorted(k for k in node if k):
+            piece = r"\s+" if ch == " " else re.escape(ch)
+            branches.append(piece + build(node[ch]))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+_DNI_LETTERS = "TRWAGMYFPDXBNJZSQVHLCKE"
+
+
+def valid_dni(value: str) -> bool:
+    v = value.upper()
+    digits = {"X": "0", "Y": "1", "Z": "2"}.get(v[0], v[0]) + v[1:-1]
+    return digits.isdigit() and _DNI_LETTERS[int(digits) % 23] == v[-1]
+
+
+def valid_iban(value: str) -> bool:
+    v = re.sub(r"[\s-]", "", value).upper()
+    if len(v) < 15 or not v[:2].isalpha():
+        return False
+    rearranged = v[4:] + v[:4]
+    try:
+        return int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+    except ValueError:
+        return False
+
+
+_DATE = re.compile(r"\d{1,2}[/-]\d{1,2}[/-]\d{2,4}")
+_HEADER_WORDS = ("data", "fecha", "naixement", "nacimiento", "factura")
+
+
+def _plausible_phone(value: str) -> bool:
+    if ("/" in value or ("-" in value and len(value) <= 10)) and _DATE.search(value):
+        return False
+    return len(re.sub(r"\D", "", value)) >= 9
+
+
+def _plausible_name(value: str) -> bool:
+    v = value.lower()
+    return not any(w in v for w in _HEADER_WORDS) and len(value.split()) >= 2
+
+
+BANK_NAMES = [
+    "Banco", "Banc", "Caixa", "Caja", "ING", "BBVA", "Santander", "Sabadell",
+    "Kutxabank", "Bankinter", "Openbank", "N26", "Revolut",
+]
+HEALTH_TERMS = ["Diagnóstico", "Prescripción", "Analítica", "PCR", "SARS", "COVID"]
+LEGAL_TERMS = ["Embargo", "Ejecución", "Apremio", "Sentencia", "Juzgado", "Deuda", "Impago"]
+SOCIAL_TERMS = [
+    "Tarifa Social", "Tarifa Vulnerable", "Bono Social", "Bono Vulnerable",
+    "Canon Social", "Canon Saneamiento", "Vulnerabilidad", "Renta Garantizada",
+    "Renta Mínima", "Ingreso Mínimo",
+]
+
+_NAME_WORD = f"[{_UPPER}][{_LOWER}]+"
+
+DETECTORS: Sequence[Detector] = (
+    Detector("email", "Emails", r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b", True),
+    Detector(
+        "iban", "Cuentas Bancarias / IBAN",
+        r"\bES\d{2}(?:\s?\d{4}){5}\b|\bES\d{2}\s?\d{4}\s?\d{4}\s?\d{2}\s?\d{10}\b"
+        r"|\b\d{4}\s?\d{4}\s?\d{2}\s?\d{10}\b",
+        True, check=valid_iban, degrade=True,
+    ),
+    Detector("code", "Códigos/IDs (CUPS, Ref.Cat, Matrícula)", r"\bES[0-9A-Z]{20,22}\b|\b[0-9]{7}[A-Z0-9]{13}\b"),
+    Detector("dni", "DNI/NIE", r"(?i:\b(?:[XYZ]\d{7}[A-Z]|\d{8}[A-Z])\b)", True, check=valid_dni, degrade=True),
+    Detector(
+        "dob", "Fecha Nacimiento/DOB",
+        r"(?i:\b(?:Data\s+Naixement|Fecha\s+(?:de\s+)?Nacimiento|DOB|Nasc\.?)\s*:?\s*\d{2}[/\-]\d{2}[/\-]\d{4}\b)",
+        True,
+    ),
+    Detector(
+        "phone_es", "Telefonos",
+        r"(?:(?:\+|\b00)34\s?|\b)(?:[6789]\d{2}\s?\d{3}\s?\d{3}|9\d{2}\s?\d{2}\s?\d{2}\s?\d{2})\b",
+        True,
+    ),
+    Detector(
+        "health_id", "Salud/Historia Clínica",
+        r"(?i:\b(?:(?:Num\.|Nº|N\.|No\.)\s*)?(?:H\.?C\.?|Hist\.?|Historia|Colegiado|CIP|Nuhsa)[:\s]*[A-Z0-9-]*\d[A-Z0-9-]*\b)",
+    ),
+    Detector(
+        "address", "Direcciones",
+        rf"(?i:\b(?:calle|c/|avenida|av\.?|paseo|plaza|plaça|camino|carretera|rbla|rambla)\s+[{_UPPER}{_LOWER}0-9ºª .,-]{{3,60}}\b)",
+    ),
+    Detector("census", "Ocupantes/Censo", r"(?i:\b\d+\s+(?:habitants|habitantes|personas|empadronados|empadronades)\b)"),
+    Detector("plate", "Códigos/IDs (CUPS, Ref.Cat, Matrícula)", r"\b\d{4}\s?[BCDFGHJKLMNPRSTVWXYZ]{3}\b"),
+    Detector("phone", "Telefonos", r"\b(?:\+?\d{2,3}[\s.-]?)?(?:\d[\s.-]?){9,12}\b", check=_plausible_phone),
+    Detector(
+        "name", "Nombres completos / Doctores",
+        rf"\b(?:Dr\.|Dra\.|Doctor|Doctora)\s+{_NAME_WORD}\s+{_NAME_WORD}"
+        rf"|\b{_NAME_WORD}\s+{_NAME_WORD}(?:\s+{_NAME_WORD}){{1,2}}\b",
+        check=_plausible_name,
+    ),
+)
+
+# Palabras clave: un único trie para todas, la etiqueta se resuelve después
+KEYWORDS = {
+    "Nombres de Bancos": BANK_NAMES,
+    "Salud/Historia Clínica": HEALTH_TERMS,
+    "Legal/Deudas": LEGAL_TERMS,
+    "Datos Sociales/Vulnerabilidad": SOCIAL_TERMS,
+}
+_KEYWORD_LABEL = {
+    " ".join(_fold(word).lower().split()): label for label, words in KEYWORDS.items() for word in words
+}
+# "Banco Santander", "Caixa Bank": el banco arrastra la palabra siguiente
+_BANK_TAIL = re.compile(r"\s[\w.]+")
+_KEYWORD_GROUP = "keyword"
+# Los detectores de palabras clave van justo antes de los nombres
+_KEYWORD_SLOT = next(i for i, d in enumerate(DETECTORS) if d.name == "name")
+
+_BY_NAME = {d.name: d for d in DETECTORS}
+
+
+@lru_cache(maxsize=None)
+def combined_pattern() -> "re.Pattern[str]":
+    """Patrón único; se compila al primer uso (~20 ms), no al importar la app.
+
+    ``(?<![\\w+])`` descarta de entrada las posiciones en mitad de una
+    palabra, antes de probar las alternativas: triplica el rendimiento.
+    """
+    groups = [f"(?P<{d.name}>{d.pattern})" for d in DETECTORS]
+    words = [w for ws in KEYWORDS.values() for w in ws]
+    groups.insert(_KEYWORD_SLOT, rf"(?P<{_KEYWORD_GROUP}>(?i:\b{trie_pattern(words)}\b))")
+    return re.compile(r"(?<![\w+])(?:" + "|".join(groups) + ")")
+
+
+def scan(text: str) -> Iterator[PiiMatch]:
+    """Todas las coincidencias, en orden y sin solapes, en una pasada."""
+    text = text or ""
+    covered = 0
+    for m in combined_pattern().finditer(text):
+        if m.start() < covered:
+            continue
+        raw = m.group()
+        if m.lastgroup == _KEYWORD_GROUP:
+            label = _KEYWORD_LABEL.get(" ".join(_fold(raw).lower().split()), "Otro dato personal")
+            end = m.end()
+            if label == "Nombres de Bancos":
+                tail = _BANK_TAIL.match(text, end)
+                if tail:
+                    end = tail.end()
+            value = text[m.start():end].rstrip(",.;:-").rstrip()
+            covered = end
+            yield PiiMatch(label, value, m.start(), m.start() + len(value), False)
+            continue
+        det = _BY_NAME[m.lastgroup]
+        value = raw.strip().rstrip(",.;:-").rstrip()
+        if not value:
+            continue
+        confident = det.confident
+        if det.check is not None:
+            ok = det.check(value)
+            if not ok and not det.degrade:
+                continue
+            confident = confident and ok
+        start = m.start() + (len(raw) - len(raw.lstrip()))
+        yield PiiMatch(det.label, value, start, start + len(value), confident)
+
+
+def split(matches: Iterable[PiiMatch]) -> tuple[List[PiiMatch], List[PiiMatch]]:
+    """(seguras, ambiguas)."""
+    sure, unsure = [], []
+    for m in matches:
+        (sure if m.confident else unsure).append(m)
+    return sure, unsure
+
+
+def mask(text: str, matches: Iterable[PiiMatch]) -> str:
+    """Sustituye cada coincidencia por ``[etiqueta]`` (para no reenviarla al modelo)."""
+    out, pos = [], 0
+    for m in sorted(matches, key=lambda m: m.start):
+        if m.start < pos:
+            continue
+        out.append(text[pos:m.start])
+        out.append(f"[{m.label}]")
+        pos = m.end
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def unmasker(matches: Iterable[PiiMatch]) -> Callable[[int], int]:
+    """Traduce posiciones del texto de :func:`mask` a posiciones del original."""
+    ends: List[int] = []
+    shifts: List[int] = []
+    pos = shift = 0
+    for m in sorted(matches, key=lambda m: m.start):
+        if m.start < pos:
+            continue
+        marker = len(m.label) + 2
+        ends.append(m.start - shift + marker)
+        shift += (m.end - m.start) - marker
+        shifts.append(shift)
+        pos = m.end
+
+    def to_original(masked_pos: int) -> int:
+        i = bisect_right(ends, masked_pos)
+        return masked_pos + (shifts[i - 1] if i else 0)
+
+    return to_original
+
+
+def as_findings(matches: Iterable[PiiMatch]) -> List[dict]:
+    """Formato de ``sensitive`` de la API, un elemento por ocurrencia."""
+    return [
+        {
+            "label": m.label,
+            "value": m.value,
+            "reason": "Detectado por regla de formato",
+            "confidence": "high",
+            "source": "rules",
+        }
+        for m in matches
+    ]
+
+
+__all__ = [
+    "DETECTORS",
+    "KEYWORDS",
+    "PiiMatch",
+    "RULES_VERSION",
+    "as_findings",
+    "combined_pattern",
+    "mask",
+    "scan",
+    "split",
+    "trie_pattern",
+    "unmasker",
+    "valid_dni",
+    "valid_iban",
+]
@@ -1,15 +1,40 @@
 from functools import wraps
+from typing import FrozenSet
 from flask import abort
 from flask_login import current_user
-from sqlalchemy import select
-from sqlalchemy.orm import Session
-from models import SessionLocal, User, Role, TimeEntry, GuestAccess
+from sqlalchemy.orm import Session, object_session
+from models import SessionLocal, User, Role, TimeEntry
+from guest_acl import targets_for
+from hierarchy import is_subordinate
+
+
+def _is_superior(requester: User, target: User, db: Session = None) -> bool:
+    """Jefe directo o indirecto del target (tabla de cierre).
+
+    Sin ``db`` se usa la sesión de la que vienen los objetos; solo si ambos
+    están sueltos se abre una propia.
+    """
+    if target.supervisor_id and target.supervisor_id == requester.id:
+        return True
+    if requester.role == Role.invitado or not target.supervisor_id:
+        return False
+    if db is None:
+        db = object_session(target) or object_session(requester)
+    close_db = False
+    if db is None:
+        db = SessionLocal()
+        close_db = True
+    try:
+        return is_subordinate(db, requester.id, target.id)
+    finally:
+        if close_db:
+            db.close()
 
 
 def can_view_user(requester: User, target: User, db: Session = None) -> bool:
     if requester.role in (Role.admin, Role.rrhh):
         return True
-    if target.supervisor_id and target.supervisor_id == requester.id:
+    if _is_superior(requester, target, db):
         return True
     if requester.role == Role.employee:
         return requester.id == target.id
@@ -18,32 +43,36 @@ def can_view_user(requester: User, target: User, db: Session = None) -> bool:
     if requester.role == Role.cap_area:
         return requester.area_id and requester.area_id == target.area_id
     if requester.role == Role.invitado:
-        # Solo si hay GuestAccess
-        close_db = False
-        if db is None:
-            db = SessionLocal()
-            close_db = True
-        try:
-            ga = db.execute(
-                select(GuestAccess).where(
-                    GuestAccess.guest_user_id == requester.id,
-                    GuestAccess.target_user_id == target.id,
-                )
-            ).scalar_one_or_none()
-            return ga is not None
-        finally:
-            if close_db:
-                db.close()
+        # Solo si hay GuestAccess (conjunto cacheado con la identidad)
+        return target.id in guest_targets(requester, db)
     return False
 
 
-def can_edit_entries(requester: User, target: User) -> bool:
+def guest_targets(guest: User, db: Session = None) -> FrozenSet[int]:
+    """Ids visibles para un invitado; usa ``guest.guest_targets`` si ya se cargó."""
+    targets = getattr(guest, "guest_targets", None)
+    if targets is not None:
+        return targets
+    if db is None:
+        db = object_session(guest)
+    close_db = False
+    if db is None:
+        db = SessionLocal()
+        close_db = True
+    try:
+        return targets_for(db, guest.id)
+    finally:
+        if close_db:
+            db.close()
+
+
+def can_edit_entries(requester: User, target: User, db: Session = None) -> bool:
     # Invitado nunca edita
     if requester.role == Role.invitado:
         return False
     if requester.role in (Role.admin, Role.rrhh):
         return True
-    if target.supervisor_id and target.supervisor_id == requester.id:
+    if _is_superior(requester, target, db):
         return True
     if requester.role == Role.employee:
         # Un empleado puede proponer cambios sobre sus propias entradas
@@ -62,7 +91,7 @@ def require_view_user(user_id_param: str):
             db = SessionLocal()
             try:
                 target = db.get(User, int(kwargs[user_id_param]))
-                if not target or not can_view_user(current_user, target):
+                if not target or not can_view_user(current_user, target, db):
                     abort(403)
                 return fn(*args, **kwargs)
             finally:
@@ -81,7 +110,7 @@ def require_edit_entry(entry_id_param: str):
                 if not entry:
                     abort(404)
                 target = db.get(User, entry.user_id)
-                if not can_edit_entries(current_user, target):
+                if not can_edit_entries(current_user, target, db):
                     abort(403)
                 return fn(*args, **kwargs)
             finally:
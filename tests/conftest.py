@@ -1,6 +1,96 @@
+import atexit
+import os
+import shutil
+import socket
+import subprocess
 import sys
+import tempfile
 from pathlib import Path
 
+import pytest
+
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
+
+_TMP = Path(tempfile.mkdtemp(prefix="fichaje-tests-"))
+_TEST_DB = _TMP / "test.db"
+SQLITE_URL = f"sqlite:///{_TEST_DB}"
+
+
+def _launch_postgres():
+    """PostgreSQL desechable con ``initdb``/``pg_ctl`` si están instalados.
+
+    Devuelve la URL o ``None``. ``TEST_POSTGRES_URL`` apunta a un servidor
+    ya levantado (CI, docker compose --profile postgres) y tiene prioridad.
+    """
+    if os.environ.get("TEST_POSTGRES_URL"):
+        return os.environ["TEST_POSTGRES_URL"]
+    try:
+        import psycopg2  # noqa: F401
+    except ImportError:
+        return None
+    initdb, pg_ctl = shutil.which("initdb"), shutil.which("pg_ctl")
+    if not (initdb and pg_ctl):
+        return None
+    data = _TMP / "pgdata"
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    try:
+        subprocess.run([initdb, "-D", str(data), "-U", "fichaje", "-A", "trust"], check=True, capture_output=True)
+        subprocess.run(
+            [pg_ctl, "-D", str(data), "-w", "-l", str(_TMP / "pg.log"),
+             "-o", f"-p {port} -k {_TMP} -c listen_addresses=127.0.0.1 -c fsync=off"],
+            check=True, capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    atexit.register(subprocess.run, [pg_ctl, "-D", str(data), "-m", "immediate", "stop"], capture_output=True)
+    subprocess.run(
+        [shutil.which("createdb") or "createdb", "-h", "127.0.0.1", "-p", str(port), "-U", "fichaje", "fichaje"],
+        capture_output=True,
+    )
+    return f"postgresql+psycopg2://fichaje@127.0.0.1:{port}/fichaje"
+
+
+# FICHAJE_TEST_BACKEND=postgresql ejecuta toda la suite contra PostgreSQL;
+# por defecto SQLite. Los tests nunca tocan fichaje.db.
+BACKEND = os.environ.get("FICHAJE_TEST_BACKEND", "sqlite")
+POSTGRES_URL = _launch_postgres() if BACKEND == "postgresql" or os.environ.get("TEST_POSTGRES_URL") else None
+if BACKEND == "postgresql" and POSTGRES_URL is None:
+    raise pytest.UsageError("FICHAJE_TEST_BACKEND=postgresql sin servidor: instala PostgreSQL o define TEST_POSTGRES_URL")
+os.environ["DATABASE_URL"] = POSTGRES_URL if BACKEND == "postgresql" else SQLITE_URL
+os.environ["PDF_AI_CACHE_PATH"] = str(_TMP / "pdf_ai_cache.db")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _app_database():
+    from models import init_db_with_demo
+
+    init_db_with_demo()
+    yield os.environ["DATABASE_URL"]
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def backend_url(request, tmp_path):
+    """URL de una BD vacía en cada backend; PostgreSQL se salta si no hay servidor."""
+    if request.param == "sqlite":
+        yield f"sqlite:///{tmp_path / 'backend.db'}"
+        return
+    if POSTGRES_URL is None:
+        pytest.skip("PostgreSQL no disponible (TEST_POSTGRES_URL o initdb + psycopg2)")
+    from sqlalchemy import create_engine
+    from sqlalchemy.engine import make_url
+
+    # Una base por test, creada desde la de mantenimiento.
+    name = f"t_{os.getpid()}_{abs(hash(request.node.nodeid)) % 10**8}"
+    admin = create_engine(make_url(POSTGRES_URL).set(database="postgres"), isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.exec_driver_sql(f'DROP DATABASE IF EXISTS "{name}"')
+        conn.exec_driver_sql(f'CREATE DATABASE "{name}"')
+    url = make_url(POSTGRES_URL).set(database=name).render_as_string(hide_password=False)
+    yield url
+    with admin.connect() as conn:
+        conn.exec_driver_sql(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+    admin.dispose()
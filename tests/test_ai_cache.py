@@ -0,0 +1,125 @@
+import json
+import sqlite3
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select
+
+import ai_cache
+from models import SessionLocal, User
+from app import create_app
+
+
+@pytest.fixture()
+def cache(tmp_path):
+    return ai_cache.ResultCache(str(tmp_path / "cache.db"), ttl=3600, max_bytes=10_000)
+
+
+def test_key_ignores_whitespace_but_not_model_or_prompt():
+    base = ai_cache.cache_key("Hola  Ana\n", model="m", prompt="p", settings={"max_text": 10})
+    assert base == ai_cache.cache_key(" Hola Ana", model="m", prompt="p", settings={"max_text": 10})
+    assert base != ai_cache.cache_key("Hola Ana", model="m2", prompt="p", settings={"max_text": 10})
+    assert base != ai_cache.cache_key("Hola Ana", model="m", prompt="p2", settings={"max_text": 10})
+    assert base != ai_cache.cache_key("Hola Ana", model="m", prompt="p", settings={"max_text": 20})
+
+
+def test_hit_miss_and_stats_are_shared_between_instances(cache, tmp_path):
+    other = ai_cache.ResultCache(cache.path, ttl=3600, max_bytes=10_000)
+    assert cache.get("k") is None
+    cache.put("k", [{"label": "Email", "value": "a@b.c"}], model="m")
+    t0 = time.perf_counter()
+    assert other.get("k") == [{"label": "Email", "value": "a@b.c"}]
+    assert time.perf_counter() - t0 < 0.05
+    other.flush()  # cada proceso vuelca sus contadores por lotes
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_lru_eviction_keeps_recently_used(cache):
+    blob = [{"value": "x" * 900}]
+    for i in range(9):
+        cache.put(f"k{i}", blob, model="m")
+        cache.get("k0")  # k0 siempre es la más reciente
+    cache.put("k9", blob, model="m")
+    cache.put("k10", blob, model="m")
+    stats = cache.stats()
+    assert stats["bytes"] <= cache.max_bytes
+    assert stats["evictions"] >= 1
+    assert cache.get("k0") is not None
+    assert cache.get("k1") is None
+
+
+def test_ttl_expires_entries(tmp_path):
+    cache = ai_cache.ResultCache(str(tmp_path / "ttl.db"), ttl=1, max_bytes=10_000)
+    cache.put("k", [], model="m")
+    with patch("ai_cache.time.time", return_value=time.time() + 5):
+        assert cache.get("k") is None
+
+
+def test_lookups_do_not_take_the_write_lock(cache):
+    cache.put("k", [], model="m")
+    writer = sqlite3.connect(cache.path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")  # otro worker escribiendo
+    try:
+        t0 = time.perf_counter()
+        assert cache.get("k") == [] and cache.get("otra") is None
+        assert time.perf_counter() - t0 < 0.5
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_sqlite_errors_are_a_miss_not_a_failure(tmp_path):
+    broken = ai_cache.ResultCache(str(tmp_path / "no-existe" / "cache.db"))
+    assert broken.get("k") is None
+    broken.put("k", [{"value": "x"}], model="m")  # no lanza
+
+
+def test_purge_by_model(cache):
+    cache.put("a", [], model="m1")
+    cache.put("b", [], model="m2")
+    assert cache.purge(model="m1") == 1
+    assert cache.purge() == 1
+    assert cache.stats()["entries"] == 0
+
+
+def _fake_openai(calls):
+    def create(**kwargs):
+        calls.append(kwargs)
+        content = json.dumps({"sensitive": [{"label": "Email", "value": "ana@x.es", "confidence": "high"}]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_analyze_reuses_cached_result_and_admin_can_purge(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(ai_cache, "_cache", ai_cache.ResultCache(str(tmp_path / "app.db")))
+    flask_app = create_app({"TESTING": True, "WTF_CSRF_ENABLED": False})
+    db = SessionLocal()
+    try:
+        admin_id = db.execute(select(User.id).where(User.email == "admin@demo.local")).scalar_one()
+    finally:
+        db.close()
+    client = flask_app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(admin_id)
+
+    calls = []
+    with patch("openai.OpenAI", return_value=_fake_openai(calls)):
+        first = client.post("/api/pdf/analyze", json={"text": "Contacto: ana@x.es"}).get_json()
+        second = client.post("/api/pdf/analyze", json={"text": "Contacto:   ana@x.es"}).get_json()
+        assert len(calls) == 1
+        assert first["cached"] is False and second["cached"] is True
+        assert second["sensitive"] == first["sensitive"]
+
+        stats = client.get("/admin/pdf-cache").get_json()
+        assert (stats["hits"], stats["entries"]) == (1, 1)
+        assert client.post("/admin/pdf-cache/purge", json={}).get_json()["removed"] == 1
+
+        client.post("/api/pdf/analyze", json={"text": "Contacto: ana@x.es"})
+        assert len(calls) == 2
@@ -0,0 +1,39 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_import_is_lazy_and_does_not_touch_database():
+    probe = r"""
+import json, sys
+from sqlalchemy import event
+import models
+statements = []
+event.listen(models.engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+import app
+flask_app = app.create_app()
+print(json.dumps({
+    "heavy": sorted(m for m in ("openai", "jsonschema", "fitz") if m in sys.modules),
+    "statements": len(statements),
+}))
+"""
+    out = subprocess.run(
+        [sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    assert result == {"heavy": [], "statements": 0}
+
+
+def test_create_app_builds_independent_apps_with_same_endpoints():
+    from app import create_app
+
+    first = create_app({"TESTING": True})
+    second = create_app()
+    assert first is not second
+    assert first.config["TESTING"] and not second.config.get("TESTING")
+    assert {"login", "index", "health.healthz"} <= set(first.view_functions)
+    assert set(first.view_functions) == set(second.view_functions)
+    assert "init-db" in first.cli.commands
@@ -0,0 +1,143 @@
+import random
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from attendance import SessionKind, pair_sessions, pause_seconds_between, worked_by_day
+from models import AttendanceAction
+
+TZ = ZoneInfo("Europe/Madrid")
+
+
+def _local(y, m, d, hh, mm=0):
+    return datetime(y, m, d, hh, mm, tzinfo=TZ).astimezone(timezone.utc)
+
+
+def _ev(ts, action):
+    return (ts, AttendanceAction._in if action == "in" else AttendanceAction._out)
+
+
+def test_simple_day_with_pause():
+    events = [_ev(_local(2024, 3, 4, 9), "in"), _ev(_local(2024, 3, 4, 17), "out")]
+    pauses = [(_local(2024, 3, 4, 13), _local(2024, 3, 4, 13, 30))]
+    sessions = list(pair_sessions(events, pauses, tz=TZ))
+    assert [s.kind for s in sessions] == [SessionKind.closed]
+    assert sessions[0].worked_seconds == 7 * 3600 + 1800
+    assert sessions[0].pause_seconds == 1800
+
+
+def test_night_shift_counts_on_start_day():
+    events = [_ev(_local(2024, 3, 4, 22), "in"), _ev(_local(2024, 3, 5, 6), "out")]
+    sessions = list(pair_sessions(events, tz=TZ, night_shift=True))
+    assert len(sessions) == 1
+    assert worked_by_day(sessions) == {datetime(2024, 3, 4).date(): 8 * 3600}
+
+
+def test_cross_midnight_split_without_night_shift():
+    events = [_ev(_local(2024, 3, 4, 22), "in"), _ev(_local(2024, 3, 5, 6), "out")]
+    pauses = [(_local(2024, 3, 5, 2), _local(2024, 3, 5, 3))]
+    sessions = list(pair_sessions(events, pauses, tz=TZ))
+    assert all(s.split for s in sessions)
+    assert worked_by_day(sessions) == {
+        datetime(2024, 3, 4).date(): 2 * 3600,
+        datetime(2024, 3, 5).date(): 5 * 3600,
+    }
+
+
+def test_duplicate_in_and_orphan_out():
+    events = [
+        _ev(_local(2024, 3, 4, 9), "in"),
+        _ev(_local(2024, 3, 4, 9, 1), "in"),
+        _ev(_local(2024, 3, 4, 17), "out"),
+        _ev(_local(2024, 3, 4, 17, 1), "out"),
+    ]
+    kinds = [s.kind for s in pair_sessions(events, tz=TZ)]
+    assert kinds == [SessionKind.closed, SessionKind.missing_in]
+
+
+def test_forgotten_out_does_not_swallow_next_day():
+    events = [
+        _ev(_local(2024, 3, 4, 9), "in"),
+        _ev(_local(2024, 3, 5, 9), "in"),
+        _ev(_local(2024, 3, 5, 17), "out"),
+    ]
+    sessions = list(pair_sessions(events, tz=TZ))
+    assert [s.kind for s in sessions] == [SessionKind.missing_out, SessionKind.closed]
+    assert sessions[1].worked_seconds == 8 * 3600
+
+
+def test_open_session_when_recent():
+    now = _local(2024, 3, 4, 11)
+    sessions = list(pair_sessions([_ev(_local(2024, 3, 4, 9), "in")], tz=TZ, now=now))
+    assert sessions[0].kind == SessionKind.open
+
+
+def test_dst_night_shift_length():
+    # 31/03/2024: el reloj salta de 02:00 a 03:00 en Madrid.
+    events = [_ev(_local(2024, 3, 30, 22), "in"), _ev(_local(2024, 3, 31, 6), "out")]
+    sessions = list(pair_sessions(events, tz=TZ))
+    assert sum(s.worked_seconds for s in sessions) == 7 * 3600
+
+
+def _random_stream(rng):
+    ts = _local(2024, 1, 1, 0) + timedelta(minutes=rng.randint(0, 600))
+    events, pauses = [], []
+    for _ in range(rng.randint(0, 60)):
+        ts += timedelta(minutes=rng.randint(1, 900))
+        events.append(_ev(ts, rng.choice(["in", "out"])))
+        if rng.random() < 0.3:
+            p_start = ts + timedelta(minutes=rng.randint(1, 120))
+            p_end = p_start + timedelta(minutes=rng.randint(1, 90))
+            if not pauses or pauses[-1][1] <= p_start:
+                pauses.append((p_start, p_end))
+    return events, pauses
+
+
+@pytest.mark.parametrize("seed", range(200))
+@pytest.mark.parametrize("night_shift", [False, True])
+def test_pairing_properties(seed, night_shift):
+    rng = random.Random(seed)
+    events, pauses = _random_stream(rng)
+    sessions = list(pair_sessions(events, pauses, tz=TZ, night_shift=night_shift))
+
+    ins = sum(1 for _, a in events if a == AttendanceAction._in)
+    outs = len(events) - ins
+    closed = [s for s in sessions if s.kind == SessionKind.closed]
+    # El primer tramo de una sesión partida termina en la medianoche, no en una salida.
+    cuts = {s.start for s in closed if s.split}
+    closed_outs = [s.end for s in closed if s.end not in cuts]
+    missing_in = [s for s in sessions if s.kind == SessionKind.missing_in]
+    assert len(closed_outs) + len(missing_in) == outs
+    assert len(closed_outs) + sum(1 for s in sessions if s.kind == SessionKind.missing_out) <= ins
+
+    last_start = None
+    for s in sessions:
+        assert s.worked_seconds >= 0
+        assert s.pause_seconds >= 0
+        if s.kind == SessionKind.closed:
+            span = int((s.end - s.start).total_seconds())
+            assert s.worked_seconds + s.pause_seconds == span
+            assert span <= 23 * 3600
+            assert s.workday == s.start.astimezone(TZ).date()
+            if not night_shift:
+                assert s.end.astimezone(TZ).date() == s.workday or s.end.astimezone(TZ).time() == datetime.min.time()
+        else:
+            assert s.worked_seconds == 0
+        anchor = s.start or s.end
+        if last_start is not None:
+            assert anchor >= last_start
+        last_start = anchor
+
+    total_pause = sum(int((e - s).total_seconds()) for s, e in pauses)
+    assert sum(s.pause_seconds for s in sessions) <= total_pause
+
+
+def test_pause_seconds_between_clips_and_skips_active():
+    day = datetime(2024, 3, 4, tzinfo=timezone.utc)
+    pauses = [
+        (day - timedelta(minutes=10), day + timedelta(minutes=20)),  # empieza el día anterior
+        (day + timedelta(hours=10), day + timedelta(hours=10, minutes=15)),
+        (day + timedelta(hours=12), None),  # activa
+    ]
+    assert pause_seconds_between(pauses, day, day + timedelta(days=1)) == 35 * 60
@@ -0,0 +1,112 @@
+"""Migraciones y escrituras idempotentes en SQLite y PostgreSQL.
+
+El caso PostgreSQL se salta si no hay servidor (ver ``backend_url`` en
+conftest); ``FICHAJE_TEST_BACKEND=postgresql`` ejecuta además toda la suite
+contra PostgreSQL.
+"""
+
+import threading
+
+import pytest
+from sqlalchemy import column, create_engine, inspect, select, table
+from sqlalchemy.orm import sessionmaker
+
+import dbmigrate
+import guest_acl
+from models import CacheVersion, GuestAccess, bump_cache_versions, engine_options
+
+
+@pytest.fixture
+def migrated(backend_url):
+    eng = create_engine(backend_url, future=True, **engine_options(backend_url))
+    assert dbmigrate.upgrade_database(eng) == (None, dbmigrate.SCHEMA_HEAD)
+    yield eng
+    eng.dispose()
+
+
+def _users(eng, n):
+    # Solo columnas que existen en cualquier revisión (la BD puede no estar en head)
+    users = table("users", *(column(c) for c in ("id", "email", "name", "password_hash", "role", "is_active")))
+    with eng.begin() as conn:
+        conn.execute(
+            users.insert(),
+            [
+                {"id": i, "email": f"u{i}@t", "name": f"u{i}", "password_hash": "x", "role": "employee", "is_active": True}
+                for i in range(1, n + 1)
+            ],
+        )
+
+
+def test_upgrade_is_idempotent(migrated):
+    assert dbmigrate.upgrade_database(migrated) == (dbmigrate.SCHEMA_HEAD, dbmigrate.SCHEMA_HEAD)
+    unique = {i["name"]: i["unique"] for i in inspect(migrated).get_indexes("guest_access")}
+    assert unique["ix_guest_access_guest"]
+
+
+def test_concurrent_cache_bumps_do_not_collide(migrated):
+    errors = []
+
+    def bump():
+        try:
+            for _ in range(5):
+                with migrated.begin() as conn:
+                    bump_cache_versions(conn, ["org", "user:1"])
+        except Exception as exc:  # pragma: no cover - el assert lo muestra
+            errors.append(exc)
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    with migrated.connect() as conn:
+        versions = dict(conn.execute(select(CacheVersion.name, CacheVersion.version)).all())
+    assert versions == {"org": 20, "user:1": 20}
+
+
+def test_grant_is_idempotent(migrated):
+    _users(migrated, 4)
+    Session = sessionmaker(bind=migrated)
+    with Session() as db:
+        assert guest_acl.grant(db, 1, [2, 3]) == 2
+        db.commit()
+    with Session() as db:
+        assert guest_acl.grant(db, 1, [2, 3, 4]) == 1
+        db.commit()
+    with migrated.connect() as conn:
+        rows = conn.execute(select(GuestAccess.target_user_id).where(GuestAccess.guest_user_id == 1)).scalars()
+        assert sorted(rows) == [2, 3, 4]
+
+
+def test_unique_migration_drops_duplicate_grants(backend_url):
+    eng = create_engine(backend_url, future=True)
+    dbmigrate.upgrade_database(eng, "0005_attendance_user_ts")
+    _users(eng, 2)
+    with eng.begin() as conn:
+        conn.execute(GuestAccess.__table__.insert(), [{"guest_user_id": 1, "target_user_id": 2}] * 3)
+    dbmigrate.upgrade_database(eng)
+    with eng.connect() as conn:
+        assert conn.execute(select(GuestAccess.id)).scalars().all() == [1]
+    eng.dispose()
+
+
+def test_init_lock_serializes_initialization(backend_url):
+    eng = create_engine(backend_url, future=True)
+    inside, order = threading.Event(), []
+
+    def first():
+        with dbmigrate.init_lock(eng):
+            inside.set()
+            order.append("first-start")
+            threading.Event().wait(0.2)
+            order.append("first-end")
+
+    t = threading.Thread(target=first)
+    t.start()
+    inside.wait(5)
+    with dbmigrate.init_lock(eng):
+        order.append("second")
+    t.join()
+    assert order == ["first-start", "first-end", "second"]
+    eng.dispose()
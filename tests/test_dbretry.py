@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+import app as app_module
+import dbretry
+import models
+from models import Attendance, AttendanceAction, SessionLocal, User
+from app import create_app
+
+
+def _locked():
+    return OperationalError("INSERT ...", {}, sqlite3.OperationalError("database is locked"))
+
+
+@pytest.fixture(autouse=True)
+def _clean_stats():
+    dbretry.reset_stats()
+    yield
+    dbretry.reset_stats()
+
+
+def test_retries_busy_errors_and_records_wait():
+    calls, sleeps = [], []
+
+    def fn():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _locked()
+        return "ok"
+
+    assert dbretry.run_with_retry(fn, route="r", sleep=sleeps.append) == "ok"
+    assert len(calls) == 3 and len(sleeps) == 2
+    s = dbretry.stats()["r"]
+    assert (s["transactions"], s["retries"], s["exhausted"]) == (1, 2, 0)
+
+
+def test_other_errors_are_not_retried():
+    def fn():
+        raise OperationalError("SELECT", {}, sqlite3.OperationalError("no such table: x"))
+
+    with pytest.raises(OperationalError):
+        dbretry.run_with_retry(fn, route="r", sleep=lambda d: None)
+    assert dbretry.stats() == {}
+
+
+def test_gives_up_at_deadline():
+    def fn():
+        raise _locked()
+
+    with pytest.raises(dbretry.WriteContention):
+        dbretry.run_with_retry(fn, route="r", deadline=0, sleep=lambda d: None)
+    assert dbretry.stats()["r"]["exhausted"] == 1
+
+
+def test_never_repeats_after_a_commit():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        db = SessionLocal()
+        try:
+            db.commit()
+        finally:
+            db.close()
+        raise _locked()
+
+    with pytest.raises(OperationalError):
+        dbretry.run_with_retry(fn, route="r", sleep=lambda d: None)
+    assert calls == [1]
+
+
+@pytest.fixture()
+def client():
+    flask_app = create_app({"TESTING": True, "WTF_CSRF_ENABLED": False})
+    db = SessionLocal()
+    try:
+        admin_id = db.execute(select(User.id).where(User.email == "admin@demo.local")).scalar_one()
+    finally:
+        db.close()
+    c = flask_app.test_client()
+    with c.session_transaction() as sess:
+        sess["_user_id"] = str(admin_id)
+    return c, admin_id
+
+
+def _clock_count(user_id):
+    db = SessionLocal()
+    try:
+        return db.execute(select(func.count()).where(Attendance.user_id == user_id)).scalar()
+    finally:
+        db.close()
+
+
+def test_clock_resubmission_is_idempotent(client):
+    c, admin_id = client
+    assert c.post("/clock", data={"action": "in"}).status_code == 200
+    after_first = _clock_count(admin_id)
+    assert c.post("/clock", data={"action": "in"}).status_code == 200
+    assert _clock_count(admin_id) == after_first
+    assert dbretry.stats()["clock"]["transactions"] == 2
+
+
+def test_concurrent_clocks_insert_once(client):
+    _, admin_id = client
+    before = _clock_count(admin_id)
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        last = db.execute(
+            select(Attendance.action).where(Attendance.user_id == admin_id).order_by(Attendance.ts.desc()).limit(1)
+        ).scalar()
+    finally:
+        db.close()
+    action = AttendanceAction._in if last == AttendanceAction._out else AttendanceAction._out
+    barrier = threading.Barrier(4)
+    results = []
+
+    def submit():
+        def attempt():
+            db = SessionLocal()
+            try:
+                return app_module._clock_insert_if_new(db, admin_id, action, now, "t")
+            finally:
+                db.close()
+
+        barrier.wait()
+        results.append(dbretry.run_with_retry(attempt, route="clock"))
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == [False, False, False, True]
+    assert _clock_count(admin_id) == before + 1
+
+
+@pytest.mark.skipif(models.engine.dialect.name != "sqlite", reason="bloqueo de fichero SQLite")
+def test_clock_returns_503_while_database_stays_locked(client, monkeypatch):
+    c, admin_id = client
+    monkeypatch.setattr(dbretry, "BUSY_DEADLINE", 0.05)
+    before = _clock_count(admin_id)
+    holder = sqlite3.connect(models.engine.url.database, isolation_level=None)
+    holder.execute("BEGIN EXCLUSIVE")
+    try:
+        resp = c.post("/clock", data={"action": "out"}, headers={"HX-Request": "true"})
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    assert dbretry.stats()["clock"]["exhausted"] == 1
+    assert _clock_count(admin_id) == before
@@ -0,0 +1,146 @@
+import io
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Role as UserRole, User
+from admin_panel.areas.models import AdminArea, AdminGroup
+from admin_panel.employees.importer import import_employees
+from admin_panel.employees.models import Employee
+from admin_panel.employees.sync import UNUSABLE_PASSWORD
+from admin_panel.roles.models import Role
+
+
+@pytest.fixture()
+def db_session():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(eng)
+    sess = sessionmaker(bind=eng, expire_on_commit=False)()
+    sess.add_all([Role(name="Empleado"), Role(name="Responsable")])
+    ventas = AdminArea(name="Ventas")
+    soporte = AdminArea(name="Soporte")
+    sess.add_all([ventas, soporte])
+    sess.flush()
+    sess.add_all(
+        [
+            AdminGroup(name="Norte", area_id=ventas.id),
+            AdminGroup(name="Turno A", area_id=ventas.id),
+            AdminGroup(name="Turno A", area_id=soporte.id),
+        ]
+    )
+    sess.add(User(email="ya@x.es", name="Ya", password_hash="h"))
+    sess.commit()
+    yield sess
+    sess.close()
+
+
+CSV = """name,email,role,area,group,password,active
+Ana,ANA@x.es,empleado,,Norte,secreto,si
+Bea,bea@x.es,Responsable,Ventas,Turno A,,no
+Sin email,,Empleado,,,,
+Duplicado,ana@x.es,Empleado,,,,
+Existe,ya@x.es,Empleado,,,,
+Rol,rol@x.es,Becario,,,,
+Ambiguo,amb@x.es,Empleado,,Turno A,,
+Activo,act@x.es,Empleado,,,,quizas
+"""
+
+
+def test_import_creates_valid_rows_and_reports_errors(db_session):
+    report = import_employees(db_session, io.StringIO(CSV), chunk_size=3, hash_workers=2)
+
+    assert report.rows == 8
+    assert report.created == 2
+    assert report.passwords_set == 1
+    assert [(e.line, e.email) for e in report.errors] == [
+        (4, ""),
+        (5, "ana@x.es"),
+        (6, "ya@x.es"),
+        (7, "rol@x.es"),
+        (8, "amb@x.es"),
+        (9, "act@x.es"),
+    ]
+
+    employees = {e.email: e for e in db_session.execute(select(Employee)).scalars()}
+    assert set(employees) == {"ana@x.es", "bea@x.es"}
+    ventas = db_session.execute(select(AdminArea).where(AdminArea.name == "Ventas")).scalar_one()
+    assert employees["ana@x.es"].area_id == ventas.id
+    assert employees["bea@x.es"].is_active is False
+
+    users = {u.email: u for u in db_session.execute(select(User)).scalars()}
+    assert users["ana@x.es"].check_password("secreto")
+    assert users["bea@x.es"].password_hash == UNUSABLE_PASSWORD
+    assert users["bea@x.es"].role == UserRole.responsable
+    assert users["bea@x.es"].is_active is False
+
+
+def test_dry_run_and_missing_columns(db_session):
+    report = import_employees(db_session, io.StringIO(CSV), dry_run=True)
+    assert report.valid == 2 and report.created == 0
+    assert db_session.execute(select(Employee)).first() is None
+
+    bad = import_employees(db_session, io.StringIO("nombre,email\nx,y@x.es\n"))
+    assert bad.rows == 0
+    assert bad.errors[0].message.startswith("Faltan columnas: name, role")
+
+
+def test_privileged_roles_need_allow_privileged(db_session):
+    db_session.add(Role(name="Administrador"))
+    db_session.commit()
+    csv_text = "name,email,role,password\nEva,eva@x.es,Administrador,secreto\nLuis,luis@x.es,Empleado,\n"
+
+    report = import_employees(db_session, io.StringIO(csv_text))
+    assert report.created == 1
+    assert [(e.line, e.email) for e in report.errors] == [(2, "eva@x.es")]
+    assert db_session.execute(select(User).where(User.email == "eva@x.es")).first() is None
+
+    report = import_employees(db_session, io.StringIO(csv_text.replace("luis", "otro")), allow_privileged=True)
+    assert report.ok and report.created == 2
+    eva = db_session.execute(select(User).where(User.email == "eva@x.es")).scalar_one()
+    assert eva.role == UserRole.admin and eva.check_password("secreto")
+
+
+def test_conflict_at_write_time_rejects_only_that_line(db_session, monkeypatch):
+    from admin_panel.employees import importer
+
+    # Otro proceso da de alta el email después de cargar las búsquedas
+    db_session.add(Employee(name="Tarde", email="tarde@x.es", role_id=1))
+    db_session.commit()
+
+    class StaleLookups(importer._Lookups):
+        def __init__(self, db):
+            super().__init__(db)
+            self.emails.discard("tarde@x.es")
+
+    monkeypatch.setattr(importer, "_Lookups", StaleLookups)
+    csv_text = "name,email,role\nUno,uno@x.es,Empleado\nTarde,tarde@x.es,Empleado\nDos,dos@x.es,Empleado\n"
+    report = import_employees(db_session, io.StringIO(csv_text))
+
+    assert report.created == 2
+    assert [(e.line, e.email) for e in report.errors] == [(3, "tarde@x.es")]
+    emails = set(db_session.execute(select(Employee.email)).scalars())
+    assert {"uno@x.es", "dos@x.es", "tarde@x.es"} <= emails
+
+
+def test_user_created_mid_import_keeps_its_password(db_session, monkeypatch):
+    from admin_panel.employees import importer
+
+    validate = importer._validate_row
+
+    def validate_then_signup(line, row, lookups, allow_privileged=False):
+        result = validate(line, row, lookups, allow_privileged)
+        # El usuario se da de alta en la app core entre la validación y la escritura
+        db_session.add(User(email="carlos@x.es", name="Carlos", password_hash="suyo"))
+        db_session.commit()
+        return result
+
+    monkeypatch.setattr(importer, "_validate_row", validate_then_signup)
+    report = import_employees(
+        db_session, io.StringIO("name,email,role,password\nCarlos,carlos@x.es,Empleado,robada\n")
+    )
+
+    user = db_session.execute(select(User).where(User.email == "carlos@x.es")).scalar_one()
+    assert user.password_hash == "suyo"
+    assert report.created == 1 and report.passwords_set == 0
+    assert [(e.line, e.email) for e in report.errors] == [(2, "carlos@x.es")]
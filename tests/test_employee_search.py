@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+import dbmigrate
+from models import Base  # registra antes los modelos del admin panel
+from admin_panel.employees.models import Employee
+from admin_panel.employees.search import search_clause
+from admin_panel.roles.models import Role
+
+
+@pytest.fixture()
+def db_session(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'search.db'}", future=True)
+    dbmigrate.upgrade_database(eng)
+    sess = sessionmaker(bind=eng, expire_on_commit=False)()
+    role = Role(name="Empleado")
+    sess.add(role)
+    sess.flush()
+    sess.add_all(
+        [
+            Employee(name="José García", email="jose.garcia@demo.local", role_id=role.id),
+            Employee(name="Laura Gómez", email="laura@demo.local", role_id=role.id),
+            Employee(name="Marta Ruiz", email="mruiz@otra.es", role_id=role.id),
+        ]
+    )
+    sess.commit()
+    yield sess
+    sess.close()
+
+
+def _names(sess, term):
+    clause = search_clause(sess.get_bind(), term)
+    return sorted(sess.execute(select(Employee.name).where(clause)).scalars())
+
+
+def test_prefix_and_diacritics(db_session):
+    assert _names(db_session, "jos") == ["José García"]
+    assert _names(db_session, "gomez") == ["Laura Gómez"]
+
+
+def test_email_tokens(db_session):
+    assert _names(db_session, "otra") == ["Marta Ruiz"]
+    assert _names(db_session, "demo.local") == ["José García", "Laura Gómez"]
+
+
+def test_index_follows_updates_and_deletes(db_session):
+    marta = db_session.execute(select(Employee).where(Employee.name == "Marta Ruiz")).scalar_one()
+    marta.name = "Marta Soler"
+    db_session.commit()
+    assert _names(db_session, "soler") == ["Marta Soler"]
+    assert _names(db_session, "mruiz") == ["Marta Soler"]  # sigue en el email
+    db_session.delete(marta)
+    db_session.commit()
+    assert _names(db_session, "marta") == []
+
+
+def test_punctuation_only_term_is_ignored(db_session):
+    assert search_clause(db_session.get_bind(), '"*()') is None
+
+
+def test_like_fallback_escapes_wildcards_and_runs_no_ddl():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(eng)  # sin migración 0003: no hay tabla FTS
+    sess = sessionmaker(bind=eng)()
+    role = Role(name="Empleado")
+    sess.add(role)
+    sess.flush()
+    sess.add_all(
+        [
+            Employee(name="Ana 100%", email="ana_b@x.es", role_id=role.id),
+            Employee(name="Ana 1000", email="anaxb@x.es", role_id=role.id),
+        ]
+    )
+    sess.commit()
+    assert _names(sess, "100%") == ["Ana 100%"]
+    assert _names(sess, "ana_b") == ["Ana 100%"]
+    with eng.connect() as con:
+        tables = con.exec_driver_sql("SELECT name FROM sqlite_master").scalars().all()
+    assert not any(name.startswith("admin_employees_fts") for name in tables)
+    sess.close()
@@ -0,0 +1,132 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Area, Base, Group, Role as UserRole, User
+from admin_panel.areas.models import AdminArea, AdminGroup
+from admin_panel.employees.models import Employee
+from admin_panel.employees.sync import UNUSABLE_PASSWORD, map_role_name, sync_employees
+from admin_panel.roles.models import Role
+
+
+@pytest.fixture()
+def db_session():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(eng)
+    sess = sessionmaker(bind=eng, expire_on_commit=False)()
+    yield sess
+    sess.close()
+
+
+def _seed(sess):
+    emp_role = Role(name="Empleado")
+    resp_role = Role(name="Responsable")
+    custom = Role(name="Becario")
+    area = AdminArea(name="Ventas")
+    sess.add_all([emp_role, resp_role, custom, area])
+    sess.flush()
+    group = AdminGroup(name="Norte", area_id=area.id)
+    sess.add(group)
+    sess.flush()
+    sess.add_all(
+        [
+            Employee(name="Ana", email="ana@x.es", role_id=emp_role.id, group_id=group.id),
+            Employee(name="Bea", email="bea@x.es", role_id=resp_role.id, area_id=area.id),
+            Employee(name="Carla", email="carla@x.es", role_id=custom.id, is_active=False),
+        ]
+    )
+    # Usuario ya existente con datos desfasados y otro sin empleado.
+    sess.add_all(
+        [
+            User(email="carla@x.es", name="Carla Vieja", role=UserRole.rrhh, password_hash="h"),
+            User(email="solo@x.es", name="Solo", role=UserRole.admin, password_hash="h"),
+        ]
+    )
+    sess.commit()
+
+
+def test_role_aliases():
+    assert map_role_name(" Empleado ") == UserRole.employee
+    assert map_role_name("Jefe de área") == UserRole.cap_area
+    assert map_role_name("Becario") is None
+
+
+def test_full_sync_creates_updates_and_reports(db_session):
+    _seed(db_session)
+    report = sync_employees(db_session)
+    db_session.commit()
+
+    assert report.created == ["ana@x.es", "bea@x.es"]
+    assert report.updated == ["carla@x.es"]
+    assert report.orphans == ["solo@x.es"]
+    assert report.areas_created == ["Ventas"]
+
+    users = {u.email: u for u in db_session.execute(select(User)).scalars()}
+    area = db_session.execute(select(Area).where(Area.name == "Ventas")).scalar_one()
+    group = db_session.execute(select(Group).where(Group.name == "Norte")).scalar_one()
+    assert users["ana@x.es"].group_id == group.id
+    assert users["ana@x.es"].area_id == area.id
+    assert users["ana@x.es"].password_hash == UNUSABLE_PASSWORD
+    assert not users["ana@x.es"].check_password("")
+    assert users["bea@x.es"].role == UserRole.responsable
+    # Rol sin equivalencia: se conserva el del usuario core.
+    assert users["carla@x.es"].role == UserRole.rrhh
+    assert users["carla@x.es"].name == "Carla"
+    # Clave de búsqueda del login: por default al crear, explícita al actualizar
+    assert (users["ana@x.es"].name_folded, users["carla@x.es"].name_folded) == ("ana", "carla")
+    assert users["carla@x.es"].is_active is False
+    assert users["solo@x.es"].is_active is True
+
+    again = sync_employees(db_session)
+    assert not again.changed
+    assert again.unchanged == 3
+
+
+def test_incremental_sync_only_touches_scope(db_session):
+    _seed(db_session)
+    report = sync_employees(db_session, ["ana@x.es"])
+    db_session.commit()
+    assert report.created == ["ana@x.es"]
+    assert report.orphans == []
+    emails = set(db_session.execute(select(User.email)).scalars())
+    assert "bea@x.es" not in emails
+
+
+def test_privileged_roles_need_an_admin_caller(db_session):
+    admin_role = Role(name="Administrador")
+    emp_role = Role(name="Empleado")
+    db_session.add_all([admin_role, emp_role])
+    db_session.flush()
+    db_session.add_all(
+        [
+            Employee(name="Nueva", email="nueva@x.es", role_id=admin_role.id),
+            Employee(name="Eva", email="eva@x.es", role_id=admin_role.id),
+            Employee(name="Jefa", email="jefa@x.es", role_id=emp_role.id),
+        ]
+    )
+    db_session.add_all(
+        [
+            User(email="eva@x.es", name="Eva", role=UserRole.employee, password_hash="h"),
+            User(email="jefa@x.es", name="Jefa", role=UserRole.admin, password_hash="h"),
+        ]
+    )
+    db_session.commit()
+
+    report = sync_employees(db_session)
+    db_session.commit()
+    roles = dict(db_session.execute(select(User.email, User.role)).all())
+    # Ni se concede (alta ni edición) ni se retira un rol privilegiado
+    assert roles == {
+        "nueva@x.es": UserRole.employee,
+        "eva@x.es": UserRole.employee,
+        "jefa@x.es": UserRole.admin,
+    }
+    assert report.roles_blocked == ["eva@x.es", "jefa@x.es", "nueva@x.es"]
+    assert "privilegiado" in report.summary()
+
+    report = sync_employees(db_session, allow_privileged=True)
+    db_session.commit()
+    roles = dict(db_session.execute(select(User.email, User.role)).all())
+    assert roles["eva@x.es"] == roles["nueva@x.es"] == UserRole.admin
+    assert roles["jefa@x.es"] == UserRole.employee
+    assert report.roles_blocked == []
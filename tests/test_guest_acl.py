@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, GuestAccess, Role, User
+from guest_acl import current_version, grant, revoke, set_targets, targets_for
+from rbac import can_view_user
+
+
+@pytest.fixture()
+def session_factory():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(eng)
+    return sessionmaker(bind=eng, expire_on_commit=False)
+
+
+def _seed(sess):
+    guest = User(email="g@t", name="g", role=Role.invitado, password_hash="x")
+    others = [User(email=f"u{i}@t", name=f"u{i}", password_hash="x") for i in range(5)]
+    sess.add_all([guest, *others])
+    sess.commit()
+    return guest, others
+
+
+def test_bulk_grant_revoke_and_version_bumps(session_factory):
+    db = session_factory()
+    guest, others = _seed(db)
+    ids = [u.id for u in others]
+
+    assert targets_for(db, guest.id) == frozenset()
+    assert grant(db, guest.id, ids[:3] + [guest.id]) == 3
+    db.commit()
+    assert current_version(db, guest.id) == 1
+    assert targets_for(db, guest.id) == frozenset(ids[:3])
+
+    assert revoke(db, guest.id, ids[1:]) == 2
+    assert set_targets(db, guest.id, ids[3:]) == (2, 1)
+    db.commit()
+    assert targets_for(db, guest.id) == frozenset(ids[3:])
+    assert current_version(db, guest.id) == 4
+
+
+def test_cache_is_reused_and_invalidated_across_sessions(session_factory):
+    db = session_factory()
+    guest, others = _seed(db)
+    grant(db, guest.id, [others[0].id])
+    db.commit()
+    first = targets_for(db, guest.id)
+    assert targets_for(db, guest.id) is first
+
+    # Otro "worker" (otra sesión) añade un acceso objeto a objeto.
+    other = session_factory()
+    other.add(GuestAccess(guest_user_id=guest.id, target_user_id=others[1].id))
+    other.commit()
+    assert targets_for(db, guest.id) == {others[0].id, others[1].id}
+
+
+def test_can_view_user_uses_identity_cache(session_factory):
+    db = session_factory()
+    guest, others = _seed(db)
+    grant(db, guest.id, [others[0].id])
+    db.commit()
+    guest.guest_targets = targets_for(db, guest.id)
+    # Sin sesión: la comprobación se resuelve en memoria.
+    assert can_view_user(guest, others[0]) is True
+    assert can_view_user(guest, others[1]) is False
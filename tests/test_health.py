@@ -0,0 +1,103 @@
+import pytest
+from sqlalchemy import event
+
+import health
+import models
+from app import app
+
+
+@pytest.fixture(autouse=True)
+def _reset_cache():
+    health._cached = None
+    yield
+    health._cached = None
+
+
+def _count_statements():
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(models.engine, "before_cursor_execute", count)
+    return statements, lambda: event.remove(models.engine, "before_cursor_execute", count)
+
+
+def test_healthz_is_process_only():
+    statements, stop = _count_statements()
+    try:
+        resp = app.test_client().get("/healthz")
+    finally:
+        stop()
+    assert resp.status_code == 200
+    assert resp.get_json()["status"] == "ok"
+    assert "Set-Cookie" not in resp.headers
+    assert statements == []
+
+
+def test_readyz_reports_checks_and_is_cached():
+    client = app.test_client()
+    statements, stop = _count_statements()
+    try:
+        first = client.get("/readyz")
+        probes = len(statements)
+        second = client.get("/readyz")
+    finally:
+        stop()
+    body = first.get_json()
+    assert first.status_code == 200, body
+    assert set(body["checks"]) == {"database", "migrations", "disk"}
+    assert set(body["optional"]) == {"pymupdf", "openai", "openai_api_key"}
+    assert probes > 0
+    assert len(statements) == probes
+    assert second.get_json() == body
+    # Sin autenticar solo booleanos: ni errores ni estadísticas de escritura
+    assert all(isinstance(ok, bool) for ok in body["checks"].values())
+    assert "db_writes" not in body
+
+
+def test_readyz_fails_when_database_probe_times_out(monkeypatch):
+    monkeypatch.setattr(health, "_check_database", lambda: {"ok": False, "error": "timeout"})
+    resp = app.test_client().get("/readyz")
+    assert resp.status_code == 503
+    assert resp.get_json()["status"] == "unavailable"
+
+
+def test_probes_are_get_only():
+    # Solo GET: las sondas nunca deberían necesitar token ni sesión.
+    resp = app.test_client().post("/readyz")
+    assert resp.status_code == 405
+
+
+def test_migration_check_runs_under_the_probe_timeout(monkeypatch):
+    import threading
+
+    release = threading.Event()
+
+    def hang(engine):
+        release.wait(5)
+        return "x", "x"
+
+    monkeypatch.setattr(health, "check_schema", hang)
+    monkeypatch.setattr(health, "DB_PROBE_TIMEOUT", 0.05)
+    try:
+        result = health._check_migrations()
+    finally:
+        release.set()
+    assert result == {"ok": False, "error": "timeout tras 0.05 s"}
+
+
+def test_readiness_details_are_admin_only():
+    from sqlalchemy import select
+
+    client = app.test_client()
+    assert client.get("/admin/readyz").status_code in (302, 401, 403)
+    db = models.SessionLocal()
+    try:
+        admin_id = db.execute(select(models.User.id).where(models.User.email == "admin@demo.local")).scalar_one()
+    finally:
+        db.close()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(admin_id)
+    body = client.get("/admin/readyz").get_json()
+    assert "db_writes" in body and body["checks"]["migrations"]["head"]
@@ -0,0 +1,121 @@
+import random
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Role, User, UserHierarchy
+from hierarchy import (
+    HierarchyCycleError,
+    closure_is_stale,
+    is_subordinate,
+    rebuild_closure,
+    set_supervisor,
+    subordinate_ids,
+)
+from rbac import can_edit_entries, can_view_user
+
+
+@pytest.fixture()
+def db_session():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(eng)
+    sess = sessionmaker(bind=eng, expire_on_commit=False)()
+    yield sess
+    sess.close()
+
+
+def _users(sess, n, role=Role.employee):
+    users = [User(email=f"u{i}@t", name=f"u{i}", role=role, password_hash="x") for i in range(n)]
+    sess.add_all(users)
+    sess.flush()
+    return users
+
+
+def _closure(sess):
+    return set(
+        sess.execute(
+            select(UserHierarchy.ancestor_id, UserHierarchy.descendant_id, UserHierarchy.depth)
+        ).all()
+    )
+
+
+def _expected(sess):
+    # Recorrido ingenuo hacia arriba por supervisor_id.
+    parents = dict(sess.execute(select(User.id, User.supervisor_id)).all())
+    rows = set()
+    for uid in parents:
+        node, depth = parents[uid], 1
+        while node is not None:
+            rows.add((node, uid, depth))
+            node, depth = parents[node], depth + 1
+    return rows
+
+
+def test_rebuild_matches_naive_walk(db_session):
+    rng = random.Random(3)
+    users = _users(db_session, 200)
+    for i, u in enumerate(users[1:], start=1):
+        u.supervisor_id = users[rng.randrange(i)].id
+    db_session.flush()
+    assert closure_is_stale(db_session)
+    rebuild_closure(db_session)
+    assert _closure(db_session) == _expected(db_session)
+    assert not closure_is_stale(db_session)
+
+
+def test_incremental_moves_keep_closure_exact(db_session):
+    rng = random.Random(7)
+    users = _users(db_session, 60)
+    for _ in range(300):
+        u = rng.choice(users)
+        target = rng.choice(users + [None])
+        sup = target.id if target is not None else None
+        if sup == u.id or is_subordinate(db_session, u.id, sup):
+            with pytest.raises(HierarchyCycleError):
+                set_supervisor(db_session, u, sup)
+            continue
+        set_supervisor(db_session, u, sup)
+        db_session.flush()
+    assert _closure(db_session) == _expected(db_session)
+
+
+def test_subtree_query_and_rbac_indirect_reports(db_session):
+    cap, resp, emp = _users(db_session, 3)
+    cap.role, resp.role = Role.cap_area, Role.responsable
+    set_supervisor(db_session, resp, cap.id)
+    set_supervisor(db_session, emp, resp.id)
+    db_session.commit()
+
+    ids = set(db_session.execute(select(User.id).where(User.id.in_(subordinate_ids(cap.id)))).scalars())
+    assert ids == {resp.id, emp.id}
+    assert set(db_session.execute(subordinate_ids(cap.id, max_depth=1)).scalars()) == {resp.id}
+
+    # Sin área ni grupo comunes: solo la jerarquía da acceso.
+    assert can_view_user(cap, emp, db_session) is True
+    assert can_edit_entries(cap, emp, db_session) is True
+    assert not can_view_user(emp, cap, db_session)
+    assert cap.can_validate_request_for(emp) is True
+
+    # Mover el subárbol de resp fuera de cap retira el acceso indirecto.
+    set_supervisor(db_session, resp, None)
+    db_session.commit()
+    assert not can_view_user(cap, emp, db_session)
+    assert is_subordinate(db_session, resp.id, emp.id)
+
+
+def test_rbac_without_db_uses_the_objects_session(db_session, monkeypatch):
+    import rbac
+
+    cap, resp, emp = _users(db_session, 3)
+    cap.role = Role.cap_area
+    set_supervisor(db_session, resp, cap.id)
+    set_supervisor(db_session, emp, resp.id)
+    db_session.commit()
+
+    def no_new_session():
+        raise AssertionError("abrió una sesión propia")
+
+    monkeypatch.setattr(rbac, "SessionLocal", no_new_session)
+    assert can_view_user(cap, emp) is True
+    assert can_edit_entries(cap, emp) is True
@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+import models
+from models import Base, Role, User
+from app import app, search_users_by_prefix
+
+
+@pytest.fixture()
+def db():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(eng)
+    sess = sessionmaker(bind=eng)()
+    sess.execute(
+        insert(User),
+        [
+            {"email": "ana@demo.local", "name": "Ana García", "password_hash": "x"},
+            {"email": "andres@demo.local", "name": "Andrés", "password_hash": "x"},
+            {"email": "zoe@demo.local", "name": "ANABEL", "password_hash": "x", "role": Role.rrhh},
+            {"email": "anon@demo.local", "name": "Baja", "password_hash": "x", "is_active": False},
+            {"email": "angela@demo.local", "name": "Ángela Núñez", "password_hash": "x"},
+            {"email": "nuria@demo.local", "name": "Ñuria Peña", "password_hash": "x"},
+        ]
+        + [{"email": f"an{i:02d}@x.local", "name": f"Otro {i}", "password_hash": "x"} for i in range(20)],
+    )
+    sess.commit()
+    yield sess
+    sess.close()
+
+
+def test_prefix_search_is_case_insensitive_and_limited(db):
+    names = [r.name for r in search_users_by_prefix(db, "ANA")]
+    assert "Ángela Núñez" not in names
+    assert names == ["Ana García", "ANABEL"]
+    assert [r.email for r in search_users_by_prefix(db, "zo")] == ["zoe@demo.local"]
+    assert len(search_users_by_prefix(db, "an")) == 10
+    assert all(r.email != "anon@demo.local" for r in search_users_by_prefix(db, "anon"))
+    assert search_users_by_prefix(db, "  ") == []
+
+
+def test_prefix_search_ignores_accents_on_both_sides(db):
+    assert [r.name for r in search_users_by_prefix(db, "Án")] == ["Ana García", "ANABEL", "Andrés", "Ángela Núñez"]
+    assert [r.name for r in search_users_by_prefix(db, "ange")] == ["Ángela Núñez"]
+    assert [r.name for r in search_users_by_prefix(db, "ñu")] == ["Ñuria Peña"]
+    assert [r.name for r in search_users_by_prefix(db, "NURIA")] == ["Ñuria Peña"]
+    user = db.get(User, search_users_by_prefix(db, "ñu")[0].id)
+    user.name = "Óscar"
+    db.commit()
+    assert [r.name for r in search_users_by_prefix(db, "osc")] == ["Óscar"]
+
+
+def test_prefix_search_uses_folded_index(db):
+    plan = db.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN SELECT id FROM users WHERE name_folded >= 'an' AND name_folded < 'ao'"
+    ).all()
+    assert any("ix_users_name_folded" in row[-1] for row in plan)
+
+
+def test_login_get_does_not_query_database():
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(models.engine, "before_cursor_execute", count)
+    try:
+        resp = app.test_client().get("/login")
+    finally:
+        event.remove(models.engine, "before_cursor_execute", count)
+    assert resp.status_code == 200
+    assert statements == []
+
+
+def test_search_endpoint_requires_two_characters():
+    client = app.test_client()
+    assert client.get("/login/users?q=a").get_json() == []
+    found = client.get("/login/users?q=admin@").get_json()
+    assert {"name", "email"} <= set(found[0])
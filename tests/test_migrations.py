@@ -0,0 +1,135 @@
+import pytest
+import sqlalchemy as sa
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, event, inspect
+
+import dbmigrate
+from models import Base, engine_options
+
+import admin_panel.areas.models  # noqa: F401  (registran sus tablas en Base)
+import admin_panel.calendars.models  # noqa: F401
+import admin_panel.employees.models  # noqa: F401
+import admin_panel.roles.models  # noqa: F401
+import admin_panel.schedules.models  # noqa: F401
+
+
+def _engine(tmp_path, name="db.sqlite"):
+    return create_engine(f"sqlite:///{tmp_path / name}", future=True)
+
+
+def test_schema_head_matches_alembic_scripts():
+    heads = ScriptDirectory(str(dbmigrate.MIGRATIONS_DIR)).get_heads()
+    assert heads == [dbmigrate.SCHEMA_HEAD]
+
+
+@pytest.mark.filterwarnings("ignore")  # índices de expresión no reflejables en SQLite
+def test_fresh_database_matches_models(tmp_path):
+    eng = _engine(tmp_path)
+    assert dbmigrate.upgrade_database(eng) == (None, dbmigrate.SCHEMA_HEAD)
+
+    with eng.connect() as conn:
+        diffs = compare_metadata(MigrationContext.configure(conn), Base.metadata)
+    structural = [d for d in diffs if d[0] in ("add_table", "remove_table", "add_column", "remove_column")]
+    # Tablas fuera del modelo (FTS5, alembic_version) no cuentan.
+    structural = [
+        d for d in structural
+        if not (d[0] == "remove_table" and d[1].name.startswith(("admin_employees_fts", "alembic")))
+    ]
+    assert structural == []
+    index_names = {i["name"] for i in inspect(eng).get_indexes("attendance")}
+    assert "ix_attendance_user_ts" in index_names
+
+
+def test_legacy_database_is_adopted_and_patched(tmp_path):
+    eng = _engine(tmp_path, "legacy.sqlite")
+    with eng.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR(255) NOT NULL UNIQUE, "
+            "name VARCHAR(120) NOT NULL, password_hash VARCHAR(255) NOT NULL, role VARCHAR(11) NOT NULL, "
+            "created_at DATETIME)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO users (id, email, name, password_hash, role) VALUES "
+            "(1, 'a@t', 'a', 'x', 'admin'), (2, 'b@t', 'b', 'x', 'employee')"
+        )
+        conn.exec_driver_sql("CREATE TABLE areas (id INTEGER PRIMARY KEY, name VARCHAR(120) NOT NULL)")
+
+    start, end = dbmigrate.upgrade_database(eng)
+    assert (start, end) == (None, dbmigrate.SCHEMA_HEAD)
+    insp = inspect(eng)
+    assert {"is_active", "group_id", "area_id", "supervisor_id"} <= {c["name"] for c in insp.get_columns("users")}
+    assert "manager_id" in {c["name"] for c in insp.get_columns("areas")}
+    assert "user_hierarchy" in insp.get_table_names()
+    with eng.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM users WHERE is_active = 1").scalar() == 2
+
+    # Segunda pasada: nada que hacer.
+    assert dbmigrate.upgrade_database(eng) == (dbmigrate.SCHEMA_HEAD, dbmigrate.SCHEMA_HEAD)
+
+
+def test_hierarchy_backfill_builds_closure(tmp_path):
+    eng = _engine(tmp_path)
+    dbmigrate.upgrade_database(eng, "0003_employee_search")
+    with eng.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO users (id, email, name, password_hash, role, is_active, supervisor_id) VALUES "
+            "(1, 'a@t', 'a', 'x', 'admin', 1, NULL), (2, 'b@t', 'b', 'x', 'employee', 1, 1), "
+            "(3, 'c@t', 'c', 'x', 'employee', 1, 2)"
+        )
+    dbmigrate.upgrade_database(eng)
+    with eng.connect() as conn:
+        rows = set(conn.exec_driver_sql("SELECT ancestor_id, descendant_id, depth FROM user_hierarchy"))
+    assert rows == {(1, 2, 1), (2, 3, 1), (1, 3, 2)}
+
+
+def test_check_schema_is_a_single_query(tmp_path):
+    eng = _engine(tmp_path)
+    assert dbmigrate.check_schema(eng) == (None, dbmigrate.SCHEMA_HEAD)
+    dbmigrate.upgrade_database(eng)
+
+    statements = []
+    event.listen(eng, "before_cursor_execute", lambda *a: statements.append(a[2]))
+    assert dbmigrate.check_schema(eng) == (dbmigrate.SCHEMA_HEAD, dbmigrate.SCHEMA_HEAD)
+    assert len(statements) == 1
+    dbmigrate.require_current_schema(eng)
+
+
+def test_backfill_runs_in_bounded_batches(tmp_path):
+    eng = _engine(tmp_path)
+    meta = sa.MetaData()
+    t = sa.Table("t", meta, sa.Column("id", sa.Integer, primary_key=True), sa.Column("a", sa.Integer), sa.Column("b", sa.Integer))
+    meta.create_all(eng)
+    with eng.begin() as conn:
+        conn.execute(t.insert(), [{"id": i, "a": i, "b": None if i % 2 else 0} for i in range(1, 24)])
+
+    updates = []
+    event.listen(
+        eng, "before_cursor_execute",
+        lambda conn, cur, stmt, *a: updates.append(stmt) if stmt.startswith("UPDATE") else None,
+    )
+    with eng.connect() as conn:
+        done = dbmigrate.backfill_in_batches(conn, t, {"b": t.c.a}, t.c.b.is_(None), batch_size=5)
+    assert done == 12
+    assert len(updates) == 5
+    with eng.connect() as conn:
+        assert conn.execute(sa.select(sa.func.count()).where(t.c.b.is_(None))).scalar() == 0
+
+
+def test_baseline_downgrade_is_a_noop_and_upgrade_again_works(tmp_path):
+    eng = _engine(tmp_path)
+    dbmigrate.upgrade_database(eng, "0002_schema_baseline")
+    with eng.connect() as conn:
+        tables = set(inspect(conn).get_table_names())
+        command.downgrade(dbmigrate._alembic_config(conn), "0001_rbac")
+        conn.commit()
+        assert dbmigrate.current_revision(conn) == "0001_rbac"
+        assert set(inspect(conn).get_table_names()) == tables
+    assert dbmigrate.upgrade_database(eng) == ("0001_rbac", dbmigrate.SCHEMA_HEAD)
+
+
+def test_unsupported_backend_is_rejected_when_configuring_the_engine():
+    with pytest.raises(ValueError, match="mysql"):
+        engine_options("mysql://u:p@localhost/fichaje")
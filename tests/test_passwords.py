@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import passwords
+from models import User
+
+FAST = "pbkdf2:sha256:1000"
+
+
+def test_needs_rehash_compares_normalized_parameters():
+    assert passwords.normalize_method("scrypt") == "scrypt:32768:8:1"
+    assert not passwords.needs_rehash(generate_password_hash("x", "scrypt"), "scrypt:32768:8:1")
+    assert passwords.needs_rehash(generate_password_hash("x", FAST), "pbkdf2:sha256:2000")
+    assert not passwords.needs_rehash("!sync", FAST)
+    assert not passwords.needs_rehash(None, FAST)
+
+
+def test_verify_and_update_rehashes_with_current_params(monkeypatch):
+    monkeypatch.setattr(passwords, "HASH_METHOD", FAST)
+    user = User(email="a@t", name="a", password_hash=generate_password_hash("s3cret", "pbkdf2:sha256:500"))
+
+    assert not passwords.verify_and_update(user, "wrong")
+    assert user.password_hash.startswith("pbkdf2:sha256:500$")
+
+    assert passwords.verify_and_update(user, "s3cret")
+    assert user.password_hash.startswith(FAST + "$")
+    assert user.check_password("s3cret")
+
+    current = user.password_hash
+    assert passwords.verify_and_update(user, "s3cret")
+    assert user.password_hash == current
+
+
+def test_full_pool_rejects_instead_of_waiting():
+    passwords.configure_pool(workers=1, queue=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+        return True
+
+    try:
+        worker = threading.Thread(target=lambda: passwords._pool.run(blocker))
+        worker.start()
+        assert started.wait(5)
+        with pytest.raises(passwords.VerifyBusy):
+            passwords.verify_password(generate_password_hash("x", FAST), "x")
+        release.set()
+        worker.join(5)
+        assert passwords.verify_password(generate_password_hash("x", FAST), "x")
+    finally:
+        release.set()
+        passwords.configure_pool(passwords.VERIFY_WORKERS, passwords.VERIFY_QUEUE)
+
+
+def test_busy_pool_skips_the_rehash_but_accepts_the_login(monkeypatch):
+    monkeypatch.setattr(passwords, "HASH_METHOD", FAST)
+    old = generate_password_hash("s3cret", "pbkdf2:sha256:500")
+    user = User(email="a@t", name="a", password_hash=old)
+    run = passwords._pool.run
+
+    def busy_for_rehash(fn, *args, **kwargs):
+        if fn is passwords.hash_password:
+            raise passwords.VerifyBusy("lleno")
+        return run(fn, *args, **kwargs)
+
+    monkeypatch.setattr(passwords._pool, "run", busy_for_rehash)
+    assert passwords.verify_and_update(user, "s3cret")
+    assert user.password_hash == old  # se actualizará en el siguiente login
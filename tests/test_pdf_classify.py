@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+import models  # noqa: F401  (antes que app: orden de imports de admin_panel)
+from app import _ai_classify_sensitive, _sanitize_candidate_list, app
+
+
+class FakeClient:
+    """Devuelve cada candidato como sensible; trunca trozos mayores que ``max_ok``."""
+
+    def __init__(self, delay=0.0, max_ok=None):
+        self.delay = delay
+        self.max_ok = max_ok
+        self.active = 0
+        self.peak = 0
+        self.calls = []
+        self.excerpts = {}
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        payload = json.loads(kwargs["messages"][1]["content"])
+        chunk = payload["candidates"]
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.calls.append(len(chunk))
+            self.excerpts[chunk[0]["value"]] = payload["document_excerpt"]
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.active -= 1
+        truncated = self.max_ok is not None and len(chunk) > self.max_ok
+        content = json.dumps(
+            {"sensitive": [{**c, "confidence": "high"} for c in chunk], "non_sensitive": []}
+        )
+        choice = SimpleNamespace(
+            message=SimpleNamespace(content=content),
+            finish_reason="length" if truncated else "stop",
+        )
+        return SimpleNamespace(choices=[choice])
+
+
+@pytest.fixture()
+def classify(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("PDF_AI_CANDIDATES_PER_CALL", "5")
+
+    def run(client, candidates):
+        with patch("openai.OpenAI", return_value=client), app.app_context():
+            return _ai_classify_sensitive("texto", candidates)
+
+    return run
+
+
+def _candidates(n):
+    return [{"label": "Nombre", "value": f"v{i:03d}"} for i in range(n)]
+
+
+def test_chunks_run_concurrently_and_keep_order(classify, monkeypatch):
+    monkeypatch.setenv("PDF_AI_MAX_CONCURRENCY", "6")
+    client = FakeClient(delay=0.3)
+    classify(FakeClient(), _candidates(1))  # calienta imports perezosos (jsonschema)
+    t0 = time.perf_counter()
+    result = classify(client, _candidates(30))
+    elapsed = time.perf_counter() - t0
+
+    assert [c["value"] for c in result["sensitive"]] == [f"v{i:03d}" for i in range(30)]
+    assert client.peak == 6
+    # Seis llamadas de 0.3 s: en serie serían 1.8 s
+    assert elapsed < 1.0
+
+
+def test_concurrency_is_bounded(classify, monkeypatch):
+    monkeypatch.setenv("PDF_AI_MAX_CONCURRENCY", "2")
+    client = FakeClient(delay=0.05)
+    classify(client, _candidates(30))
+    assert client.peak == 2
+    assert len(client.calls) == 6
+
+
+def test_truncated_chunks_are_split_in_place(classify, monkeypatch):
+    monkeypatch.setenv("PDF_AI_MAX_CONCURRENCY", "4")
+    client = FakeClient(max_ok=2)
+    result = classify(client, _candidates(12))
+    assert [c["value"] for c in result["sensitive"]] == [f"v{i:03d}" for i in range(12)]
+    # Ningún trozo mayor de 2 llega a aceptarse
+    assert sum(n for n in client.calls if n <= 2) == 12
+
+
+def test_repeated_candidates_are_classified_once_and_fanned_out(classify):
+    client = FakeClient()
+    candidates = [{"label": "Nombre", "value": "Ana  Pérez"}, {"label": "Email", "value": "ana@x.es"}] * 20
+    candidates.append({"label": "nombre", "value": "ANA PÉREZ"})
+    result = classify(client, candidates)
+
+    assert client.calls == [2]
+    assert result["dedup"] == {"candidates": 41, "unique": 2}
+    found = {(c["value"], c["occurrences"]) for c in result["sensitive"]}
+    assert found == {("Ana  Pérez", 20), ("ANA PÉREZ", 1), ("ana@x.es", 20)}
+
+
+def test_sanitize_counts_duplicates_before_the_cap():
+    raw = [{"label": "Nombre", "value": " Ana "}] * 100 + [{"label": "Email", "value": "ana@x.es"}]
+    clean = _sanitize_candidate_list(raw)
+    assert clean == [
+        {"label": "Nombre", "value": "Ana", "occurrences": 100},
+        {"label": "Email", "value": "ana@x.es", "occurrences": 1},
+    ]
+
+
+def test_each_chunk_gets_the_text_around_its_candidates(classify, monkeypatch):
+    monkeypatch.setenv("PDF_AI_CANDIDATES_PER_CALL", "1")
+    filler = "Texto de relleno sin datos personales. " * 400
+    text = filler + "Paciente: Ana Pérez, ingresada por neumonía. " + filler + "Contacto: ana@x.es fin."
+    client = FakeClient()
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        _ai_classify_sensitive(text, [{"label": "Nombre", "value": "ANA  PÉREZ"}, {"label": "Email", "value": "ana@x.es"}])
+
+    excerpts = client.excerpts
+    assert "ingresada por neumonía" in excerpts["ANA  PÉREZ"]
+    assert "ana@x.es" not in excerpts["ANA  PÉREZ"]
+    assert excerpts["ana@x.es"].endswith("Contacto: ana@x.es fin.")
+    assert all(len(e) < 600 for e in excerpts.values())
+
+
+def test_truncation_does_not_retry_an_unchanged_context(classify):
+    client = FakeClient(max_ok=0)
+    with pytest.raises(RuntimeError, match="truncada"):
+        classify(client, _candidates(1))
+    # El texto cabe en cualquier límite: un solo intento, no uno por límite
+    assert client.calls == [1]
+
+
+def test_progress_reports_each_chunk_with_its_items(classify, monkeypatch):
+    events = []
+    client = FakeClient()
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        _ai_classify_sensitive("texto", _candidates(12), progress=events.append)
+    assert [e["done"] for e in events] == [1, 2, 3]
+    assert {e["total"] for e in events} == {3}
+    assert sorted(i["value"] for e in events for i in e["items"]) == [f"v{i:03d}" for i in range(12)]
@@ -0,0 +1,191 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select
+
+import ai_cache
+import pdf_jobs
+from models import PdfJob, PdfJobStatus, SessionLocal, User
+from app import create_app
+
+
+def _fake_openai(delay=0.0, fail=False):
+    def create(**kwargs):
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("modelo caído")
+        content = json.dumps({"sensitive": [{"label": "Nombre persona", "value": "Ana Pérez", "confidence": "high"}]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _user_id(email):
+    db = SessionLocal()
+    try:
+        return db.execute(select(User.id).where(User.email == email)).scalar_one()
+    finally:
+        db.close()
+
+
+def _other_user_id(not_id):
+    db = SessionLocal()
+    try:
+        return db.execute(select(User.id).where(User.id != not_id).limit(1)).scalar_one()
+    finally:
+        db.close()
+
+
+@pytest.fixture()
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(ai_cache, "_cache", ai_cache.ResultCache(str(tmp_path / "c.db")))
+    flask_app = create_app({"TESTING": True, "WTF_CSRF_ENABLED": False})
+    test_client = flask_app.test_client()
+    test_client.admin_id = _user_id("admin@demo.local")
+    with test_client.session_transaction() as sess:
+        sess["_user_id"] = str(test_client.admin_id)
+    return test_client
+
+
+def _wait(client, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = client.get(f"/api/pdf/jobs/{job_id}").get_json()
+        if data["status"] in ("done", "failed"):
+            return data
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} sin terminar: {data}")
+
+
+def test_submit_returns_immediately_and_result_is_polled(client):
+    with patch("openai.OpenAI", return_value=_fake_openai(delay=0.5)):
+        t0 = time.perf_counter()
+        resp = client.post("/api/pdf/jobs", json={"text": "Paciente Ana Pérez, ingresada."})
+        assert time.perf_counter() - t0 < 0.4
+        assert resp.status_code == 202
+        job_id = resp.get_json()["job_id"]
+        assert resp.get_json()["status_url"] == f"/api/pdf/jobs/{job_id}"
+        assert client.get(f"/api/pdf/jobs/{job_id}").get_json()["status"] in ("queued", "running")
+        data = _wait(client, job_id)
+
+    assert data["status"] == "done" and data["done"] == data["total"] == 1
+    assert [item["value"] for item in data["sensitive"]] == ["Ana Pérez"]
+    assert "debug" not in data
+    db = SessionLocal()
+    try:
+        assert db.get(PdfJob, job_id).text is None  # la entrada no se conserva
+    finally:
+        db.close()
+
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(_other_user_id(client.admin_id))
+    assert client.get(f"/api/pdf/jobs/{job_id}").status_code == 404
+
+
+def test_failed_job_reports_error(client):
+    with patch("openai.OpenAI", return_value=_fake_openai(fail=True)):
+        job_id = client.post("/api/pdf/jobs", json={"text": "Ana Pérez"}).get_json()["job_id"]
+        data = _wait(client, job_id)
+    assert data["status"] == "failed" and "modelo caído" in data["error"]
+
+
+def test_active_jobs_per_user_are_limited(client, monkeypatch):
+    monkeypatch.setattr(pdf_jobs, "JOB_MAX_ACTIVE_PER_USER", 1)
+    with patch("openai.OpenAI", return_value=_fake_openai(delay=0.5)):
+        first = client.post("/api/pdf/jobs", json={"text": "Ana Pérez"}).get_json()["job_id"]
+        assert client.post("/api/pdf/jobs", json={"text": "Otro texto"}).status_code == 429
+        _wait(client, first)
+    assert client.post("/api/pdf/jobs", json={"text": ""}).status_code == 400
+
+
+def test_abandoned_job_is_requeued_by_the_next_poll(client):
+    old = datetime.now(timezone.utc) - timedelta(seconds=pdf_jobs.JOB_STALE_SECONDS + 60)
+    db = SessionLocal()
+    try:
+        # Como lo deja un worker reciclado a mitad de análisis
+        db.add(
+            PdfJob(
+                id="abandonado",
+                user_id=client.admin_id,
+                status=PdfJobStatus.running,
+                text="Paciente Ana Pérez",
+                attempts=1,
+                shards_done=0,
+                shards_total=1,
+                updated_at=old,
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    with patch("openai.OpenAI", return_value=_fake_openai()):
+        data = _wait(client, "abandonado")
+    assert data["status"] == "done"
+    assert [item["value"] for item in data["sensitive"]] == ["Ana Pérez"]
+    db = SessionLocal()
+    try:
+        assert db.get(PdfJob, "abandonado").attempts == 2
+    finally:
+        db.close()
+
+
+def _read_events(resp):
+    """(segundos desde el inicio, evento, datos) de cada mensaje SSE."""
+    t0 = time.perf_counter()
+    events, buffer = [], ""
+    for chunk in resp.response:
+        buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+        while "\n\n" in buffer:
+            message, buffer = buffer.split("\n\n", 1)
+            fields = dict(line.split(": ", 1) for line in message.splitlines() if ": " in line)
+            if "event" in fields:
+                events.append((time.perf_counter() - t0, fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_events_stream_items_as_each_shard_finishes(client, monkeypatch):
+    monkeypatch.setenv("PDF_AI_RULES", "0")
+    monkeypatch.setenv("PDF_AI_MAX_TEXT", "500")
+    monkeypatch.setenv("PDF_AI_MAX_CONCURRENCY", "1")
+    text = "\n".join(f"Parte {i}: Paciente Ana Pérez. " + "Texto de relleno. " * 25 for i in range(3))
+    with patch("openai.OpenAI", return_value=_fake_openai(delay=0.3)):
+        job_id = client.post("/api/pdf/jobs", json={"text": text}).get_json()["job_id"]
+        resp = client.get(f"/api/pdf/jobs/{job_id}/events", buffered=False)
+        assert resp.mimetype == "text/event-stream"
+        events = _read_events(resp)
+
+    kinds = [kind for _, kind, _ in events]
+    # La última parte puede llegar ya dentro del resultado final
+    assert kinds[-1] == "done" and kinds.count("items") >= 2
+    first_items = next(t for t, kind, _ in events if kind == "items")
+    done_at = events[-1][0]
+    assert first_items < done_at / 2  # una parte, no el análisis entero
+    progress = [data for _, kind, data in events if kind == "progress"]
+    assert progress[-1]["total"] == 3
+    assert [i["value"] for i in events[-1][2]["sensitive"]] == ["Ana Pérez"] * 3
+
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(_other_user_id(client.admin_id))
+    assert client.get(f"/api/pdf/jobs/{job_id}/events").status_code == 404
+
+
+def test_streams_per_worker_are_capped_and_client_can_poll(client):
+    runner = pdf_jobs.get_runner(client.application)
+    runner.max_streams = 1
+    with patch("openai.OpenAI", return_value=_fake_openai(delay=0.3)):
+        job_id = client.post("/api/pdf/jobs", json={"text": "Paciente Ana Pérez"}).get_json()["job_id"]
+        first = client.get(f"/api/pdf/jobs/{job_id}/events", buffered=False)
+        assert first.mimetype == "text/event-stream"
+        busy = client.get(f"/api/pdf/jobs/{job_id}/events")
+        assert busy.status_code == 503 and busy.get_json()["poll"] is True
+        first.close()  # el navegador cierra: el hueco queda libre
+        again = client.get(f"/api/pdf/jobs/{job_id}/events", buffered=False)
+        assert again.mimetype == "text/event-stream"
+        again.close()
+        assert _wait(client, job_id)["status"] == "done"
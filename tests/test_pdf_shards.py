@@ -0,0 +1,88 @@
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import ai_cache
+import models  # noqa: F401  (antes que app: orden de imports de admin_panel)
+from app import _ai_extract_sensitive, _shard_text, app
+
+PAGE = "Informe de actividad del periodo sin datos personales relevantes. " * 20
+
+
+def _document(pages):
+    return "\n".join(f"Página {i + 1}. {PAGE}Responsable: Persona{i:03d} Apellido." for i in range(pages))
+
+
+def test_shards_are_line_aligned_cover_everything_and_overlap():
+    text = _document(12)
+    shards = _shard_text(text, 3000, 200)
+    assert len(shards) > 1
+    assert shards[0][0] == 0 and shards[-1][0] + len(shards[-1][1]) == len(text)
+    for (prev_off, prev), (off, shard) in zip(shards, shards[1:]):
+        assert text[off:off + len(shard)] == shard
+        assert prev.endswith("\n")  # corte entre páginas
+        overlap = prev_off + len(prev) - off
+        assert 0 < overlap <= 200
+
+
+def test_single_long_line_is_split_by_sentences():
+    text = "Frase número uno con datos. " * 200
+    shards = _shard_text(text, 1000, 0)
+    assert all(shard.endswith(". ") for _, shard in shards[:-1])
+    assert "".join(shard for _, shard in shards) == text
+
+
+class ShardClient:
+    """Devuelve los nombres ``PersonaNNN Apellido`` de cada trozo, con retardo."""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.active = self.peak = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.active -= 1
+        shard = kwargs["messages"][1]["content"]
+        names = re.findall(r"Persona\d{3} Apellido", shard)
+        content = json.dumps({"sensitive": [{"label": "Nombre persona", "value": n} for n in names]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def test_long_document_is_fully_analyzed_in_parallel(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("PDF_AI_RULES", "0")
+    monkeypatch.setenv("PDF_AI_MAX_TEXT", "4000")
+    monkeypatch.setenv("PDF_AI_MAX_CONCURRENCY", "8")
+    monkeypatch.setattr(ai_cache, "_cache", ai_cache.ResultCache(str(tmp_path / "c.db")))
+    # Con ~1.4 KB por página y trozos de 4 KB, cada corte deja un nombre en el solape
+    text = _document(60) + "\nFirma: Persona000 Apellido."
+    client = ShardClient()
+    events = []
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        t0 = time.perf_counter()
+        result = _ai_extract_sensitive(text, progress=events.append)
+        elapsed = time.perf_counter() - t0
+
+    values = [item["value"] for item in result["sensitive"]]
+    expected = [f"Persona{i:03d} Apellido" for i in range(60)] + ["Persona000 Apellido"]
+    assert values == expected  # sin duplicados del solape, repetición real conservada
+    shards = result["debug"][0]["shards"]
+    assert client.calls == shards > 10
+    assert client.peak == 8
+    assert elapsed < shards * client.delay / 3
+    assert [e["done"] for e in events] == list(range(0, shards + 1))
+    assert sum(e["found"] for e in events) > 61  # parciales sin deduplicar
+    assert {e["total"] for e in events} == {shards}
@@ -0,0 +1,115 @@
+import io
+import json
+
+import fitz
+import pytest
+from sqlalchemy import select
+
+import pdf_words
+from models import SessionLocal, User
+from app import create_app
+
+
+def _pdf(pages):
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        for i, line in enumerate(lines):
+            page.insert_text((50, 80 + 20 * i), line, fontsize=11)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+PDF = _pdf(
+    [
+        ["Informe de alta", "Paciente: Ana Pérez López"],
+        ["Sin datos en esta página"],
+        ["Firma: Ana", "Pérez López, DNI 12345678Z"],
+    ]
+)
+
+
+def test_extract_is_columnar_and_offsets_point_into_text():
+    data = pdf_words.extract(PDF)
+    words = data["words"]
+    assert data["page_count"] == 3
+    assert set(words) == set(pdf_words.WORD_COLUMNS)
+    assert len({len(column) for column in words.values()}) == 1
+    assert data["text"].split("\n")[1] == "Sin datos en esta página"
+    for word, start in zip(words["text"], words["start"]):
+        assert data["text"][start:start + len(word)] == word
+    assert data["pages"]["word_start"] == [0, 7, 12]
+    assert data["pages"]["height"] == [842.0] * 3
+
+
+def test_find_boxes_unions_words_per_line_in_fitz_coordinates():
+    data = pdf_words.extract(PDF)
+    boxes = pdf_words.find_boxes(data, "ana  PÉREZ lópez")
+    assert [b["page"] for b in boxes] == [1, 3, 3]  # la segunda cruza de línea
+    first = boxes[0]
+    doc = fitz.open(stream=PDF, filetype="pdf")
+    expected = doc[0].search_for("Ana Pérez López")[0]
+    assert first["x0"] == pytest.approx(expected.x0, abs=0.5)
+    assert first["x1"] == pytest.approx(expected.x1, abs=0.5)
+    # Origen arriba a la izquierda: la segunda línea (base en y=100) queda hacia y=100
+    assert first["y0"] == pytest.approx(expected.y0, abs=1) and first["y0"] < 100 < first["y1"] + 2
+    assert pdf_words.find_boxes(data, "   ") == []
+
+
+def test_parallel_extraction_matches_serial():
+    pdf = _pdf([[f"Página {n} línea {i} Ana Pérez" for i in range(5)] for n in range(6)])
+    serial = pdf_words.extract(pdf, workers=1)
+    parallel = pdf_words.extract(pdf, workers=2, parallel_pages=2)
+    assert parallel == serial
+
+
+@pytest.fixture()
+def client():
+    flask_app = create_app({"TESTING": True, "WTF_CSRF_ENABLED": False})
+    db = SessionLocal()
+    try:
+        admin_id = db.execute(select(User.id).where(User.email == "admin@demo.local")).scalar_one()
+    finally:
+        db.close()
+    test_client = flask_app.test_client()
+    with test_client.session_transaction() as sess:
+        sess["_user_id"] = str(admin_id)
+    return test_client
+
+
+def test_extract_endpoint_and_redact_by_terms(client):
+    resp = client.post("/api/pdf/extract", data={"file": (io.BytesIO(PDF), "a.pdf")})
+    body = resp.get_json()
+    assert body["ok"] and "Ana Pérez López" in body["text"]
+    assert client.post("/api/pdf/extract", data={}).status_code == 400
+
+    resp = client.post(
+        "/api/pdf/redact",
+        data={"file": (io.BytesIO(PDF), "a.pdf"), "terms": json.dumps(["Ana Pérez López", "12345678Z"])},
+    )
+    assert resp.status_code == 200
+    out = fitz.open(stream=resp.data, filetype="pdf")
+    text = "\n".join(page.get_text() for page in out)
+    assert "Pérez" not in text and "12345678Z" not in text
+    assert "Informe de alta" in text and "Firma:" in text
+
+
+def test_redact_by_terms_reports_unmatched_and_validates_terms(client):
+    def redact(terms):
+        return client.post(
+            "/api/pdf/redact", data={"file": (io.BytesIO(PDF), "a.pdf"), "terms": terms}
+        )
+
+    resp = redact(json.dumps(["12345678Z", "Ana  Perez"]))
+    assert resp.status_code == 200
+    assert json.loads(resp.headers["X-Redact-Unmatched"]) == ["Ana  Perez"]
+
+    # Nada que censurar: error en vez del PDF original
+    resp = redact(json.dumps(["Ana  Perez"]))
+    assert resp.status_code == 422
+    assert resp.get_json()["unmatched"] == ["Ana  Perez"]
+
+    assert redact(json.dumps("Ana")).status_code == 400
+    assert redact(json.dumps([1, 2])).status_code == 400
+    assert redact("no es json").status_code == 400
@@ -0,0 +1,223 @@
+import json
+import re
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import ai_cache
+import pii_rules
+import models  # noqa: F401  (antes que app: orden de imports de admin_panel)
+from app import _ai_extract_sensitive, app
+
+DOC = (
+    "Paciente: María García López, DNI 12345678Z, NIE X1234567L, ref 12345678A.\n"
+    "Fecha de Nacimiento: 08/03/1980. Tel +34 912345678. Email maria.garcia@example.com\n"
+    "IBAN ES91 2100 0418 4502 0005 1332 en Banco Santander. Calle Mayor 15, 3º B.\n"
+    "Diagnóstico: COVID. Embargo del Juzgado. Bono Social. 5 personas empadronadas."
+)
+
+
+def _found(text):
+    return {(m.label, m.value, m.confident) for m in pii_rules.scan(text)}
+
+
+def test_validators():
+    assert pii_rules.valid_dni("12345678Z") and pii_rules.valid_dni("x1234567l")
+    assert not pii_rules.valid_dni("12345678A")
+    assert pii_rules.valid_iban("ES91 2100 0418 4502 0005 1332")
+    assert not pii_rules.valid_iban("ES92 2100 0418 4502 0005 1332")
+
+
+def test_scan_labels_and_confidence():
+    found = _found(DOC)
+    assert ("DNI/NIE", "12345678Z", True) in found
+    assert ("DNI/NIE", "X1234567L", True) in found
+    assert ("DNI/NIE", "12345678A", False) in found  # letra de control incorrecta
+    assert ("Fecha Nacimiento/DOB", "Fecha de Nacimiento: 08/03/1980", True) in found
+    assert ("Telefonos", "+34 912345678", True) in found
+    assert ("Emails", "maria.garcia@example.com", True) in found
+    assert ("Cuentas Bancarias / IBAN", "ES91 2100 0418 4502 0005 1332", True) in found
+    assert ("Nombres de Bancos", "Banco Santander", False) in found
+    assert ("Nombres completos / Doctores", "María García López", False) in found
+    assert ("Direcciones", "Calle Mayor 15, 3º B", False) in found
+    assert {"Diagnóstico", "COVID"} <= {v for label, v, _ in found if label == "Salud/Historia Clínica"}
+    assert {"Embargo", "Juzgado"} <= {v for label, v, _ in found if label == "Legal/Deudas"}
+    assert ("Datos Sociales/Vulnerabilidad", "Bono Social", False) in found
+    assert ("Ocupantes/Censo", "5 personas", False) in found
+
+
+def test_matches_are_ordered_and_disjoint():
+    matches = list(pii_rules.scan(DOC))
+    for a, b in zip(matches, matches[1:]):
+        assert a.end <= b.start
+    for m in matches:
+        assert DOC[m.start:m.end] == m.value
+
+
+def test_keywords_ignore_case_and_accents():
+    found = _found("ejecucion de la SENTENCIA; prescripcion y analitica")
+    assert {v for _, v, _ in found} == {"ejecucion", "SENTENCIA", "prescripcion", "analitica"}
+    assert "Banco" not in {v for _, v, _ in _found("bancos de datos")}
+
+
+def test_trie_pattern_matches_exactly_the_words():
+    words = ["banco", "banca", "ban", "bono social"]
+    rx = re.compile(rf"(?:{pii_rules.trie_pattern(words)})\Z")
+    for w in words + ["BONO   social"]:
+        assert rx.match(w.lower())
+    assert not rx.match("banc")
+
+
+def test_mask_replaces_only_given_matches():
+    sure, unsure = pii_rules.split(pii_rules.scan(DOC))
+    masked = pii_rules.mask(DOC, sure)
+    assert "12345678Z" not in masked and "[DNI/NIE]" in masked
+    assert "maria.garcia@example.com" not in masked
+    assert all(m.value in masked for m in unsure)
+
+
+def test_extract_returns_rule_hits_and_masks_model_input(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(ai_cache, "_cache", ai_cache.ResultCache(str(tmp_path / "c.db")))
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs["messages"][1]["content"])
+        content = json.dumps(
+            {
+                "sensitive": [
+                    {"label": "Nombre persona", "value": "María García López", "confidence": "high"},
+                    {"label": "Email", "value": "[Emails]", "confidence": "high"},
+                ]
+            }
+        )
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        result = _ai_extract_sensitive(DOC)
+
+    assert "12345678Z" not in sent[0] and "maria.garcia@example.com" not in sent[0]
+    values = [item["value"] for item in result["sensitive"]]
+    assert "12345678Z" in values and "María García López" in values
+    assert "[Emails]" not in values
+    assert result["debug"][0]["rules"]["chars_masked"] > 0
+
+
+def test_candidate_mode_sends_ambiguous_matches_to_the_classifier(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("PDF_AI_MODE", "candidates")
+    monkeypatch.setattr(ai_cache, "_cache", ai_cache.ResultCache(str(tmp_path / "c.db")))
+    payloads = []
+
+    def create(**kwargs):
+        payload = json.loads(kwargs["messages"][1]["content"])
+        payloads.append(payload)
+        keep = [
+            {**c, "confidence": "high"} for c in payload["candidates"] if c["label"] != "Nombres de Bancos"
+        ]
+        content = json.dumps({"sensitive": keep, "non_sensitive": []})
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")]
+        )
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        result = _ai_extract_sensitive(DOC)
+
+    sent = {c["value"] for p in payloads for c in p["candidates"]}
+    assert "María García López" in sent and "12345678A" in sent
+    # Lo confirmado por reglas ni se pregunta ni aparece en el contexto
+    assert "12345678Z" not in sent
+    assert all("12345678Z" not in p["document_excerpt"] for p in payloads)
+    values = [item["value"] for item in result["sensitive"]]
+    assert "12345678Z" in values and "María García López" in values
+    assert "Banco Santander" not in values
+    assert result["debug"][0]["mode"] == "candidates"
+
+
+def test_candidate_mode_asks_once_per_repeated_value(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("PDF_AI_MODE", "candidates")
+    monkeypatch.setattr(ai_cache, "_cache", ai_cache.ResultCache(str(tmp_path / "c.db")))
+    sent = []
+
+    def create(**kwargs):
+        candidates = json.loads(kwargs["messages"][1]["content"])["candidates"]
+        sent.extend(c["value"] for c in candidates)
+        content = json.dumps(
+            {"sensitive": [{**c, "confidence": "high"} for c in candidates], "non_sensitive": []}
+        )
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")]
+        )
+
+    text = "\n".join(f"Paciente: María García López, visita {i}." for i in range(3))
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        result = _ai_extract_sensitive(text)
+
+    assert sent.count("María García López") == 1
+    names = [item for item in result["sensitive"] if item["value"] == "María García López"]
+    assert [item["occurrences"] for item in names] == [3]
+    assert result["debug"][0]["dedup"]["unique"] < result["debug"][0]["dedup"]["candidates"]
+
+
+def test_candidate_mode_sends_only_the_text_around_candidates(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("PDF_AI_MODE", "candidates")
+    monkeypatch.setattr(ai_cache, "_cache", ai_cache.ResultCache(str(tmp_path / "c.db")))
+    payloads = []
+
+    def create(**kwargs):
+        payloads.append(json.loads(kwargs["messages"][1]["content"]))
+        content = json.dumps({"sensitive": [], "non_sensitive": []})
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")]
+        )
+
+    filler = "Texto administrativo sin datos personales. " * 400
+    text = f"{filler}\nPaciente: María García López, revisión anual.\n{filler}"
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        _ai_extract_sensitive(text)
+
+    [payload] = payloads
+    assert payload["chunk_info"]["context"] == "windows"
+    assert "María García López" in payload["document_excerpt"]
+    assert len(payload["document_excerpt"]) < 1000 < len(text)
+
+
+def test_unmasker_maps_masked_positions_back():
+    sure, _ = pii_rules.split(pii_rules.scan(DOC))
+    masked = pii_rules.mask(DOC, sure)
+    to_original = pii_rules.unmasker(sure)
+    for word in ("María", "Banco Santander", "COVID", "empadronadas"):
+        assert to_original(masked.index(word)) == DOC.index(word)
+
+
+def test_extract_orders_rule_and_model_findings_by_position(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("PDF_AI_MAX_OUTPUT_TOKENS", "1234")
+    monkeypatch.setattr(ai_cache, "_cache", ai_cache.ResultCache(str(tmp_path / "c.db")))
+    limits = []
+
+    def create(**kwargs):
+        limits.append(kwargs["max_tokens"])
+        content = json.dumps(
+            {
+                "sensitive": [
+                    {"label": "Direccion", "value": "Calle Mayor 15"},
+                    {"label": "Nombre persona", "value": "María García López"},
+                ]
+            }
+        )
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        result = _ai_extract_sensitive(DOC)
+
+    assert limits == [1234]
+    values = [item["value"] for item in result["sensitive"]]
+    order = ["María García López", "12345678Z", "ES91 2100 0418 4502 0005 1332", "Calle Mayor 15"]
+    assert [v for v in values if v in order] == order
@@ -59,3 +59,31 @@ def test_responsable_scope_group_can_and_cannot(db_session):
     assert can_edit_entries(resp, e1) is True
     assert can_edit_entries(resp, e2) is False
 
+
+
+def test_create_user_with_unknown_supervisor_is_rejected():
+    from sqlalchemy import select
+    from app import create_app
+
+    flask_app = create_app({"TESTING": True, "WTF_CSRF_ENABLED": False})
+    db = SessionLocal()
+    try:
+        admin = db.execute(select(User).where(User.email == "admin@demo.local")).scalar_one()
+    finally:
+        db.close()
+    client = flask_app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(admin.id)
+
+    form = {"email": "sup-missing@test", "name": "Nuevo", "password": "secreto", "supervisor_id": "999999"}
+    resp = client.post("/admin/users/create", data=form, follow_redirects=True)
+    assert "Supervisor no encontrado" in resp.get_data(as_text=True)
+    form.update(email="sup-ok@test", supervisor_id=str(admin.id))
+    client.post("/admin/users/create", data=form)
+
+    db = SessionLocal()
+    try:
+        created = {u.email: u.supervisor_id for u in db.execute(select(User).where(User.email.like("sup-%@test"))).scalars()}
+    finally:
+        db.close()
+    assert created == {"sup-ok@test": admin.id}
@@ -0,0 +1,104 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import ai_cache
+import token_budget
+import models  # noqa: F401  (antes que app: orden de imports de admin_panel)
+from app import _ai_classify_sensitive, _ai_extract_sensitive, app
+
+
+def test_plan_respects_item_and_output_limits_in_order():
+    items = list(range(10))
+    plans = token_budget.plan_calls(
+        items,
+        fixed_input=100,
+        item_input=lambda i: 10,
+        item_output=lambda i: 250 if i == 3 else 50,
+        max_items=4,
+        max_output=500,  # 500 * 0.7 = 350 tokens planificables
+    )
+    assert [p.items for p in plans] == [[0, 1, 2], [3, 4, 5], [6, 7, 8, 9]]
+    assert all(p.output_tokens <= token_budget.output_budget(500) for p in plans)
+    assert plans[0].input_tokens == 130
+
+
+def test_item_larger_than_budget_goes_alone():
+    plans = token_budget.plan_calls(
+        ["a", "big", "b"],
+        fixed_input=0,
+        item_input=lambda i: 1,
+        item_output=lambda i: 10_000 if i == "big" else 1,
+        max_items=50,
+        max_output=1000,
+    )
+    assert [p.items for p in plans] == [["a"], ["big"], ["b"]]
+
+
+def test_estimator_calibrates_towards_actual_usage():
+    est = token_budget.Estimator(alpha=0.5)
+    text = "Paciente María García, DNI 12345678Z"
+    planned = est.estimate(text)
+    for _ in range(10):
+        est.record("input", est.estimate(text), planned * 2)
+    assert abs(est.estimate(text) - planned * 2) <= 1
+    stats = est.stats()
+    assert stats["input"]["calls"] == 10 and stats["output"]["calls"] == 0
+    est.record("output", 0, 50)  # sin previsión no se anota
+    assert est.stats()["output"]["calls"] == 0
+
+
+def test_classify_sizes_chunks_up_front_and_records_usage(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("PDF_AI_MAX_OUTPUT_TOKENS", "1000")
+    monkeypatch.setattr(token_budget, "_estimator", token_budget.Estimator())
+    calls = []
+
+    def create(**kwargs):
+        chunk = json.loads(kwargs["messages"][1]["content"])["candidates"]
+        content = json.dumps({"sensitive": [{**c, "confidence": "high"} for c in chunk], "non_sensitive": []})
+        # Respuesta truncada si la salida real supera max_tokens (~60 tokens por candidato)
+        truncated = 60 * len(chunk) > kwargs["max_tokens"]
+        calls.append((len(chunk), truncated))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="length" if truncated else "stop")],
+            usage=SimpleNamespace(prompt_tokens=900, completion_tokens=60 * len(chunk)),
+        )
+
+    candidates = [{"label": "Dirección", "value": f"Calle del Doctor Fleming número {i}, 3º izquierda, 28036 Madrid"} for i in range(40)]
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        result = _ai_classify_sensitive("texto", candidates)
+
+    assert len(result["sensitive"]) == 40
+    assert not any(truncated for _, truncated in calls)
+    assert sum(n for n, _ in calls) == 40
+    tokens = result["debug"][0]["tokens"]
+    assert tokens["output"] == 60 * calls[0][0] and tokens["planned_output"] > 0
+    stats = token_budget.get_estimator().stats()
+    assert stats["input"]["calls"] == stats["output"]["calls"] == len(calls)
+
+
+def test_extract_shards_record_planned_and_actual_input(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("PDF_AI_MAX_TEXT", "500")
+    monkeypatch.setattr(token_budget, "_estimator", token_budget.Estimator())
+    monkeypatch.setattr(ai_cache, "_cache", ai_cache.ResultCache(str(tmp_path / "c.db")))
+
+    def create(**kwargs):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content='{"sensitive": []}'), finish_reason="stop")],
+            usage=SimpleNamespace(prompt_tokens=1500, completion_tokens=10),
+        )
+
+    text = "\n".join(f"Línea {i} del informe sin datos personales." for i in range(60))
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with patch("openai.OpenAI", return_value=client), app.app_context():
+        result = _ai_extract_sensitive(text)
+
+    shards = result["debug"][0]["shards"]
+    assert shards > 1
+    stats = token_budget.get_estimator().stats()
+    assert stats["input"]["calls"] == shards and stats["input"]["actual_tokens"] == 1500 * shards
+    assert stats["output"]["calls"] == 0
+    assert all(trace["tokens"]["planned_input"] > 0 for trace in result["debug"][1:])
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from tzbatch import OffsetTable, format_local_many, local_days_many
+
+TZ = ZoneInfo("Europe/Madrid")
+
+
+def _per_row(ts):
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(TZ).strftime("%d/%m/%Y %H:%M:%S")
+
+
+def test_transitions_match_zoneinfo():
+    table = OffsetTable(TZ, 2024, 2024)
+    # Madrid: +1h en invierno, +2h en verano; dos cambios en 2024.
+    assert list(table.offsets) == [3600, 7200, 3600]
+    assert table.transitions[1] == int(datetime(2024, 3, 31, 1, tzinfo=timezone.utc).timestamp())
+    assert table.transitions[2] == int(datetime(2024, 10, 27, 1, tzinfo=timezone.utc).timestamp())
+
+
+def test_batch_matches_per_row_around_dst():
+    rows = []
+    for anchor in (datetime(2024, 3, 31, 0, 30), datetime(2024, 10, 26, 23, 30)):
+        rows.extend(anchor + timedelta(minutes=7 * i) for i in range(40))
+    rows.append(None)
+    rows.append(datetime(2031, 7, 1, 12, 0, tzinfo=timezone.utc))
+
+    expected = [_per_row(r) if r is not None else "-" for r in rows]
+    assert format_local_many(TZ, rows) == expected
+
+    expected_days = [
+        (r if r.tzinfo else r.replace(tzinfo=timezone.utc)).astimezone(TZ).date() if r else None
+        for r in rows
+    ]
+    assert local_days_many(TZ, rows) == expected_days
+
+
+def test_aware_non_utc_input():
+    ts = datetime(2024, 7, 1, 23, 30, tzinfo=TZ)
+    assert format_local_many(TZ, [ts]) == ["01/07/2024 23:30:00"]
+
+
+def test_time_only_format_matches_to_local_hms():
+    rows = [datetime(2024, 3, 31, 0, 59, 59), None, datetime(2024, 3, 31, 1, 0, 0)]
+    assert format_local_many(TZ, rows, missing="", with_date=False) == ["01:59:59", "", "03:00:00"]
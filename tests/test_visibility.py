@@ -0,0 +1,89 @@
+import random
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Area, Base, Group, Role, User
+from guest_acl import grant
+from hierarchy import set_supervisor
+from rbac import can_edit_entries, can_view_user
+from visibility import UserBitset, viewer_scope
+
+
+@pytest.fixture()
+def db_session():
+    eng = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(eng)
+    sess = sessionmaker(bind=eng, expire_on_commit=False)()
+    yield sess
+    sess.close()
+
+
+def _random_org(sess, rng, n=40):
+    areas = [Area(name=f"A{i}") for i in range(3)]
+    sess.add_all(areas)
+    sess.flush()
+    groups = [Group(name=f"G{i}", area_id=areas[i % 3].id) for i in range(5)]
+    sess.add_all(groups)
+    sess.flush()
+    users = []
+    for i in range(n):
+        group = rng.choice(groups + [None])
+        users.append(
+            User(
+                email=f"u{i}@t",
+                name=f"u{i}",
+                password_hash="x",
+                role=rng.choice(list(Role)),
+                group_id=group.id if group else None,
+                area_id=group.area_id if group else rng.choice([None, areas[0].id]),
+                is_active=rng.random() > 0.1,
+            )
+        )
+    sess.add_all(users)
+    sess.flush()
+    for i, u in enumerate(users[1:], start=1):
+        if rng.random() < 0.7:
+            set_supervisor(sess, u, users[rng.randrange(i)].id)
+    areas[1].manager_id = users[3].id
+    for guest in (u for u in users if u.role == Role.invitado):
+        grant(sess, guest.id, [u.id for u in rng.sample(users, 5)])
+    sess.commit()
+    return users
+
+
+def test_bitset_membership_and_iteration():
+    ids = [0, 3, 8, 9, 1000]
+    bits = UserBitset(ids)
+    assert list(bits) == ids and len(bits) == 5
+    assert 1000 in bits and 999 not in bits and None not in bits and 5000 not in bits
+
+
+def test_scope_matches_predicates(db_session):
+    rng = random.Random(11)
+    users = _random_org(db_session, rng)
+    for viewer in users:
+        scope = viewer_scope(db_session, viewer)
+        for target in users:
+            assert scope.can_view(target.id) == bool(can_view_user(viewer, target, db_session))
+            if viewer.role != Role.invitado:
+                assert scope.can_edit(target.id) == bool(can_edit_entries(viewer, target, db_session))
+            else:
+                assert not scope.can_edit(target.id)
+            if viewer.id != target.id:
+                assert scope.can_approve(target.id) == viewer.can_validate_request_for(target)
+
+
+def test_scope_cached_until_org_changes(db_session):
+    rng = random.Random(5)
+    users = _random_org(db_session, rng, n=10)
+    viewer = next(u for u in users if u.role == Role.employee)
+    first = viewer_scope(db_session, viewer)
+    assert viewer_scope(db_session, viewer) is first
+
+    target = next(u for u in users if u.id != viewer.id and not first.can_view(u.id))
+    set_supervisor(db_session, target, viewer.id)
+    db_session.commit()
+    again = viewer_scope(db_session, viewer)
+    assert again is not first and again.can_view(target.id)
@@ -0,0 +1,186 @@
+"""Presupuesto de tokens de las llamadas al modelo del análisis de PDFs.
+
+Antes se descubría que una llamada no cabía cuando la respuesta volvía con
+``finish_reason == "length"``; entonces se reintentaba con extractos más
+cortos y se partía el trozo, a veces cinco llamadas perdidas por trozo.
+Aquí se estiman los tokens en local y :func:`plan_calls` reparte los
+candidatos en llamadas que caben de antemano en ``PDF_AI_MAX_OUTPUT_TOKENS``
+y en el contexto del modelo (``PDF_AI_CONTEXT_TOKENS``).
+
+* Con ``tiktoken`` instalado se cuenta con el tokenizador del modelo.
+* Sin él, un estimador por palabras y signos (una palabra ~ 1 token por
+  cada 4 caracteres, cada signo 1 token).
+
+En ambos casos cada llamada registra lo previsto frente a lo que devuelve
+``usage`` y un factor de corrección (media móvil) ajusta las estimaciones
+siguientes. Los trozos de texto de ``_ai_extract_sensitive`` (una llamada
+cada uno, ya medidos en caracteres) solo anotan la entrada. Las cifras son
+por proceso; ``GET /admin/pdf-tokens`` las muestra.
+"""
+
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Optional, Sequence
+
+MODEL_CONTEXT_TOKENS = int(os.getenv("PDF_AI_CONTEXT_TOKENS", "128000"))
+# Margen sobre el máximo de salida: la estimación nunca es exacta
+OUTPUT_SAFETY = 0.8
+# Parte de la salida reservada a datos extraídos del extracto (no candidatos)
+EXTRACTION_RESERVE = 0.1
+# Salida por candidato además de su JSON: reason, confidence y separadores
+OUTPUT_ITEM_OVERHEAD = 30
+# Tokens fijos por mensaje del chat (rol, delimitadores)
+MESSAGE_OVERHEAD = 4
+
+_WORDS = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=8)
+def _encoder(model: Optional[str]):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model or "gpt-4o-mini")
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def raw_estimate(text: str, model: Optional[str] = None) -> int:
+    """Tokens de ``text`` sin calibrar (tokenizador si lo hay, heurística si no)."""
+    if not text:
+        return 0
+    encoder = _encoder(model)
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return sum(math.ceil(len(w) / 4) if w[0].isalnum() or w[0] == "_" else 1 for w in _WORDS.findall(text))
+
+
+@dataclass(slots=True)
+class _Calibration:
+    factor: float = 1.0
+    calls: int = 0
+    planned: int = 0
+    actual: int = 0
+    abs_error: int = 0
+
+
+class Estimator:
+    """Estimación calibrada con el uso real que informa la API."""
+
+    def __init__(self, *, alpha: float = 0.2, min_factor: float = 0.5, max_factor: float = 3.0):
+        self.alpha = alpha
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self._kinds = {"input": _Calibration(), "output": _Calibration()}
+        self._lock = threading.Lock()
+
+    def factor(self, kind: str) -> float:
+        return self._kinds[kind].factor
+
+    def estimate(self, text: str, *, kind: str = "input", model: Optional[str] = None) -> int:
+        return math.ceil(raw_estimate(text, model) * self._kinds[kind].factor)
+
+    def record(self, kind: str, planned: int, actual: Optional[int]) -> None:
+        """Anota lo previsto frente a lo real y corrige el factor de ``kind``."""
+        if not planned or not actual:
+            return
+        with self._lock:
+            cal = self._kinds[kind]
+            cal.calls += 1
+            cal.planned += planned
+            cal.actual += actual
+            cal.abs_error += abs(actual - planned)
+            target = cal.factor * actual / planned
+            cal.factor = min(
+                self.max_factor,
+                max(self.min_factor, (1 - self.alpha) * cal.factor + self.alpha * target),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                kind: {
+                    "calls": cal.calls,
+                    "planned_tokens": cal.planned,
+                    "actual_tokens": cal.actual,
+                    "mean_abs_error": round(cal.abs_error / cal.calls, 1) if cal.calls else None,
+                    "factor": round(cal.factor, 3),
+                }
+                for kind, cal in self._kinds.items()
+            } | {"tokenizer": "tiktoken" if _encoder(None) is not None else "heuristic"}
+
+
+@dataclass(slots=True)
+class CallPlan:
+    items: list = field(default_factory=list)
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+def output_budget(max_output_tokens: int) -> int:
+    """Tokens de salida que se planifican para candidatos en una llamada."""
+    return int(max_output_tokens * (OUTPUT_SAFETY - EXTRACTION_RESERVE))
+
+
+def plan_calls(
+    items: Sequence,
+    *,
+    fixed_input: int,
+    item_input: Callable[[object], int],
+    item_output: Callable[[object], int],
+    max_items: int,
+    max_output: int,
+    context_tokens: int = MODEL_CONTEXT_TOKENS,
+) -> list[CallPlan]:
+    """Agrupa ``items`` en orden en llamadas que caben en el presupuesto.
+
+    ``fixed_input`` son los tokens de entrada comunes a toda llamada (prompt
+    de sistema, extracto); ``item_input``/``item_output`` estiman lo que
+    añade cada elemento. Un elemento que no cabe ni solo va en su propia
+    llamada: el troceo por truncado sigue como red de seguridad.
+    """
+    out_budget = output_budget(max_output)
+    in_budget = context_tokens - max_output
+    plans: list[CallPlan] = []
+    current = CallPlan(input_tokens=fixed_input)
+    for item in items:
+        cost_in, cost_out = item_input(item), item_output(item)
+        fits = (
+            len(current.items) < max_items
+            and current.output_tokens + cost_out <= out_budget
+            and current.input_tokens + cost_in <= in_budget
+        )
+        if current.items and not fits:
+            plans.append(current)
+            current = CallPlan(input_tokens=fixed_input)
+        current.items.append(item)
+        current.input_tokens += cost_in
+        current.output_tokens += cost_out
+    if current.items:
+        plans.append(current)
+    return plans
+
+
+_estimator = Estimator()
+
+
+def get_estimator() -> Estimator:
+    return _estimator
+
+
+__all__ = [
+    "CallPlan",
+    "Estimator",
+    "MESSAGE_OVERHEAD",
+    "OUTPUT_ITEM_OVERHEAD",
+    "get_estimator",
+    "output_budget",
+    "plan_calls",
+    "raw_estimate",
+]
@@ -0,0 +1,232 @@
+"""Conversión horaria por lotes para informes y listados.
+
+En lugar de llamar a ``astimezone(TZ)`` fila a fila, se precalcula una tabla
+de transiciones de offset UTC para los años implicados y se convierten
+arrays de epoch (segundos) a índices de día local y cadenas locales de una
+vez. Si NumPy está instalado se usa ``searchsorted``; si no, ``bisect`` sobre
+``array``. Los cambios de horario (DST) se respetan porque cada instante toma
+el offset vigente según la tabla.
+"""
+
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, Optional, Sequence
+
+try:  # pragma: no cover - depende del entorno
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+_EPOCH_DATE = date(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH_DATE.toordinal()
+_DAY = 86400
+# Paso de muestreo para localizar transiciones; ninguna zona cambia de offset
+# dos veces en menos de 6 horas.
+_SCAN_STEP = 6 * 3600
+
+
+def _offset_seconds(tz, epoch: int) -> int:
+    dt = datetime.fromtimestamp(epoch, tz)
+    return int(dt.utcoffset().total_seconds())
+
+
+class OffsetTable:
+    """Tabla de offsets UTC de ``tz`` entre ``first_year`` y ``last_year``.
+
+    ``transitions[i]`` es el epoch desde el que rige ``offsets[i]``. Los
+    instantes fuera del rango usan el offset del extremo más cercano.
+    """
+
+    __slots__ = ("tz", "first_year", "last_year", "transitions", "offsets", "_day_labels")
+
+    def __init__(self, tz, first_year: int, last_year: int):
+        self.tz = tz
+        self.first_year = first_year
+        self.last_year = last_year
+        start = int(datetime(first_year, 1, 1, tzinfo=timezone.utc).timestamp()) - _DAY
+        end = int(datetime(last_year + 1, 1, 1, tzinfo=timezone.utc).timestamp()) + _DAY
+
+        transitions = array("q", [start])
+        offsets = array("l", [_offset_seconds(tz, start)])
+        prev_epoch, prev_off = start, offsets[0]
+        epoch = start + _SCAN_STEP
+        while epoch <= end:
+            off = _offset_seconds(tz, epoch)
+            if off != prev_off:
+                # Búsqueda binaria del segundo exacto del cambio.
+                lo, hi = prev_epoch, epoch
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if _offset_seconds(tz, mid) == prev_off:
+                        lo = mid
+                    else:
+                        hi = mid
+                transitions.append(hi)
+                offsets.append(off)
+                prev_off = off
+            prev_epoch = epoch
+            epoch += _SCAN_STEP
+        self.transitions = transitions
+        self.offsets = offsets
+        self._day_labels: dict[int, str] = {}
+
+    def offset_at(self, epoch: float) -> int:
+        idx = bisect_right(self.transitions, epoch) - 1
+        return self.offsets[max(idx, 0)]
+
+    def local_seconds(self, epochs: Sequence[int]):
+        """Epoch -> segundos locales (epoch + offset vigente)."""
+        if np is not None:
+            arr = np.asarray(epochs, dtype=np.int64)
+            idx = np.searchsorted(np.frombuffer(self.transitions, dtype=np.int64), arr, side="right") - 1
+            idx = np.clip(idx, 0, len(self.offsets) - 1)
+            return arr + np.asarray(self.offsets, dtype=np.int64)[idx]
+        transitions = self.transitions
+        offsets = self.offsets
+        last = len(transitions) - 1
+        out = array("q")
+        # Las filas suelen venir ordenadas: se reutiliza el intervalo anterior
+        # y solo se hace bisect al salir de él.
+        lo = hi = 0
+        off = offsets[0]
+        for e in epochs:
+            if not (lo <= e < hi):
+                idx = bisect_right(transitions, e) - 1
+                if idx < 0:
+                    idx = 0
+                lo = transitions[idx] if idx else -(1 << 62)
+                hi = transitions[idx + 1] if idx < last else (1 << 62)
+                off = offsets[idx]
+            out.append(e + off)
+        return out
+
+    def day_indices(self, epochs: Sequence[int]):
+        """Epoch -> índice de día local (días desde 1970-01-01, ver ``to_date``)."""
+        local = self.local_seconds(epochs)
+        if np is not None:
+            return local // _DAY
+        return array("l", (s // _DAY for s in local))
+
+    def day_label(self, day_index: int) -> str:
+        label = self._day_labels.get(day_index)
+        if label is None:
+            label = to_date(day_index).strftime("%d/%m/%Y")
+            self._day_labels[day_index] = label
+        return label
+
+    def format_local(self, epochs: Sequence[int], with_date: bool = True) -> list[str]:
+        """Equivalente por lotes de ``to_local`` (o ``to_local_hms`` con ``with_date=False``).
+
+        Fecha y hora se toman de cachés: una cadena por día distinto y una por
+        segundo del día, así que no se llama a ``strftime`` por fila.
+        """
+        labels = self._day_labels
+        day_label = self.day_label
+        out = []
+        append = out.append
+        for s in self.local_seconds(epochs):
+            day, sod = divmod(int(s), _DAY)
+            hms = _HMS.get(sod) or _hms(sod)
+            if with_date:
+                append((labels.get(day) or day_label(day)) + " " + hms)
+            else:
+                append(hms)
+        return out
+
+
+_HMS: dict[int, str] = {}
+
+
+def _hms(second_of_day: int) -> str:
+    h, rem = divmod(second_of_day, 3600)
+    m, s = divmod(rem, 60)
+    label = "%02d:%02d:%02d" % (h, m, s)
+    _HMS[second_of_day] = label
+    return label
+
+
+def to_date(day_index: int) -> date:
+    return _EPOCH_DATE + timedelta(days=int(day_index))
+
+
+def epoch_seconds(values: Iterable[Optional[datetime]]) -> list[Optional[int]]:
+    """Datetimes (naive => UTC) a epoch entero; ``None`` se conserva.
+
+    Usa aritmética de ordinales en lugar de ``timestamp()``, bastante más cara.
+    """
+    out = []
+    append = out.append
+    for ts in values:
+        if ts is None:
+            append(None)
+            continue
+        e = (ts.toordinal() - _EPOCH_ORDINAL) * _DAY + ts.hour * 3600 + ts.minute * 60 + ts.second
+        off = ts.utcoffset()
+        if off:
+            e -= off.days * _DAY + off.seconds
+        append(e)
+    return out
+
+
+@lru_cache(maxsize=16)
+def _cached_table(tz, first_year: int, last_year: int) -> OffsetTable:
+    return OffsetTable(tz, first_year, last_year)
+
+
+def table_for(tz, epochs: Sequence[Optional[int]]) -> OffsetTable:
+    """Tabla cacheada que cubre los años de ``epochs`` (mínimo: año actual)."""
+    present = [e for e in epochs if e is not None]
+    now_year = datetime.now(timezone.utc).year
+    if present:
+        first = datetime.fromtimestamp(min(present), timezone.utc).year
+        last = datetime.fromtimestamp(max(present), timezone.utc).year
+    else:
+        first = last = now_year
+    # Redondea a bloques de 5 años para reutilizar la misma tabla.
+    first = min(first, now_year) // 5 * 5
+    last = max(last, now_year) // 5 * 5 + 4
+    return _cached_table(tz, first, last)
+
+
+def format_local_many(
+    tz, values: Iterable[Optional[datetime]], missing: str = "-", *, with_date: bool = True
+) -> list[str]:
+    """Formatea una columna de datetimes como ``to_local`` (o ``to_local_hms``
+    con ``with_date=False``); ``None`` -> ``missing``."""
+    epochs = epoch_seconds(values)
+    table = table_for(tz, epochs)
+    present = [e for e in epochs if e is not None]
+    formatted = iter(table.format_local(present, with_date=with_date))
+    return [next(formatted) if e is not None else missing for e in epochs]
+
+
+def local_days_many(tz, values: Iterable[Optional[datetime]]) -> list[Optional[date]]:
+    """Día local de cada datetime de la columna; ``None`` se conserva."""
+    epochs = epoch_seconds(values)
+    table = table_for(tz, epochs)
+    present = [e for e in epochs if e is not None]
+    days: dict[int, date] = {}
+    out: list[Optional[date]] = []
+    it = iter(table.day_indices(present))
+    for e in epochs:
+        if e is None:
+            out.append(None)
+            continue
+        idx = int(next(it))
+        d = days.get(idx)
+        if d is None:
+            d = days[idx] = to_date(idx)
+        out.append(d)
+    return out
+
+
+__all__ = [
+    "OffsetTable",
+    "epoch_seconds",
+    "format_local_many",
+    "local_days_many",
+    "table_for",
+    "to_date",
+]
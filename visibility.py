@@ -0,0 +1,225 @@
+"""Conjuntos de visibilidad por usuario para listados grandes.
+
+``can_view_user``/``can_edit_entries``/``can_validate_request_for`` evalúan
+las ramas de rol (y a veces consultan la BD) en cada llamada. Para vistas
+que pintan muchos usuarios se calcula una vez por usuario conectado un
+:class:`ViewerScope` con tres bitsets compactos (ver, editar, aprobar) y
+las plantillas solo prueban pertenencia.
+
+Los scopes se cachean por proceso y se invalidan con la versión de la
+estructura organizativa (``CacheVersion`` ``org``), que se incrementa al
+cambiar rol, grupo, área, supervisor o estado de cualquier usuario, y con
+la versión de accesos del invitado cuando el usuario es ``invitado``.
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import event, inspect, or_, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from guest_acl import targets_for
+from hierarchy import subordinate_ids
+from models import (
+    ORG_CACHE_VERSION,
+    Area,
+    Role,
+    User,
+    bump_cache_versions,
+    read_cache_versions,
+)
+
+# Scopes en memoria por proceso (LRU); cada uno ocupa ~3 bits por usuario.
+MAX_CACHED_SCOPES = 512
+
+# Atributos que cambian quién ve a quién.
+_ORG_ATTRS = ("role", "group_id", "area_id", "supervisor_id", "is_active")
+
+
+class UserBitset:
+    """Conjunto de ids de usuario como bitmap en un ``bytearray``."""
+
+    __slots__ = ("_bits", "_count")
+
+    def __init__(self, ids: Iterable[int] = ()):
+        ids = [i for i in ids if i is not None and i >= 0]
+        bits = bytearray((max(ids) >> 3) + 1 if ids else 0)
+        for i in ids:
+            bits[i >> 3] |= 1 << (i & 7)
+        self._bits = bits
+        self._count = sum(bin(b).count("1") for b in bits)
+
+    def __contains__(self, user_id) -> bool:
+        if user_id is None or user_id < 0:
+            return False
+        idx = user_id >> 3
+        return idx < len(self._bits) and bool(self._bits[idx] >> (user_id & 7) & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        for idx, byte in enumerate(self._bits):
+            while byte:
+                low = byte & -byte
+                yield (idx << 3) + low.bit_length() - 1
+                byte ^= low
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+@dataclass(frozen=True)
+class ViewerScope:
+    """Qué usuarios puede ver, editar y aprobar un usuario.
+
+    ``None`` en un bitset significa "todos" (admin/RRHH).
+    """
+
+    viewer_id: int
+    version: Tuple[int, ...]
+    view: Optional[UserBitset]
+    edit: Optional[UserBitset]
+    approve: Optional[UserBitset]
+
+    def can_view(self, user_id: Optional[int]) -> bool:
+        return self.view is None or user_id in self.view
+
+    def can_edit(self, user_id: Optional[int]) -> bool:
+        return self.edit is None or user_id in self.edit
+
+    def can_approve(self, user_id: Optional[int]) -> bool:
+        return self.approve is None or user_id in self.approve
+
+    def visible_ids(self) -> Optional[list]:
+        """Ids visibles para filtrar en SQL; ``None`` si no hay restricción."""
+        return None if self.view is None else list(self.view)
+
+
+_lock = threading.Lock()
+_scopes: "weakref.WeakKeyDictionary[Engine, OrderedDict]" = weakref.WeakKeyDictionary()
+
+
+def _ids(db: Session, query) -> set:
+    return set(db.execute(query).scalars())
+
+
+def _compute(db: Session, viewer: User, version: Tuple[int, ...]) -> ViewerScope:
+    """Mismas reglas que ``rbac.can_view_user``/``can_edit_entries`` y
+    ``User.can_validate_request_for``, evaluadas como conjuntos."""
+    if viewer.role in (Role.admin, Role.rrhh):
+        everyone = None if viewer.is_active else UserBitset()
+        return ViewerScope(viewer.id, version, None, None, everyone)
+
+    if viewer.role == Role.invitado:
+        # Accesos concedidos más sus subordinados directos; nunca edita.
+        visible = set(targets_for(db, viewer.id))
+        visible |= _ids(db, select(User.id).where(User.supervisor_id == viewer.id))
+        approvable = set()
+        if viewer.is_active:
+            approvable = _approvable(db, viewer)
+        return ViewerScope(
+            viewer.id, version, UserBitset(visible), UserBitset(), UserBitset(approvable)
+        )
+
+    reports = _ids(
+        db,
+        select(User.id).where(
+            or_(User.supervisor_id == viewer.id, User.id.in_(subordinate_ids(viewer.id)))
+        ),
+    )
+    visible = set(reports)
+    if viewer.role == Role.employee:
+        visible.add(viewer.id)
+    elif viewer.role == Role.responsable and viewer.group_id:
+        visible |= _ids(db, select(User.id).where(User.group_id == viewer.group_id))
+    elif viewer.role == Role.cap_area and viewer.area_id:
+        visible |= _ids(db, select(User.id).where(User.area_id == viewer.area_id))
+
+    approvable = _approvable(db, viewer, reports) if viewer.is_active else set()
+    view = UserBitset(visible)
+    return ViewerScope(viewer.id, version, view, view, UserBitset(approvable))
+
+
+def _approvable(db: Session, viewer: User, reports: Optional[set] = None) -> set:
+    if reports is None:
+        reports = _ids(
+            db,
+            select(User.id).where(
+                or_(User.supervisor_id == viewer.id, User.id.in_(subordinate_ids(viewer.id)))
+            ),
+        )
+    approvable = set(reports)
+    if viewer.role == Role.cap_area and viewer.area_id:
+        approvable |= _ids(db, select(User.id).where(User.area_id == viewer.area_id))
+    approvable |= _ids(
+        db,
+        select(User.id).where(User.area_id.in_(select(Area.id).where(Area.manager_id == viewer.id))),
+    )
+    return approvable
+
+
+def viewer_scope(db: Session, viewer: User) -> ViewerScope:
+    """Scope del usuario, recalculado solo si cambió la versión de la organización."""
+    keys = [ORG_CACHE_VERSION]
+    if viewer.role == Role.invitado:
+        keys.append(f"guest_acl:{viewer.id}")
+    versions = read_cache_versions(db, keys)
+    version = tuple(versions[k] for k in keys)
+    # El propio usuario forma parte de la clave: rol/grupo/área del objeto actual.
+    cache_key = (viewer.id, viewer.role, viewer.group_id, viewer.area_id, viewer.is_active)
+
+    bind = db.get_bind()
+    engine = getattr(bind, "engine", bind)
+    with _lock:
+        per_engine = _scopes.get(engine)
+        if per_engine is None:
+            per_engine = _scopes[engine] = OrderedDict()
+        cached = per_engine.get(cache_key)
+        if cached is not None and cached.version == version:
+            per_engine.move_to_end(cache_key)
+            return cached
+
+    scope = _compute(db, viewer, version)
+    with _lock:
+        per_engine[cache_key] = scope
+        per_engine.move_to_end(cache_key)
+        while len(per_engine) > MAX_CACHED_SCOPES:
+            per_engine.popitem(last=False)
+    return scope
+
+
+def bump_org_version(db: Session) -> None:
+    """Invalida todos los scopes (para escrituras en bloque fuera del ORM)."""
+    bump_cache_versions(db.connection(), [ORG_CACHE_VERSION])
+
+
+def _org_changed(session: Session) -> bool:
+    for obj in session.new:
+        if isinstance(obj, (User, Area)):
+            return True
+    for obj in session.deleted:
+        if isinstance(obj, (User, Area)):
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            attrs = inspect(obj).attrs
+            if any(attrs[name].history.has_changes() for name in _ORG_ATTRS):
+                return True
+        elif isinstance(obj, Area) and inspect(obj).attrs.manager_id.history.has_changes():
+            return True
+    return False
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_on_org_changes(session: Session, flush_context) -> None:
+    if _org_changed(session):
+        bump_cache_versions(session.connection(), [ORG_CACHE_VERSION])
+
+
+__all__ = ["UserBitset", "ViewerScope", "bump_org_version", "viewer_scope"]